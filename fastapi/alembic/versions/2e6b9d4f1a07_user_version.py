@@ -0,0 +1,30 @@
+"""Add users.version for token and principal cache invalidation
+
+Revision ID: 2e6b9d4f1a07
+Revises: 9a4c6e8f0b13
+Create Date: 2025-05-08 09:41:17.530284
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e6b9d4f1a07'
+down_revision: Union[str, None] = '9a4c6e8f0b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'users', sa.Column('version', sa.Integer(), server_default='1', nullable=False)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'version')
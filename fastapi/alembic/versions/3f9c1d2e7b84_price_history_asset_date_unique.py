@@ -0,0 +1,38 @@
+"""Unique (asset_id, date) on price_history for bulk upserts
+
+Revision ID: 3f9c1d2e7b84
+Revises: a5cc649156ae
+Create Date: 2025-04-02 09:12:44.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c1d2e7b84'
+down_revision: Union[str, None] = 'a5cc649156ae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Xóa các nến trùng (asset_id, date), giữ lại bản ghi mới nhất
+    op.execute(
+        """
+        DELETE FROM price_history a
+        USING price_history b
+        WHERE a.asset_id = b.asset_id AND a.date = b.date AND a.id < b.id
+        """
+    )
+    op.create_unique_constraint(
+        'uq_price_history_asset_date', 'price_history', ['asset_id', 'date']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_price_history_asset_date', 'price_history', type_='unique')
@@ -0,0 +1,33 @@
+"""Index transaction by (portfolio_id, transaction_date, id) for keyset pagination
+
+Revision ID: 4a7c9e1b3d56
+Revises: 6c3a8e2d5f94
+Create Date: 2025-05-13 09:41:27.350612
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a7c9e1b3d56'
+down_revision: Union[str, None] = '6c3a8e2d5f94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_transaction_portfolio_date',
+        'transaction',
+        ['portfolio_id', 'transaction_date', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transaction_portfolio_date', table_name='transaction')
@@ -0,0 +1,33 @@
+"""Index transaction by (portfolio_id, asset_id, transaction_date, id)
+
+Revision ID: 5b8e0f3c6a71
+Revises: c4d7e9f1a2b3
+Create Date: 2025-04-23 16:48:19.204417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e0f3c6a71'
+down_revision: Union[str, None] = 'c4d7e9f1a2b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_transaction_portfolio_asset_date',
+        'transaction',
+        ['portfolio_id', 'asset_id', 'transaction_date', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_transaction_portfolio_asset_date', table_name='transaction')
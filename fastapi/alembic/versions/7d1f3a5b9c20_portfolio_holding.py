@@ -0,0 +1,85 @@
+"""Add incrementally maintained portfolio_holding snapshot
+
+Revision ID: 7d1f3a5b9c20
+Revises: 5b8e0f3c6a71
+Create Date: 2025-04-28 10:05:37.611829
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d1f3a5b9c20'
+down_revision: Union[str, None] = '5b8e0f3c6a71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'portfolio_holding',
+        sa.Column('portfolio_id', sa.Integer(), nullable=False),
+        sa.Column('asset_id', sa.Integer(), nullable=False),
+        sa.Column('buy_quantity', sa.Numeric(precision=28, scale=8), nullable=False),
+        sa.Column('buy_cost', sa.Numeric(precision=38, scale=8), nullable=False),
+        sa.Column('sell_quantity', sa.Numeric(precision=28, scale=8), nullable=False),
+        sa.Column('sell_proceeds', sa.Numeric(precision=38, scale=8), nullable=False),
+        sa.Column(
+            'quantity',
+            sa.Numeric(precision=28, scale=8),
+            sa.Computed('buy_quantity - sell_quantity', persisted=True),
+        ),
+        sa.Column(
+            'cost_basis',
+            sa.Numeric(precision=38, scale=8),
+            sa.Computed(
+                'CASE WHEN buy_quantity > 0 '
+                'THEN (buy_quantity - sell_quantity) * buy_cost / buy_quantity ELSE 0 END',
+                persisted=True,
+            ),
+        ),
+        sa.Column(
+            'realized_pnl',
+            sa.Numeric(precision=38, scale=8),
+            sa.Computed(
+                'CASE WHEN buy_quantity > 0 '
+                'THEN sell_proceeds - sell_quantity * buy_cost / buy_quantity '
+                'ELSE sell_proceeds END',
+                persisted=True,
+            ),
+        ),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['asset_id'], ['asset.id'], ),
+        sa.ForeignKeyConstraint(['portfolio_id'], ['portfolio.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('portfolio_id', 'asset_id')
+    )
+    # Dựng ảnh chụp ban đầu từ toàn bộ giao dịch hiện có
+    op.execute(
+        """
+        INSERT INTO portfolio_holding
+            (portfolio_id, asset_id, buy_quantity, buy_cost, sell_quantity, sell_proceeds)
+        SELECT portfolio_id, asset_id,
+               COALESCE(SUM(quantity) FILTER (WHERE side = 1), 0),
+               COALESCE(SUM(round(quantity * price, 8)) FILTER (WHERE side = 1), 0),
+               COALESCE(SUM(quantity) FILTER (WHERE side = -1), 0),
+               COALESCE(SUM(round(quantity * price, 8)) FILTER (WHERE side = -1), 0)
+        FROM (
+            SELECT portfolio_id, asset_id, quantity, price,
+                   CASE WHEN lower(transaction_type) IN ('buy', 'mua') THEN 1
+                        WHEN lower(transaction_type) IN ('sell', 'bán', 'ban') THEN -1
+                        ELSE 0 END AS side
+            FROM transaction
+        ) AS tx
+        WHERE side <> 0
+        GROUP BY portfolio_id, asset_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('portfolio_holding')
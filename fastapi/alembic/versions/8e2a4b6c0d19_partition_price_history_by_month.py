@@ -0,0 +1,109 @@
+"""Partition price_history by month with (asset_id, date) primary key
+
+Revision ID: 8e2a4b6c0d19
+Revises: 3f9c1d2e7b84
+Create Date: 2025-04-09 14:31:07.552940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e2a4b6c0d19'
+down_revision: Union[str, None] = '3f9c1d2e7b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Tạo partition tháng cho toàn bộ khoảng dữ liệu cũ cùng tháng hiện tại và tháng kế tiếp
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    first_month timestamp;
+    last_month timestamp;
+    month timestamp;
+BEGIN
+    SELECT date_trunc('month', LEAST(min(date), now()::timestamp)),
+           date_trunc('month', GREATEST(max(date), now()::timestamp)) + interval '1 month'
+      INTO first_month, last_month
+      FROM price_history_legacy;
+    month := first_month;
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF price_history FOR VALUES FROM (%L) TO (%L)',
+            'price_history_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+            month,
+            month + interval '1 month'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END $$;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Đổi tên bảng cũ và giải phóng tên các index/constraint để tạo bảng mới
+    op.rename_table('price_history', 'price_history_legacy')
+    op.drop_index('ix_price_history_asset_id', table_name='price_history_legacy')
+    op.drop_index('ix_price_history_id', table_name='price_history_legacy')
+    op.drop_constraint('uq_price_history_asset_date', 'price_history_legacy', type_='unique')
+    op.execute('ALTER TABLE price_history_legacy RENAME CONSTRAINT price_history_pkey TO price_history_legacy_pkey')
+
+    op.create_table('price_history',
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('open_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('close_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('high_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('low_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('volume', sa.Numeric(precision=28, scale=8), nullable=True),
+    sa.ForeignKeyConstraint(['asset_id'], ['asset.id'], name='price_history_asset_id_fkey'),
+    sa.PrimaryKeyConstraint('asset_id', 'date', name='price_history_pkey'),
+    postgresql_partition_by='RANGE (date)'
+    )
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+
+    # Chuyển dữ liệu sang bảng phân vùng (dữ liệu đã được khử trùng lặp ở revision trước)
+    op.execute(
+        """
+        INSERT INTO price_history (asset_id, date, open_price, close_price, high_price, low_price)
+        SELECT asset_id, date, open_price, close_price, high_price, low_price
+        FROM price_history_legacy
+        ON CONFLICT (asset_id, date) DO NOTHING
+        """
+    )
+    op.drop_table('price_history_legacy')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.rename_table('price_history', 'price_history_partitioned')
+    op.execute('ALTER TABLE price_history_partitioned RENAME CONSTRAINT price_history_pkey TO price_history_partitioned_pkey')
+    op.create_table('price_history',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('open_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('close_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('high_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('low_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.ForeignKeyConstraint(['asset_id'], ['asset.id'], name='price_history_asset_id_fkey'),
+    sa.PrimaryKeyConstraint('id', name='price_history_pkey'),
+    sa.UniqueConstraint('asset_id', 'date', name='uq_price_history_asset_date')
+    )
+    op.create_index('ix_price_history_id', 'price_history', ['id'], unique=False)
+    op.create_index('ix_price_history_asset_id', 'price_history', ['asset_id'], unique=False)
+    op.execute(
+        """
+        INSERT INTO price_history (asset_id, date, open_price, close_price, high_price, low_price)
+        SELECT asset_id, date, open_price, close_price, high_price, low_price
+        FROM price_history_partitioned
+        ORDER BY asset_id, date
+        """
+    )
+    # Xóa bảng cha sẽ xóa luôn các partition
+    op.drop_table('price_history_partitioned')
@@ -0,0 +1,32 @@
+"""Add transaction.external_id with unique (portfolio_id, external_id)
+
+Revision ID: 9a4c6e8f0b13
+Revises: 7d1f3a5b9c20
+Create Date: 2025-05-06 14:22:51.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4c6e8f0b13'
+down_revision: Union[str, None] = '7d1f3a5b9c20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('transaction', sa.Column('external_id', sa.String(length=100), nullable=True))
+    op.create_unique_constraint(
+        'uq_transaction_portfolio_external_id', 'transaction', ['portfolio_id', 'external_id']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_transaction_portfolio_external_id', 'transaction', type_='unique')
+    op.drop_column('transaction', 'external_id')
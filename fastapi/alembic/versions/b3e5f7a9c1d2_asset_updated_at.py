@@ -0,0 +1,36 @@
+"""Add asset.updated_at and asset.prices_updated_at
+
+Revision ID: b3e5f7a9c1d2
+Revises: 4a7c9e1b3d56
+Create Date: 2025-05-20 15:22:08.731946
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e5f7a9c1d2'
+down_revision: Union[str, None] = '4a7c9e1b3d56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'asset',
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    )
+    op.add_column(
+        'asset',
+        sa.Column('prices_updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('asset', 'prices_updated_at')
+    op.drop_column('asset', 'updated_at')
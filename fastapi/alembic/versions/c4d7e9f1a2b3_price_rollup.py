@@ -0,0 +1,71 @@
+"""Add price_rollup table with hourly/daily/weekly candles
+
+Revision ID: c4d7e9f1a2b3
+Revises: 8e2a4b6c0d19
+Create Date: 2025-04-16 10:05:52.771042
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d7e9f1a2b3'
+down_revision: Union[str, None] = '8e2a4b6c0d19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Gộp từ nguồn (nến thô hoặc rollup mức dưới) sang một độ phân giải
+POPULATE_ROLLUP = """
+INSERT INTO price_rollup (asset_id, resolution, bucket, open_price, close_price,
+                          high_price, low_price, volume, candle_count)
+SELECT asset_id,
+       '{resolution}',
+       date_bin(interval '{seconds} seconds', {time_column}, timestamp '2000-01-03') AS bucket,
+       (array_agg(open_price ORDER BY {time_column}) FILTER (WHERE open_price IS NOT NULL))[1],
+       (array_agg(close_price ORDER BY {time_column} DESC) FILTER (WHERE close_price IS NOT NULL))[1],
+       max(high_price),
+       min(low_price),
+       sum(volume),
+       {candle_count}
+FROM {source}
+GROUP BY asset_id, 3  -- theo vị trí: tên "bucket" trùng cột nguồn của rollup
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('price_rollup',
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.Column('resolution', sa.String(length=3), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('open_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('close_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('high_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('low_price', sa.Numeric(precision=18, scale=8), nullable=True),
+    sa.Column('volume', sa.Numeric(precision=28, scale=8), nullable=True),
+    sa.Column('candle_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['asset.id'], ),
+    sa.PrimaryKeyConstraint('asset_id', 'resolution', 'bucket')
+    )
+    # Dựng rollup cho dữ liệu hiện có: giờ từ nến thô, ngày từ giờ, tuần từ ngày
+    op.execute(POPULATE_ROLLUP.format(
+        resolution='1h', seconds=3600, time_column='date',
+        candle_count='count(*)', source='price_history',
+    ))
+    op.execute(POPULATE_ROLLUP.format(
+        resolution='1d', seconds=86400, time_column='bucket',
+        candle_count='sum(candle_count)', source="price_rollup WHERE resolution = '1h'",
+    ))
+    op.execute(POPULATE_ROLLUP.format(
+        resolution='1w', seconds=604800, time_column='bucket',
+        candle_count='sum(candle_count)', source="price_rollup WHERE resolution = '1d'",
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('price_rollup')
@@ -0,0 +1,36 @@
+"""Add portfolio.updated_at and users.updated_at
+
+Revision ID: d6f8a0b2c4e5
+Revises: b3e5f7a9c1d2
+Create Date: 2025-05-21 09:14:37.502118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6f8a0b2c4e5'
+down_revision: Union[str, None] = 'b3e5f7a9c1d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'portfolio',
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    )
+    op.add_column(
+        'users',
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'updated_at')
+    op.drop_column('portfolio', 'updated_at')
@@ -0,0 +1,97 @@
+"""Store moving-average cost in portfolio_holding instead of generated period-average columns
+
+Revision ID: e7a9b1c3d5f8
+Revises: d6f8a0b2c4e5
+Create Date: 2025-05-22 10:03:11.284519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app import holdings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a9b1c3d5f8'
+down_revision: Union[str, None] = 'd6f8a0b2c4e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Giá vốn bình quân di động phụ thuộc thứ tự giao dịch, không tính được từ các tổng mua/bán
+    op.execute('DELETE FROM portfolio_holding')
+    for name in ('quantity', 'cost_basis', 'realized_pnl', 'buy_quantity', 'buy_cost', 'sell_quantity', 'sell_proceeds'):
+        op.drop_column('portfolio_holding', name)
+    op.add_column('portfolio_holding', sa.Column('quantity', sa.Numeric(precision=28, scale=8), nullable=False))
+    op.add_column('portfolio_holding', sa.Column('cost_basis', sa.Numeric(precision=38, scale=8), nullable=False))
+    op.add_column('portfolio_holding', sa.Column('realized_pnl', sa.Numeric(precision=38, scale=8), nullable=False))
+    op.add_column('portfolio_holding', sa.Column('last_transaction_date', sa.DateTime(), nullable=True))
+    op.add_column('portfolio_holding', sa.Column('last_transaction_id', sa.Integer(), nullable=False))
+    # Dựng lại ảnh chụp bằng cách phát lại toàn bộ giao dịch
+    holdings.rebuild(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DELETE FROM portfolio_holding')
+    for name in ('last_transaction_id', 'last_transaction_date', 'realized_pnl', 'cost_basis', 'quantity'):
+        op.drop_column('portfolio_holding', name)
+    for name, precision in (('buy_quantity', 28), ('buy_cost', 38), ('sell_quantity', 28), ('sell_proceeds', 38)):
+        op.add_column('portfolio_holding', sa.Column(name, sa.Numeric(precision=precision, scale=8), nullable=False))
+    op.add_column(
+        'portfolio_holding',
+        sa.Column(
+            'quantity',
+            sa.Numeric(precision=28, scale=8),
+            sa.Computed('buy_quantity - sell_quantity', persisted=True),
+        ),
+    )
+    op.add_column(
+        'portfolio_holding',
+        sa.Column(
+            'cost_basis',
+            sa.Numeric(precision=38, scale=8),
+            sa.Computed(
+                'CASE WHEN buy_quantity > 0 '
+                'THEN (buy_quantity - sell_quantity) * buy_cost / buy_quantity ELSE 0 END',
+                persisted=True,
+            ),
+        ),
+    )
+    op.add_column(
+        'portfolio_holding',
+        sa.Column(
+            'realized_pnl',
+            sa.Numeric(precision=38, scale=8),
+            sa.Computed(
+                'CASE WHEN buy_quantity > 0 '
+                'THEN sell_proceeds - sell_quantity * buy_cost / buy_quantity '
+                'ELSE sell_proceeds END',
+                persisted=True,
+            ),
+        ),
+    )
+    op.execute(
+        """
+        INSERT INTO portfolio_holding
+            (portfolio_id, asset_id, buy_quantity, buy_cost, sell_quantity, sell_proceeds)
+        SELECT portfolio_id, asset_id,
+               COALESCE(SUM(quantity) FILTER (WHERE side = 1), 0),
+               COALESCE(SUM(round(quantity * price, 8)) FILTER (WHERE side = 1), 0),
+               COALESCE(SUM(quantity) FILTER (WHERE side = -1), 0),
+               COALESCE(SUM(round(quantity * price, 8)) FILTER (WHERE side = -1), 0)
+        FROM (
+            SELECT portfolio_id, asset_id, quantity, price,
+                   CASE WHEN lower(transaction_type) IN ('buy', 'mua') THEN 1
+                        WHEN lower(transaction_type) IN ('sell', 'bán', 'ban') THEN -1
+                        ELSE 0 END AS side
+            FROM transaction
+        ) AS tx
+        WHERE side <> 0
+        GROUP BY portfolio_id, asset_id
+        """
+    )
@@ -0,0 +1,307 @@
+# app/analytics.py
+"""Chỉ số rủi ro và hiệu suất cho các asset của một danh mục.
+
+Giá đóng cửa của mọi asset được đọc bằng một truy vấn từ price_rollup, căn thành ma trận
+(asset x khung) rồi tính toàn bộ bằng NumPy: lợi suất, độ biến động (kể cả cuốn chiếu),
+Sharpe/Sortino, drawdown tối đa, beta và ma trận tương quan. Tương quan/hiệp phương sai
+dùng các cặp quan sát cùng có dữ liệu (pairwise-complete) và được tính bằng nhân ma trận.
+
+Kết quả được cache theo (tập asset, cửa sổ, thời điểm nến cuối cùng) nên các lần gọi lặp
+lại không cần tính lại cho tới khi có nến mới; TTL giới hạn độ trễ khi chỉ sửa nến cũ.
+"""
+import warnings
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import Float, cast, func, select, true
+from sqlalchemy.orm import Session
+
+from app import cache, config, crud, equity, model, rollups, timeseries
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60  # Thị trường crypto giao dịch liên tục
+
+_results = cache.LRUCache(maxsize=config.ANALYTICS_CACHE_SIZE, ttl=config.ANALYTICS_CACHE_TTL)
+
+
+def periods_per_year(interval: str) -> float:
+    return SECONDS_PER_YEAR / timeseries.INTERVALS[interval]
+
+
+def simple_returns(prices):
+    """Lợi suất từng khung (asset x (khung - 1)); NaN khi thiếu giá ở một trong hai đầu."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return prices[:, 1:] / prices[:, :-1] - 1.0
+
+
+def pairwise_covariance(returns):
+    """Hiệp phương sai và số quan sát chung của từng cặp hàng, bỏ qua NaN theo cặp.
+
+    Dùng các tổng chéo X·Mᵀ, X·Xᵀ (X = lợi suất với NaN thay bằng 0, M = mặt nạ có dữ liệu)
+    thay vì lặp qua N² cặp. Trả về (cov, var_i theo cặp, var_j theo cặp, count).
+    """
+    mask = (~np.isnan(returns)).astype(float)
+    values = np.where(mask > 0, returns, 0.0)
+    count = mask @ mask.T
+    sum_i = values @ mask.T  # tổng x_i trên các khung mà cả i và j đều có dữ liệu
+    sum_j = sum_i.T
+    sum_squares_i = (values**2) @ mask.T
+    sum_squares_j = sum_squares_i.T
+    sum_products = values @ values.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = np.where(count > 1, count - 1, np.nan)
+        covariance = (sum_products - sum_i * sum_j / count) / denominator
+        variance_i = (sum_squares_i - sum_i**2 / count) / denominator
+        variance_j = (sum_squares_j - sum_j**2 / count) / denominator
+    return covariance, variance_i, variance_j, count
+
+
+def correlation_matrix(returns):
+    covariance, variance_i, variance_j, _ = pairwise_covariance(returns)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = covariance / np.sqrt(variance_i * variance_j)
+    return np.clip(correlation, -1.0, 1.0)
+
+
+def rolling_std(returns, window: int):
+    """Độ lệch chuẩn cuốn chiếu `window` khung cho từng hàng, bỏ qua NaN trong cửa sổ.
+
+    Kết quả có cùng số cột với `returns`; các cột chưa đủ cửa sổ là NaN.
+    """
+    valid = ~np.isnan(returns)
+    values = np.where(valid, returns, 0.0)
+    pad = np.zeros((returns.shape[0], 1))
+    total = np.concatenate((pad, np.cumsum(values, axis=1)), axis=1)
+    total_squares = np.concatenate((pad, np.cumsum(values**2, axis=1)), axis=1)
+    count = np.concatenate((pad, np.cumsum(valid, axis=1)), axis=1)
+
+    result = np.full(returns.shape, np.nan)
+    if returns.shape[1] < window:
+        return result
+    n = count[:, window:] - count[:, :-window]
+    s = total[:, window:] - total[:, :-window]
+    s2 = total_squares[:, window:] - total_squares[:, :-window]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = np.where(n > 1, (s2 - s * s / n) / (n - 1), np.nan)
+    result[:, window - 1 :] = np.sqrt(np.maximum(variance, 0.0))
+    return result
+
+
+def max_drawdown(prices):
+    """Mức sụt giảm lớn nhất từ đỉnh của từng hàng (số âm), bỏ qua NaN."""
+    peaks = np.fmax.accumulate(prices, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = np.nan_to_num(prices / peaks - 1.0, nan=0.0)
+    return drawdown.min(axis=1, initial=0.0)
+
+
+def risk_metrics(returns, prices, window: int, interval: str, risk_free_rate: float = 0.0):
+    """Các chỉ số theo từng hàng (asset hoặc danh mục), đã quy đổi theo năm."""
+    scale = periods_per_year(interval)
+    risk_free = risk_free_rate / scale
+    # Hàng không có dữ liệu cho ra NaN (trả về null), không cần cảnh báo "empty slice"
+    with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(returns, axis=1)
+        std = np.nanstd(returns, axis=1, ddof=1)
+        excess = returns - risk_free
+        downside = np.sqrt(np.nanmean(np.minimum(excess, 0.0) ** 2, axis=1))
+        sharpe = (mean - risk_free) / std * np.sqrt(scale)
+        sortino = (mean - risk_free) / downside * np.sqrt(scale)
+    rolling = rolling_std(returns, window) * np.sqrt(scale)
+    return {
+        "annualized_return": mean * scale,
+        "volatility": std * np.sqrt(scale),
+        "rolling_volatility": rolling[:, -1] if rolling.shape[1] else np.full(len(mean), np.nan),
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "max_drawdown": max_drawdown(prices),
+    }, rolling
+
+
+def betas(returns, benchmark):
+    """Beta của từng hàng so với chuỗi lợi suất `benchmark`, theo cặp quan sát chung."""
+    stacked = np.vstack((returns, benchmark[None, :]))
+    covariance, _, variance_benchmark, _ = pairwise_covariance(stacked)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return covariance[:-1, -1] / variance_benchmark[:-1, -1]
+
+
+def _finite(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _finite_list(values):
+    return [_finite(value) for value in values]
+
+
+def load_prices(db: Session, asset_ids, grid, interval: str):
+    """Ma trận giá đóng cửa (asset x khung) từ price_rollup bằng một truy vấn duy nhất."""
+    table = model.PriceRollup.__table__
+    prices = np.full((len(asset_ids), len(grid)), np.nan)
+    if not asset_ids:
+        return prices
+    stride = timedelta(seconds=timeseries.INTERVALS[interval])
+    rows = db.execute(
+        select(table.c.asset_id, table.c.bucket, cast(table.c.close_price, Float))
+        .where(
+            table.c.asset_id.in_(asset_ids),
+            table.c.resolution == interval,
+            table.c.bucket >= grid[0].astype(datetime),
+            table.c.bucket < grid[-1].astype(datetime) + stride,
+            table.c.close_price.isnot(None),
+        )
+    ).all()
+    if rows:
+        row_index = {asset_id: index for index, asset_id in enumerate(asset_ids)}
+        asset_column, buckets, closes = zip(*rows)
+        prices[
+            [row_index[asset_id] for asset_id in asset_column],
+            equity.bucket_index(grid, np.array(buckets, dtype="datetime64[s]")),
+        ] = closes
+    return prices
+
+
+def last_candle(db: Session, asset_ids):
+    """Thời điểm nến thô mới nhất của các asset (mỗi asset một lần dò index ngược)."""
+    table = model.PriceHistory.__table__
+    asset = model.Asset.__table__
+    latest = (
+        select(table.c.date)
+        .where(table.c.asset_id == asset.c.id)
+        .order_by(table.c.date.desc())
+        .limit(1)
+        .lateral("latest")
+    )
+    return db.execute(
+        select(func.max(latest.c.date))
+        .select_from(asset.join(latest, true()))
+        .where(asset.c.id.in_(asset_ids))
+    ).scalar()
+
+
+def portfolio_analytics(
+    db: Session,
+    portfolio_id: int,
+    start: datetime = None,
+    end: datetime = None,
+    interval: str = "1d",
+    window: int = 30,
+    benchmark_asset_id: int = None,
+) -> dict:
+    """Chỉ số rủi ro/hiệu suất của từng asset trong danh mục và của cả danh mục.
+
+    Danh mục được xem như một rổ asset với tỷ trọng theo giá trị thị trường hiện tại
+    (lấy từ portfolio_holding). Beta so với `benchmark_asset_id`, hoặc so với chính
+    danh mục khi không chỉ định.
+    """
+    if interval not in rollups.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported interval: {interval}")
+    start, end = crud.naive_utc(start), crud.naive_utc(end)
+    if end is None:
+        end = datetime.now(timezone.utc).replace(tzinfo=None)
+    if start is None:
+        start = end - timedelta(days=config.ANALYTICS_DEFAULT_LOOKBACK_DAYS)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    holding = model.PortfolioHolding.__table__
+    asset = model.Asset.__table__
+    positions = [tuple(row) for row in db.execute(
+        select(holding.c.asset_id, asset.c.symbol, cast(holding.c.quantity, Float))
+        .join(asset, asset.c.id == holding.c.asset_id)
+        .where(holding.c.portfolio_id == portfolio_id)
+        .order_by(asset.c.symbol)
+    )]
+    asset_ids = [row[0] for row in positions]
+    if benchmark_asset_id is not None:
+        if db.get(model.Asset, benchmark_asset_id) is None:
+            raise HTTPException(status_code=404, detail="Benchmark asset not found")
+    series_ids = asset_ids + ([benchmark_asset_id] if benchmark_asset_id is not None else [])
+
+    key = (
+        tuple(positions),  # tập asset và khối lượng (quyết định tỷ trọng)
+        benchmark_asset_id,
+        interval,
+        window,
+        timeseries.bucket_floor(start, interval),
+        timeseries.bucket_floor(end, interval),
+        last_candle(db, series_ids) if series_ids else None,
+    )
+    result = _results.get(key)
+    if result is None:
+        result = _compute(db, positions, series_ids, benchmark_asset_id, start, end, interval, window)
+        _results.set(key, result)
+    return {"portfolio_id": portfolio_id, **result}
+
+
+def _compute(db, positions, series_ids, benchmark_asset_id, start, end, interval, window):
+    grid = equity.bucket_grid(start, end, interval)
+    # Benchmark có thể trùng một asset trong danh mục: nạp mỗi asset một lần rồi ánh xạ lại
+    unique_ids = list(dict.fromkeys(series_ids))
+    loaded = equity.forward_fill(load_prices(db, unique_ids, grid, interval))
+    prices = loaded[[unique_ids.index(asset_id) for asset_id in series_ids]].reshape(
+        len(series_ids), len(grid)
+    )
+    n_assets = len(positions)
+    asset_prices = prices[:n_assets]
+    returns = simple_returns(asset_prices)
+
+    # Tỷ trọng theo giá trị thị trường tại giá gần nhất trong khoảng (chỉ vị thế dương)
+    quantity = np.array([max(row[2], 0.0) for row in positions])
+    latest = asset_prices[:, -1] if n_assets else np.zeros(0)
+    value = np.nan_to_num(quantity * latest)
+    weights = value / value.sum() if value.sum() > 0 else np.full(n_assets, 1.0 / max(n_assets, 1))
+
+    # Lợi suất rổ: chỉ tính các asset đã có giá ở khung đó, tỷ trọng chuẩn hóa lại
+    available = ~np.isnan(returns)
+    weight_matrix = np.where(available, weights[:, None], 0.0)
+    weight_total = weight_matrix.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        portfolio_returns = np.where(
+            weight_total > 0,
+            np.nansum(np.where(available, returns, 0.0) * weight_matrix, axis=0) / weight_total,
+            np.nan,
+        )
+    portfolio_index = np.concatenate(([1.0], np.cumprod(1.0 + np.nan_to_num(portfolio_returns))))
+
+    rate = config.ANALYTICS_RISK_FREE_RATE
+    asset_metrics, _ = risk_metrics(returns, asset_prices, window, interval, rate)
+    portfolio_metrics, portfolio_rolling = risk_metrics(
+        portfolio_returns[None, :], portfolio_index[None, :], window, interval, rate
+    )
+    if benchmark_asset_id is not None:
+        benchmark = simple_returns(prices[-1:])[0]
+    else:
+        benchmark = portfolio_returns
+    asset_metrics["beta"] = betas(returns, benchmark) if n_assets else np.zeros(0)
+    portfolio_metrics["beta"] = betas(portfolio_returns[None, :], benchmark)
+
+    dates = grid.astype(datetime).tolist()
+    return {
+        "interval": interval,
+        "window": window,
+        "start": dates[0],
+        "end": dates[-1],
+        "periods": len(dates),
+        "benchmark_asset_id": benchmark_asset_id,
+        "assets": [
+            {
+                "asset_id": asset_id,
+                "symbol": symbol,
+                "weight": float(weights[index]),
+                **{name: _finite(values[index]) for name, values in asset_metrics.items()},
+            }
+            for index, (asset_id, symbol, _) in enumerate(positions)
+        ],
+        "portfolio": {name: _finite(values[0]) for name, values in portfolio_metrics.items()},
+        "rolling_volatility": [
+            {"date": date, "value": value}
+            for date, value in zip(dates[1:], _finite_list(portfolio_rolling[0]))
+        ],
+        "correlation": {
+            "asset_ids": [row[0] for row in positions],
+            "matrix": [_finite_list(row) for row in correlation_matrix(returns)],
+        },
+    }
@@ -1,20 +1,76 @@
 # app/auth.py
+import math
+from dataclasses import asdict, dataclass
+import uuid
 from datetime import datetime, timedelta, timezone
 
 import jwt  # PyJWT library
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
-from app import config, model, database
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import cache, config, database, hashing, model, throttle, tokens
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = hashing.pwd_context
 # Schema OAuth2PasswordBearer để lấy token từ Header Authorization
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
 
+@dataclass(frozen=True)
+class Principal:
+    """Ảnh chụp người dùng đã xác thực, giữ trong cache thay cho đối tượng ORM.
+
+    Endpoint cần sửa tài khoản phải tự nạp model.User theo `id`.
+    """
+
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    version: int
+
+    @classmethod
+    def from_user(cls, user: model.User) -> "Principal":
+        return cls(user.id, user.username, user.email, bool(user.is_active), user.version)
+
+
+# Khóa cache: (username, version trong token). Cache trong tiến trình luôn bật; Redis (nếu cấu hình)
+# cho phép worker khác dùng lại kết quả. invalidate_principal chỉ xóa được bản sao trong tiến trình
+# của worker đang chạy nó: worker khác còn tin principal cũ tới khi bản sao của nó hết hạn, sau tối
+# đa PRINCIPAL_LOCAL_CACHE_TTL giây khi có Redis, PRINCIPAL_CACHE_TTL giây khi không có
+_principals = cache.LRUCache(config.PRINCIPAL_CACHE_SIZE, config.PRINCIPAL_CACHE_TTL)
+_shared_principals = (
+    cache.RedisCache(config.CACHE_REDIS_URL, config.PRINCIPAL_CACHE_TTL, prefix="cryptonav:principal:")
+    if config.CACHE_REDIS_URL
+    else None
+)
+
+
+def _shared_key(username: str, version: int) -> str:
+    return f"{username}:{version}"
+
+
+def _local_ttl():
+    # Có Redis: bản sao trong tiến trình chỉ sống ngắn, sau đó đọc lại từ Redis (đã bị xóa nếu invalidate)
+    return config.PRINCIPAL_LOCAL_CACHE_TTL if _shared_principals is not None else None
+
+
+async def _cache_principal(principal: Principal, version: int):
+    _principals.set((principal.username, version), principal, _local_ttl())
+    if _shared_principals is not None:
+        await _shared_principals.set(_shared_key(principal.username, version), asdict(principal))
+
+
+async def invalidate_principal(username: str, version: int):
+    """Xóa principal khỏi cache sau khi tài khoản thay đổi (đổi email/mật khẩu, xóa tài khoản)."""
+    _principals.pop((username, version))
+    if _shared_principals is not None:
+        await _shared_principals.delete(_shared_key(username, version))
+
+
 def create_access_token(data: dict, expires_delta: int = None):
-    """Tạo JWT token từ thông tin người dùng."""
+    """Tạo JWT token từ thông tin người dùng (`sub` là username, `ver` là users.version)."""
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + timedelta(minutes=expires_delta)
@@ -22,7 +78,8 @@ def create_access_token(data: dict, expires_delta: int = None):
         expire = datetime.now(timezone.utc) + timedelta(
             minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES
         )
-    to_encode.update({"exp": expire})
+    # jti cho phép thu hồi riêng từng token (đăng xuất) trước khi hết hạn
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     # Sinh token JWT
     encoded_jwt = jwt.encode(
         to_encode, config.JWT_SECRET_KEY, algorithm=config.JWT_ALGORITHM
@@ -30,21 +87,63 @@ def create_access_token(data: dict, expires_delta: int = None):
     return encoded_jwt
 
 
+def token_claims(token: str) -> dict:
+    """Giải mã access token đã được get_current_user xác thực."""
+    return jwt.decode(token, config.JWT_SECRET_KEY, algorithms=[config.JWT_ALGORITHM])
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Kiểm tra mật khẩu plaintext với mật khẩu đã băm."""
+    """Kiểm tra mật khẩu plaintext với mật khẩu đã băm (đồng bộ; endpoint dùng hashing.verify_password_async)."""
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Băm mật khẩu (hash password) để lưu vào DB."""
+    """Băm mật khẩu (hash password) để lưu vào DB (đồng bộ; endpoint dùng hashing.hash_password_async)."""
     return pwd_context.hash(password)
 
 
-def get_current_user(
-    db: database.SessionLocal = Depends(database.get_db),
+# Giới hạn số lần thử theo IP (mọi lần đăng nhập/đăng ký) và số lần sai mật khẩu theo username
+_attempts_per_ip = throttle.SlidingWindowLimiter(
+    config.LOGIN_MAX_ATTEMPTS_PER_IP, config.LOGIN_THROTTLE_WINDOW
+)
+_failures_per_user = throttle.SlidingWindowLimiter(
+    config.LOGIN_MAX_FAILURES_PER_USER, config.LOGIN_THROTTLE_WINDOW
+)
+
+
+def client_ip(request: Request) -> str:
+    # Sau reverse proxy cần chạy uvicorn với --proxy-headers để lấy IP thật từ X-Forwarded-For
+    return request.client.host if request.client else "unknown"
+
+
+def check_login_throttle(request: Request, username: str = None):
+    """Ghi nhận một lần thử từ IP của request; trả 429 nếu IP hoặc username đã vượt giới hạn."""
+    ip = client_ip(request)
+    wait = _attempts_per_ip.retry_after(ip)
+    if username is not None:
+        wait = max(wait, _failures_per_user.retry_after(username))
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, please retry later",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+    _attempts_per_ip.hit(ip)
+
+
+def record_login_failure(username: str):
+    _failures_per_user.hit(username)
+
+
+def reset_login_failures(username: str):
+    _failures_per_user.reset(username)
+
+
+async def get_current_user(
+    db: AsyncSession = Depends(database.get_async_db),
     token: str = Depends(oauth2_scheme),
-):
-    """Dependency: Lấy đối tượng User hiện tại dựa trên JWT token."""
+) -> Principal:
+    """Dependency: Lấy Principal hiện tại dựa trên JWT token, ưu tiên đọc từ cache."""
     credentials_exception = HTTPException(
         status_code=401, detail="Could not validate credentials"
     )
@@ -55,13 +154,32 @@ def get_current_user(
         username: str = payload.get(
             "sub"
         )  # 'sub' sẽ chứa định danh người dùng (vd: username)
-        if username is None:
+        version = payload.get("ver")
+        # Token cấp trước khi có users.version không mang `ver`: không kiểm tra được, từ chối
+        if username is None or version is None:
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
+    if tokens.is_revoked(payload.get("jti")):
+        raise credentials_exception
+
+    principal = _principals.get((username, version))
+    if principal is not None:
+        return principal
+    if _shared_principals is not None:
+        data = await _shared_principals.get(_shared_key(username, version))
+        if data is not None:
+            principal = Principal(**data)
+            _principals.set((username, version), principal, _local_ttl())
+            return principal
 
-    # Lấy người dùng từ DB
-    user = db.query(model.User).filter(model.User.username == username).first()
-    if user is None:
+    # Cache miss: lấy người dùng từ DB
+    result = await db.execute(select(model.User).where(model.User.username == username))
+    user = result.scalars().first()
+    if user is None or user.version != version:
         raise credentials_exception
-    return user
+    # Trả kết nối về pool ngay; endpoint cần DB sẽ lấy lại kết nối khi truy vấn tiếp
+    await db.commit()
+    principal = Principal.from_user(user)
+    await _cache_principal(principal, version)
+    return principal
@@ -0,0 +1,117 @@
+# app/cache.py
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis là phụ thuộc tùy chọn, chỉ cần khi cấu hình CACHE_REDIS_URL
+    aioredis = None
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Cache trong bộ nhớ tiến trình: giới hạn số phần tử (LRU) và thời gian sống (TTL).
+
+    An toàn khi dùng từ nhiều thread (các endpoint sync chạy trong threadpool).
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        # ttl riêng cho phần tử này; 0 nghĩa là không hết hạn (chỉ bị loại theo LRU)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Cache dùng chung giữa các worker/instance (Redis), giá trị lưu dạng JSON.
+
+    Lỗi kết nối Redis không làm hỏng request: get trả về default, set/delete bỏ qua.
+    """
+
+    def __init__(self, url: str, ttl: float = None, prefix: str = "cryptonav:"):
+        if aioredis is None:
+            raise RuntimeError("CACHE_REDIS_URL requires the 'redis' package (pip install redis)")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = aioredis.from_url(url)
+
+    async def get(self, key: str, default=None):
+        try:
+            raw = await self._client.get(self.prefix + key)
+        except aioredis.RedisError:
+            return default
+        return default if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            await self._client.set(self.prefix + key, json.dumps(value), ex=int(ttl) if ttl else None)
+        except aioredis.RedisError:
+            pass
+
+    async def delete(self, *keys: str):
+        if not keys:
+            return
+        try:
+            await self._client.delete(*(self.prefix + key for key in keys))
+        except aioredis.RedisError:
+            pass
+
+
+class MemoryCache:
+    """Thay thế RedisCache trong tiến trình (cùng giao diện async, giá trị đi qua JSON như Redis).
+
+    Dùng cho test hoặc khi chạy một worker: nhiều đối tượng dùng chung một MemoryCache
+    mô phỏng nhiều worker dùng chung một Redis.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = None):
+        self._data = LRUCache(maxsize, ttl)
+
+    async def get(self, key: str, default=None):
+        raw = self._data.get(key)
+        return default if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value, ttl: float = None):
+        self._data.set(key, json.dumps(value), ttl)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key)
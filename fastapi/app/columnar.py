@@ -0,0 +1,138 @@
+# app/columnar.py
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow có trong requirements.txt; thiếu thì chỉ định dạng Arrow/Parquet trả 406
+    pa = pq = None
+
+from app import streaming
+
+# Định dạng cột cho notebook phân tích, chọn qua header Accept; không yêu cầu thì vẫn trả JSON.
+# Batch Arrow dựng thẳng từ các dòng kết quả DB (chuyển vị theo cột), không tạo object Pydantic.
+MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+_ACCEPT_FORMATS = {
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/json": None,
+    "application/*": None,
+    "*/*": None,
+}
+
+
+def negotiate(accept: str = None):
+    """Chọn định dạng theo header Accept (xét trọng số q): "arrow", "parquet" hoặc None (JSON).
+
+    Yêu cầu định dạng cột khi chưa cài pyarrow trả về 406.
+    """
+    best, best_q = None, 0.0
+    for part in (accept or "").split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        if media_type.lower() not in _ACCEPT_FORMATS:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = _ACCEPT_FORMATS[media_type.lower()], q
+    if best is not None and pa is None:
+        raise HTTPException(
+            status_code=406, detail="Arrow/Parquet output requires the 'pyarrow' package on the server"
+        )
+    return best
+
+
+def price_history_schema(columns):
+    """Schema Arrow cho các cột lịch sử giá: giá và khối lượng là float64."""
+    types = {"asset_id": pa.int32(), "date": pa.timestamp("us")}
+    return pa.schema([(column, types.get(column, pa.float64())) for column in columns])
+
+
+def _array(values, arrow_type):
+    if pa.types.is_floating(arrow_type):
+        # Numeric từ DB là Decimal; để pyarrow tự suy ra decimal128 chậm hơn nhiều so với float()
+        values = [None if value is None else float(value) for value in values]
+    return pa.array(values, type=arrow_type)
+
+
+def record_batch(rows, schema):
+    """Dựng RecordBatch từ các dòng (tuple) theo thứ tự cột của `schema`."""
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    return pa.record_batch(
+        [_array(values, field.type) for values, field in zip(columns, schema)], schema=schema
+    )
+
+
+class _Sink:
+    """File-like nhận bytes từ writer của pyarrow; phần đã ghi được lấy ra sau mỗi batch."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _writer(sink, schema, format: str):
+    if format == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    return pq.ParquetWriter(sink, schema)
+
+
+async def batch_stream(rows, schema, format: str, chunk_rows: int):
+    """Ghi `rows` thành các batch Arrow IPC (hoặc row group Parquet), trả ra ngay sau mỗi batch."""
+    sink = _Sink()
+    writer = _writer(sink, schema, format)
+    async for batch in streaming.batched(rows, chunk_rows):
+        writer.write_batch(record_batch(batch, schema))
+        data = sink.take()
+        if data:
+            yield data
+    writer.close()
+    yield sink.take()
+
+
+def rows_response(rows, schema, format: str, chunk_rows: int, headers: dict = None):
+    """StreamingResponse Arrow/Parquet cho các dòng đọc từ DB (iterable thường hoặc async)."""
+    return StreamingResponse(
+        batch_stream(rows, schema, format, chunk_rows),
+        media_type=MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+
+def table_response(columns: dict, format: str, metadata: dict = None, headers: dict = None):
+    """Response Arrow/Parquet cho dữ liệu đã có sẵn theo cột (mảng numpy, danh sách)."""
+    table = pa.table(columns, metadata={key: str(value) for key, value in (metadata or {}).items()})
+    sink = _Sink()
+    writer = _writer(sink, table.schema, format)
+    writer.write_table(table)
+    writer.close()
+    return Response(content=sink.take(), media_type=MEDIA_TYPES[format], headers=headers)
@@ -0,0 +1,105 @@
+# app/conditional.py
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app import config
+
+# Validator HTTP (ETag, Last-Modified) và chính sách Cache-Control theo route.
+# ETag được tính từ mốc thay đổi lưu trong DB (không từ body) nên request có If-None-Match
+# khớp được trả 304 trước khi đọc và serialize dữ liệu.
+
+# Dữ liệu riêng của người dùng: trình duyệt phải hỏi lại, proxy dùng chung không được lưu
+PRIVATE = "private, no-cache"
+# Dữ liệu chung (danh mục asset, giá): proxy giữ tối đa s-maxage giây rồi hỏi lại bằng If-None-Match,
+# trình duyệt luôn hỏi lại
+SHARED = f"public, max-age=0, s-maxage={config.HTTP_SHARED_MAX_AGE}"
+# Khoảng nến đã đóng
+IMMUTABLE = f"public, max-age={config.HTTP_IMMUTABLE_MAX_AGE}, immutable"
+
+
+def make_etag(*parts) -> str:
+    """ETag mạnh từ các thành phần xác định nội dung (tên route, tham số, phiên bản dữ liệu)."""
+    raw = json.dumps(parts, default=str, separators=(",", ":"))
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def http_date(value: datetime) -> str:
+    # Cột thời gian trong DB là UTC không kèm múi giờ
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def validators(etag: str, last_modified: datetime = None, cache_control: str = SHARED) -> dict:
+    """Header validator của một response; tên header viết thường để dùng chung với `not_modified`."""
+    headers = {"etag": etag, "cache-control": cache_control}
+    if last_modified is not None:
+        headers["last-modified"] = http_date(last_modified)
+    return headers
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # So sánh yếu theo RFC 9110 cho If-None-Match: bỏ tiền tố W/
+    candidates = {item.strip().removeprefix("W/") for item in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def is_not_modified(request: Request, headers) -> bool:
+    """True nếu request có điều kiện còn khớp với validator trong `headers` (ETag, Last-Modified)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match có mặt thì bỏ qua If-Modified-Since
+        return headers.get("etag") is not None and _etag_matches(if_none_match, headers["etag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = headers.get("last-modified")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+# Header được gửi lại trong 304 để cache phía client/proxy cập nhật entry
+_NOT_MODIFIED_HEADERS = ("etag", "last-modified", "cache-control", "vary", "expires")
+
+
+def not_modified(request: Request, headers):
+    """Response 304 (không body) nếu request có điều kiện còn khớp, ngược lại None."""
+    if request.method not in ("GET", "HEAD") or not is_not_modified(request, headers):
+        return None
+    return Response(
+        status_code=304,
+        headers={name: headers[name] for name in _NOT_MODIFIED_HEADERS if headers.get(name) is not None},
+    )
+
+
+class DefaultCacheControlMiddleware:
+    """Middleware ASGI: response GET/HEAD chưa có Cache-Control nhận chính sách PRIVATE,
+    để proxy dùng chung (nginx) không bao giờ lưu dữ liệu riêng của người dùng."""
+
+    def __init__(self, app, cache_control: str = PRIVATE):
+        self.app = app
+        self.cache_control = cache_control.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_default(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if not any(name.lower() == b"cache-control" for name, _ in headers):
+                    headers.append((b"cache-control", self.cache_control))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_default)
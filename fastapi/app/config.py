@@ -1,15 +1,123 @@
 # app/config.py
 import os
+import re
 
 # URL kết nối cơ sở dữ liệu từ biến môi trường (với giá trị mặc định trùng với cấu hình docker-compose)
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://appuser:apppassword@db:5432/app")
+# URL cho engine bất đồng bộ (asyncpg); mặc định suy ra từ DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    re.sub(r"^postgresql(\+\w+)?://", "postgresql+asyncpg://", DATABASE_URL),
+)
+# Các read replica (phân tách bằng dấu phẩy); để trống thì mọi truy vấn đọc đi vào primary
+DATABASE_REPLICA_URLS = [
+    re.sub(r"^postgresql(\+\w+)?://", "postgresql+asyncpg://", url.strip())
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+
+# Connection pool (áp dụng cho mỗi engine, trong mỗi worker)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Giây chờ lấy kết nối trước khi báo lỗi
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Giây; -1 để tắt
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
 # Cấu hình JWT
 JWT_SECRET_KEY = os.getenv(
     "JWT_SECRET_KEY", "your-secret-key"
 )  # Khóa bí mật để mã hóa JWT
 JWT_ALGORITHM = "HS256"  # Thuật toán mã hóa JWT
-ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Thời gian hết hạn token (30 phút)
+# Access token ngắn hạn, không trạng thái; client gia hạn bằng refresh token thay vì đăng nhập lại
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))  # Chu kỳ nạp danh sách thu hồi
+
+# Băm mật khẩu (bcrypt) trong process pool riêng để không chiếm threadpool/event loop
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # Đổi giá trị: hash cũ được băm lại khi đăng nhập
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))  # Vượt quá thì trả 503
+
+# Giới hạn đăng nhập/đăng ký trong cửa sổ LOGIN_THROTTLE_WINDOW giây (vượt quá thì trả 429)
+LOGIN_THROTTLE_WINDOW = int(os.getenv("LOGIN_THROTTLE_WINDOW", "300"))
+LOGIN_MAX_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "30"))
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", "5"))
+
+# Cache principal (người dùng đã xác thực) để không truy vấn users ở mỗi request
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))  # Giây; giới hạn độ trễ giữa các worker
+# Khi có Redis: TTL của bản sao trong tiến trình, tức độ trễ tối đa để worker khác thấy invalidation
+PRINCIPAL_LOCAL_CACHE_TTL = float(os.getenv("PRINCIPAL_LOCAL_CACHE_TTL", "2"))
+# Redis dùng chung giữa các worker (tùy chọn, cần package redis); để trống thì chỉ cache trong tiến trình
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+
+# Cache response cho danh mục asset và lịch sử giá (dùng chung CACHE_REDIS_URL nếu có)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))  # Số response giữ trong mỗi worker
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "60"))  # Giây, cho dữ liệu có thể còn thay đổi
+RESPONSE_CACHE_IMMUTABLE_TTL = int(os.getenv("RESPONSE_CACHE_IMMUTABLE_TTL", str(7 * 24 * 3600)))  # Nến đã đóng, trên Redis
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", "1000000"))  # Byte; body lớn hơn không cache
+
+# Cache-Control cho dữ liệu dùng chung: số giây proxy (nginx) được dùng response mà không hỏi lại API,
+# và thời hạn cho khoảng nến đã đóng
+HTTP_SHARED_MAX_AGE = int(os.getenv("HTTP_SHARED_MAX_AGE", "5"))
+HTTP_IMMUTABLE_MAX_AGE = int(os.getenv("HTTP_IMMUTABLE_MAX_AGE", "86400"))
 
 # Cấu hình logging: mức log mặc định, sử dụng biến môi trường để dễ thay đổi giữa development và production
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Cấu hình nạp dữ liệu giá hàng loạt (bulk ingestion)
+BULK_INGEST_BATCH_SIZE = int(os.getenv("BULK_INGEST_BATCH_SIZE", "5000"))  # Số dòng mỗi lô
+BULK_INGEST_MAX_REJECTS_REPORTED = int(
+    os.getenv("BULK_INGEST_MAX_REJECTS_REPORTED", "100")
+)  # Số dòng lỗi tối đa trả về trong response
+
+# Endpoint danh sách trả JSON qua app.serializers (orjson, không validate từng dòng); false để quay về response_model
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+# Phân trang keyset cho các endpoint danh sách (users, assets, portfolios, transactions)
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", "100"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "1000"))
+
+# Phân trang lịch sử giá
+PRICE_HISTORY_DEFAULT_LIMIT = int(os.getenv("PRICE_HISTORY_DEFAULT_LIMIT", "1000"))
+PRICE_HISTORY_MAX_LIMIT = int(os.getenv("PRICE_HISTORY_MAX_LIMIT", "100000"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))  # Số dòng mỗi lần fetch từ cursor
+PRICE_HISTORY_MAX_POINTS = int(os.getenv("PRICE_HISTORY_MAX_POINTS", "5000"))  # Số điểm tối đa cho biểu đồ
+# Biểu đồ: SQL gộp trước còn tối đa max_points * hệ số này khung, LTTB chọn điểm trên kết quả đó
+PRICE_HISTORY_DOWNSAMPLE_FACTOR = int(os.getenv("PRICE_HISTORY_DOWNSAMPLE_FACTOR", "4"))
+COLUMNAR_BATCH_SIZE = int(os.getenv("COLUMNAR_BATCH_SIZE", "65536"))  # Số dòng mỗi batch Arrow / row group Parquet
+
+# Đường giá trị danh mục
+EQUITY_CURVE_MAX_POINTS = int(os.getenv("EQUITY_CURVE_MAX_POINTS", "20000"))  # Số khung tối đa mỗi lần tính
+
+# Phân tích rủi ro/hiệu suất
+ANALYTICS_DEFAULT_LOOKBACK_DAYS = int(os.getenv("ANALYTICS_DEFAULT_LOOKBACK_DAYS", "365"))
+ANALYTICS_RISK_FREE_RATE = float(os.getenv("ANALYTICS_RISK_FREE_RATE", "0.0"))  # Lãi suất phi rủi ro theo năm
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "256"))  # Số kết quả giữ trong cache
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))  # Giây
+
+# Đẩy nến mới theo thời gian thực (WebSocket /ws/prices, SSE /sse/prices)
+REALTIME_MAX_SYMBOLS = int(os.getenv("REALTIME_MAX_SYMBOLS", "100"))  # Số symbol tối đa mỗi kết nối
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "256"))  # Tin chờ gửi mỗi kết nối; đầy thì bỏ tin cũ nhất
+REALTIME_SEND_TIMEOUT = float(os.getenv("REALTIME_SEND_TIMEOUT", "10"))  # Giây; client không nhận kịp thì bị ngắt
+REALTIME_HEARTBEAT_SECONDS = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", "15"))  # Comment SSE giữ kết nối qua proxy
+REALTIME_RECONNECT_SECONDS = float(os.getenv("REALTIME_RECONNECT_SECONDS", "2"))  # Chờ trước khi LISTEN lại
+# Giây; chu kỳ kiểm tra token của kết nối đang mở bị thu hồi (hết hạn thì ngắt đúng lúc `exp`)
+REALTIME_AUTH_CHECK_SECONDS = float(os.getenv("REALTIME_AUTH_CHECK_SECONDS", "5"))
+
+# Đẩy định giá danh mục khi có giá mới (WebSocket /ws/portfolios, SSE /sse/portfolios)
+LIVE_VALUATION_MAX_PORTFOLIOS = int(os.getenv("LIVE_VALUATION_MAX_PORTFOLIOS", "20"))  # Danh mục tối đa mỗi kết nối
+# Giây; các nến tới trong cửa sổ này được gộp vào một lần tính lại và một tin gửi mỗi danh mục
+LIVE_VALUATION_DEBOUNCE_SECONDS = float(os.getenv("LIVE_VALUATION_DEBOUNCE_SECONDS", "0.25"))
+
+# Tiến trình nạp giá nền (python -m app.feeds run); danh sách nguồn khai báo trong file JSON
+FEEDS_CONFIG = os.getenv("FEEDS_CONFIG", "feeds.json")
+FEED_BATCH_SIZE = int(os.getenv("FEED_BATCH_SIZE", "1000"))  # Số nến tối đa mỗi lần ghi
+FEED_FLUSH_SECONDS = float(os.getenv("FEED_FLUSH_SECONDS", "1"))  # Giây; nến chờ ghi tối đa chừng này
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "50000"))  # Nến chờ ghi; đầy thì nguồn phải chờ
+FEED_MAX_CONCURRENCY = int(os.getenv("FEED_MAX_CONCURRENCY", "4"))  # Request đồng thời mỗi nguồn
+FEED_BACKFILL_DAYS = int(os.getenv("FEED_BACKFILL_DAYS", "7"))  # Chỉ tìm và bù khoảng trống trong chừng này ngày
+FEED_HTTP_TIMEOUT = float(os.getenv("FEED_HTTP_TIMEOUT", "10"))  # Giây
+FEED_RECONNECT_SECONDS = float(os.getenv("FEED_RECONNECT_SECONDS", "5"))  # Chờ trước khi kết nối lại nguồn lỗi
+FEED_METRICS_PORT = int(os.getenv("FEED_METRICS_PORT", "9102"))  # Cổng /metrics của tiến trình nạp; 0 để tắt
@@ -1,122 +1,470 @@
 # app/crud.py
+import csv
+import io
+from datetime import timezone
+
+from fastapi import HTTPException
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app import model
+from app import holdings, model, pagination, partitions, realtime, rollups, valuation
+
+# Các hàm CRUD theo thực thể là async (AsyncSession, dùng cho router); các hàm dựng câu truy vấn
+# và ghi hàng loạt vẫn là sync để dùng chung với CLI, nạp dữ liệu qua COPY và AsyncSession.run_sync.
+
+# --- CRUD for User ---
+async def get_user_list_version(db: AsyncSession):
+    """(số người dùng, thời điểm sửa gần nhất): đổi khi thêm, sửa hoặc xóa người dùng."""
+    return (await db.execute(select(func.count(), func.max(model.User.updated_at)))).one()
+
 
 # --- CRUD for Asset ---
 
 
-def get_asset(db: Session, asset_id: int):
-    return db.query(model.Asset).filter(model.Asset.id == asset_id).first()
+async def get_asset(db: AsyncSession, asset_id: int):
+    return await db.get(model.Asset, asset_id)
+
+
+async def get_assets(db: AsyncSession, skip: int = 0, limit: int = 100, after=None):
+    """Trang tài sản theo id; trả về (danh sách, cursor trang sau)."""
+    stmt = pagination.keyset(select(model.Asset), (model.Asset.id,), after).offset(skip)
+    return await pagination.fetch_page(db, stmt, limit, lambda asset: (asset.id,))
 
 
-def get_assets(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(model.Asset).offset(skip).limit(limit).all()
+async def get_asset_catalog_version(db: AsyncSession):
+    """(số asset, thời điểm sửa gần nhất): đổi khi thêm, sửa hoặc xóa asset."""
+    return (await db.execute(select(func.count(), func.max(model.Asset.updated_at)))).one()
 
 
-def create_asset(db: Session, symbol: str, name: str, description: str = None):
+async def create_asset(db: AsyncSession, symbol: str, name: str, description: str = None):
     asset = model.Asset(symbol=symbol, name=name, description=description)
     db.add(asset)
-    db.commit()
-    db.refresh(asset)
+    await db.commit()
+    await db.refresh(asset)
     return asset
 
 
-def update_asset(db: Session, asset_id: int, **kwargs):
-    asset = db.query(model.Asset).filter(model.Asset.id == asset_id).first()
+async def update_asset(db: AsyncSession, asset_id: int, **kwargs):
+    asset = await db.get(model.Asset, asset_id)
+    if asset is None:
+        return None
     for key, value in kwargs.items():
         setattr(asset, key, value)
-    db.commit()
-    db.refresh(asset)
+    await db.commit()
+    await db.refresh(asset)
     return asset
 
 
-def delete_asset(db: Session, asset_id: int):
-    asset = db.query(model.Asset).get(asset_id)
-    db.delete(asset)
-    db.commit()
+async def delete_asset(db: AsyncSession, asset_id: int):
+    asset = await db.get(model.Asset, asset_id)
+    await db.delete(asset)
+    await db.commit()
 
 
 # --- Portfolio CRUD ---
-def get_portfolio(db: Session, portfolio_id: int):
-    return db.query(model.Portfolio).get(portfolio_id)
+async def get_portfolio(db: AsyncSession, portfolio_id: int):
+    return await db.get(model.Portfolio, portfolio_id)
 
 
-def create_portfolio(db: Session, user_id: int, name: str):
-    portfolio = model.Portfolio(user_id=user_id, name=name)
+async def get_portfolio_list_version(db: AsyncSession, user_id: int):
+    """(số danh mục, thời điểm sửa gần nhất) của người dùng."""
+    return (
+        await db.execute(
+            select(func.count(), func.max(model.Portfolio.updated_at)).where(model.Portfolio.user_id == user_id)
+        )
+    ).one()
+
+
+async def get_portfolio_prices_version(db: AsyncSession, portfolio_id: int, *asset_ids):
+    """Thời điểm ghi giá gần nhất của các asset đã giao dịch trong danh mục (và của `asset_ids`)."""
+    traded = model.Asset.id.in_(
+        select(model.Transaction.asset_id).where(model.Transaction.portfolio_id == portfolio_id)
+    )
+    condition = or_(traded, model.Asset.id.in_(asset_ids)) if asset_ids else traded
+    return (await db.execute(select(func.max(model.Asset.prices_updated_at)).where(condition))).scalar()
+
+
+async def create_portfolio(db: AsyncSession, user_id: int, name: str, description: str = None):
+    portfolio = model.Portfolio(user_id=user_id, name=name, description=description)
     db.add(portfolio)
-    db.commit()
-    db.refresh(portfolio)
+    await db.commit()
+    await db.refresh(portfolio)
     return portfolio
 
 
-def delete_portfolio(db: Session, portfolio_id: int):
-    portfolio = db.query(model.Portfolio).get(portfolio_id)
-    db.delete(portfolio)
-    db.commit()
+async def delete_portfolio(db: AsyncSession, portfolio_id: int):
+    portfolio = await db.get(model.Portfolio, portfolio_id)
+    await db.delete(portfolio)
+    await db.commit()
 
 
-def update_portfolio(db: Session, portfolio_id: int, name: str):
-    portfolio = db.query(model.Portfolio).get(portfolio_id)
+async def update_portfolio(db: AsyncSession, portfolio_id: int, name: str, description: str = None):
+    portfolio = await db.get(model.Portfolio, portfolio_id)
     portfolio.name = name
-    db.commit()
-    db.refresh(portfolio)
+    if description is not None:
+        portfolio.description = description
+    await db.commit()
+    await db.refresh(portfolio)
     return portfolio
 
 
 # --- CRUD for PriceHistory ---
-def create_price_history(db: Session, asset_id: int, date, open_price, close_price):
+PRICE_HISTORY_COLUMNS = (
+    "asset_id",
+    "date",
+    "open_price",
+    "close_price",
+    "high_price",
+    "low_price",
+    "volume",
+)
+UPSERT_CHUNK_SIZE = 5000
+
+
+def touch_prices_statement(asset_ids):
+    """Cập nhật asset.prices_updated_at của các asset vừa ghi/sửa/xóa nến (validator HTTP của API đọc giá).
+
+    clock_timestamp() thay vì now(): hai giao dịch bắt đầu cùng lúc vẫn cho giá trị khác nhau.
+    Khóa dòng asset theo thứ tự id để các lô nhiều asset chạy song song không deadlock.
+    """
+    return (
+        update(model.Asset)
+        .where(model.Asset.id.in_(sorted(set(asset_ids))))
+        # Gán lại updated_at để onupdate không chạy: ghi giá không làm đổi ETag danh mục asset
+        .values(prices_updated_at=func.clock_timestamp(), updated_at=model.Asset.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def price_row(price_history) -> dict:
+    return {column: getattr(price_history, column) for column in PRICE_HISTORY_COLUMNS}
+
+
+def notify_prices_statement(rows):
+    """Phát nến vừa ghi tới client realtime (app.realtime); chỉ có hiệu lực khi giao dịch commit."""
+    return realtime.notify_statement(rows, PRICE_HISTORY_COLUMNS)
+
+
+async def create_price_history(
+    db: AsyncSession,
+    asset_id: int,
+    date,
+    open_price,
+    close_price,
+    high_price=None,
+    low_price=None,
+    volume=None,
+):
+    date = naive_utc(date)
+    await db.run_sync(partitions.ensure_price_history_partitions, [date])
     price_history = model.PriceHistory(
-        asset_id=asset_id, date=date, open_price=open_price, close_price=close_price
+        asset_id=asset_id,
+        date=date,
+        open_price=open_price,
+        close_price=close_price,
+        high_price=high_price,
+        low_price=low_price,
+        volume=volume,
     )
     db.add(price_history)
-    db.commit()
-    db.refresh(price_history)
+    await db.flush()
+    await db.execute(touch_prices_statement([asset_id]))
+    await db.execute(notify_prices_statement([price_row(price_history)]))
+    await db.run_sync(rollups.refresh_rollups, asset_id, date, date)
+    await db.commit()
+    await db.refresh(price_history)
     return price_history
 
 
-def get_price_history_by_asset(db: Session, asset_id: int):
-    return (
-        db.query(model.PriceHistory)
-        .filter(model.PriceHistory.asset_id == asset_id)
-        .order_by(model.PriceHistory.date.desc())
-        .all()
+def _dedupe_price_rows(rows):
+    """Giữ lại dòng cuối cùng cho mỗi cặp (asset_id, date) trong một lô."""
+    unique = {}
+    for row in rows:
+        unique[(row["asset_id"], row["date"])] = row
+    return list(unique.values())
+
+
+def upsert_price_history(db: Session, rows, refresh_rollups: bool = True):
+    """Ghi một lô nến bằng câu INSERT nhiều dòng ... ON CONFLICT (asset_id, date)."""
+    rows = _dedupe_price_rows(rows)
+    partitions.ensure_price_history_partitions(db, [row["date"] for row in rows])
+    # Chia nhỏ để không vượt giới hạn 65535 tham số của một câu lệnh PostgreSQL
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = pg_insert(model.PriceHistory).values(
+            [
+                {column: row.get(column) for column in PRICE_HISTORY_COLUMNS}
+                for row in rows[start : start + UPSERT_CHUNK_SIZE]
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["asset_id", "date"],
+            set_={
+                column: stmt.excluded[column]
+                for column in PRICE_HISTORY_COLUMNS
+                if column not in ("asset_id", "date")
+            },
+        )
+        db.execute(stmt)
+    if rows:
+        db.execute(touch_prices_statement(row["asset_id"] for row in rows))
+        db.execute(notify_prices_statement(rows))
+    if refresh_rollups:
+        rollups.refresh_rollups_for_rows(db, rows)
+    db.commit()
+    return len(rows)
+
+
+def copy_price_history(db: Session, rows, refresh_rollups: bool = True):
+    """Ghi một lô nến qua COPY vào bảng tạm rồi merge bằng INSERT ... SELECT ON CONFLICT.
+
+    Chỉ dùng được với driver PostgreSQL hỗ trợ COPY (psycopg2 hoặc psycopg 3).
+    """
+    rows = _dedupe_price_rows(rows)
+    if not rows:
+        return 0
+    partitions.ensure_price_history_partitions(db, [row["date"] for row in rows])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            ["" if row.get(column) is None else row[column] for column in PRICE_HISTORY_COLUMNS]
+        )
+    buffer.seek(0)
+
+    columns = ", ".join(PRICE_HISTORY_COLUMNS)
+    updates = ", ".join(
+        f"{column} = EXCLUDED.{column}"
+        for column in PRICE_HISTORY_COLUMNS
+        if column not in ("asset_id", "date")
     )
+    copy_sql = f"COPY price_history_stage ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    connection = db.connection()
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS price_history_stage ("
+        "asset_id integer, date timestamp, open_price numeric(18, 8), "
+        "close_price numeric(18, 8), high_price numeric(18, 8), low_price numeric(18, 8), "
+        "volume numeric(28, 8)"
+        ") ON COMMIT DELETE ROWS"
+    )
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(copy_sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+    connection.exec_driver_sql(
+        f"INSERT INTO price_history ({columns}) "
+        f"SELECT {columns} FROM price_history_stage "
+        f"ON CONFLICT (asset_id, date) DO UPDATE SET {updates}"
+    )
+    db.execute(touch_prices_statement(row["asset_id"] for row in rows))
+    db.execute(notify_prices_statement(rows))
+    if refresh_rollups:
+        rollups.refresh_rollups_for_rows(db, rows)
+    db.commit()
+    return len(rows)
+
+
+def naive_utc(value):
+    """Cột date lưu thời gian UTC không kèm múi giờ; quy đổi tham số có múi giờ về dạng đó."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def price_history_select(
+    asset_id: int,
+    start=None,
+    end=None,
+    after=None,
+    order: str = "desc",
+    keys_only: bool = False,
+):
+    """Câu SELECT lịch sử giá của một asset theo khoảng [start, end] và keyset `after`.
+
+    Điều kiện trên date giúp PostgreSQL chỉ quét các partition tháng liên quan.
+    """
+    start, end, after = naive_utc(start), naive_utc(end), naive_utc(after)
+    table = model.PriceHistory.__table__
+    if keys_only:
+        stmt = select(table.c.date)
+    else:
+        stmt = select(*(table.c[column] for column in PRICE_HISTORY_COLUMNS))
+    stmt = stmt.where(table.c.asset_id == asset_id)
+    if start is not None:
+        stmt = stmt.where(table.c.date >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.date <= end)
+    if order == "asc":
+        if after is not None:
+            stmt = stmt.where(table.c.date > after)
+        return stmt.order_by(table.c.date.asc())
+    if after is not None:
+        stmt = stmt.where(table.c.date < after)
+    return stmt.order_by(table.c.date.desc())
+
+
+async def get_price_history_by_asset(
+    db: AsyncSession, asset_id: int, start=None, end=None, limit: int = None
+):
+    stmt = select(model.PriceHistory).from_statement(
+        price_history_select(asset_id, start=start, end=end).limit(limit)
+    )
+    return (await db.execute(stmt)).scalars().all()
+
+
+async def get_page_end(db: AsyncSession, keys_stmt, limit: int):
+    """Trả về khóa của dòng cuối trang nếu còn trang sau, ngược lại None.
+
+    `keys_stmt` chỉ chọn cột khóa nên PostgreSQL có thể dùng index-only scan,
+    rẻ hơn nhiều so với đọc cả trang.
+    """
+    keys = (await db.execute(keys_stmt.offset(limit - 1).limit(2))).scalars().all()
+    return keys[0] if len(keys) == 2 else None
+
+
+async def iter_rows(db: AsyncSession, stmt, batch_size: int = 1000):
+    """Đọc kết quả qua server-side cursor, mỗi lần `batch_size` dòng."""
+    result = await db.stream(stmt.execution_options(yield_per=batch_size))
+    async for partition in result.partitions():
+        for row in partition:
+            yield row
 
 
 # --- CRUD for Transaction ---
-def create_transaction(
-    db: Session,
+async def _flush_transaction(db: AsyncSession):
+    # Router kiểm tra external_id trước, nhưng hai request đồng thời vẫn có thể cùng qua bước đó:
+    # ràng buộc unique là chốt chặn cuối, trả cùng lỗi 400 thay vì 500
+    try:
+        await db.flush()
+    except IntegrityError as error:
+        await db.rollback()
+        if "uq_transaction_portfolio_external_id" in str(error.orig):
+            raise HTTPException(status_code=400, detail="Transaction with this external_id already exists")
+        raise
+
+
+async def create_transaction(
+    db: AsyncSession,
     portfolio_id: int,
     asset_id: int,
     quantity: float,
     price: float,
     transaction_type: str,
     transaction_date,
+    external_id: str = None,
 ):
     transaction = model.Transaction(
         portfolio_id=portfolio_id,
         asset_id=asset_id,
-        transaction_date=transaction_date,
         quantity=quantity,
         price=price,
-        type=transaction_type,
+        transaction_type=transaction_type,
+        external_id=external_id,
     )
+    if transaction_date is not None:
+        transaction.transaction_date = transaction_date
     db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    await _flush_transaction(db)
+    await db.run_sync(holdings.apply_transaction, transaction.id)
+    await db.commit()
+    await db.refresh(transaction)
     return transaction
 
 
-def get_transactions(db: Session, portfolio_id: int):
-    return (
-        db.query(model.Transaction)
-        .filter(model.Transaction.portfolio_id == portfolio_id)
-        .order_by(model.Transaction.transaction_date.desc())
-        .all()
+async def get_transaction_by_external_id(db: AsyncSession, portfolio_id: int, external_id: str):
+    result = await db.execute(
+        select(model.Transaction).where(
+            model.Transaction.portfolio_id == portfolio_id,
+            model.Transaction.external_id == external_id,
+        )
     )
+    return result.scalars().first()
 
 
-def delete_transaction(db: Session, transaction_id: int):
-    transaction = db.query(model.Transaction).get(transaction_id)
-    db.delete(transaction)
-    db.commit()
+# Danh sách giao dịch sắp xếp giảm dần theo (transaction_date, id), khớp index ix_transaction_portfolio_date
+TRANSACTION_SORT = (model.Transaction.transaction_date, model.Transaction.id)
+
+
+def transaction_cursor(transaction: model.Transaction):
+    return (transaction.transaction_date, transaction.id)
+
+
+def transaction_filters(start=None, end=None, asset_id: int = None, transaction_type: str = None):
+    """Điều kiện lọc giao dịch; transaction_type khớp cả các tên đồng nghĩa (buy/mua, sell/bán)."""
+    conditions = []
+    if start is not None:
+        conditions.append(model.Transaction.transaction_date >= naive_utc(start))
+    if end is not None:
+        conditions.append(model.Transaction.transaction_date <= naive_utc(end))
+    if asset_id is not None:
+        conditions.append(model.Transaction.asset_id == asset_id)
+    if transaction_type:
+        lowered = transaction_type.lower()
+        aliases = next(
+            (types for types in (valuation.BUY_TYPES, valuation.SELL_TYPES) if lowered in types),
+            (lowered,),
+        )
+        conditions.append(func.lower(model.Transaction.transaction_type).in_(aliases))
+    return conditions
+
+
+TRANSACTION_COLUMNS = (
+    "id",
+    "portfolio_id",
+    "asset_id",
+    "transaction_type",
+    "quantity",
+    "price",
+    "transaction_date",
+    "external_id",
+)
+
+
+def transaction_select(portfolio_id: int, **filters):
+    """Câu SELECT toàn bộ giao dịch của danh mục theo thứ tự thời gian (dùng cho export)."""
+    table = model.Transaction.__table__
+    stmt = select(*(table.c[column] for column in TRANSACTION_COLUMNS)).where(
+        model.Transaction.portfolio_id == portfolio_id, *transaction_filters(**filters)
+    )
+    return pagination.keyset(stmt, TRANSACTION_SORT)
+
+
+async def get_transactions(db: AsyncSession, portfolio_id: int, limit: int = 100, after=None, **filters):
+    """Trang giao dịch của danh mục; trả về (danh sách, cursor trang sau)."""
+    stmt = pagination.keyset(
+        select(model.Transaction).where(
+            model.Transaction.portfolio_id == portfolio_id, *transaction_filters(**filters)
+        ),
+        TRANSACTION_SORT,
+        after,
+        descending=True,
+    )
+    return await pagination.fetch_page(db, stmt, limit, transaction_cursor)
+
+
+async def update_transaction(db: AsyncSession, transaction: model.Transaction, **fields):
+    # Trừ đóng góp cũ, ghi giá trị mới rồi cộng lại vào portfolio_holding trong cùng giao dịch
+    await db.run_sync(holdings.apply_transaction, transaction.id, -1)
+    for key, value in fields.items():
+        if key == "transaction_date" and value is None:
+            continue
+        setattr(transaction, key, value)
+    await _flush_transaction(db)
+    await db.run_sync(holdings.apply_transaction, transaction.id)
+    await db.commit()
+    await db.refresh(transaction)
+    return transaction
+
+
+async def delete_transaction(db: AsyncSession, transaction_id: int):
+    transaction = await db.get(model.Transaction, transaction_id)
+    await db.run_sync(holdings.apply_transaction, transaction_id, -1)
+    await db.delete(transaction)
+    await db.commit()
@@ -1,15 +1,145 @@
 # app/database.py
+import itertools
+import time
+
+from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app import config, metrics
+
+POOL_CHECKOUT_SECONDS = metrics.Histogram(
+    "db_pool_checkout_seconds",
+    "Thời gian chờ lấy kết nối từ pool",
+    labelnames=("pool",),
+)
+
+
+class _TimedPoolMixin:
+    """Đo thời gian chờ checkout; pool_label được gán sau khi tạo engine."""
+
+    pool_label = "unknown"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, pool=self.pool_label)
+
+    def recreate(self):
+        # engine.dispose() tạo pool mới qua recreate(): giữ lại nhãn
+        pool = super().recreate()
+        pool.pool_label = self.pool_label
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options() -> dict:
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+
+
+_engines = {}  # nhãn pool -> engine, dùng cho metric
+
+
+def _register(label: str, engine):
+    engine.pool.pool_label = label
+    _engines[label] = engine
+    return engine
 
-from app import config
 
 # Tạo engine kết nối tới cơ sở dữ liệu (SQLAlchemy 2.x)
-engine = create_engine(config.DATABASE_URL, future=True)  # future=True cho SQLAlchemy 2.x
+# Engine đồng bộ (psycopg2) dùng cho Alembic, các lệnh CLI và nạp dữ liệu hàng loạt qua COPY
+engine = _register(
+    "sync",
+    create_engine(config.DATABASE_URL, future=True, poolclass=TimedQueuePool, **pool_options()),
+)  # future=True cho SQLAlchemy 2.x
 
 # Tạo sessionmaker để tạo Session cho mỗi phiên làm việc
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Engine bất đồng bộ (asyncpg) dùng cho các endpoint: một worker phục vụ đồng thời nhiều
+# request mà không giữ thread trong lúc chờ DB
+async_engine = create_async_engine(
+    config.ASYNC_DATABASE_URL, poolclass=TimedAsyncAdaptedQueuePool, **pool_options()
+)
+_register("primary", async_engine.sync_engine)
+
+# Các read replica; không cấu hình thì truy vấn đọc dùng luôn primary
+replica_engines = [
+    create_async_engine(url, poolclass=TimedAsyncAdaptedQueuePool, **pool_options())
+    for url in config.DATABASE_REPLICA_URLS
+]
+for index, replica in enumerate(replica_engines):
+    _register(f"replica-{index}", replica.sync_engine)
+_read_engines = itertools.cycle(replica_engines or [async_engine])
+
+# expire_on_commit=False: đọc thuộc tính sau commit không phát sinh truy vấn ngầm (không được phép với async)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession
+)
+
+
+def read_session() -> AsyncSession:
+    """AsyncSession gắn với replica kế tiếp (round-robin).
+
+    Replica có thể trễ so với primary vài trăm ms: chỉ dùng cho endpoint chỉ đọc,
+    không dùng cho luồng cần đọc lại ngay dữ liệu vừa ghi.
+    """
+    return AsyncSessionLocal(bind=next(_read_engines))
+
+
+async def dispose_engines():
+    await async_engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
+
+
+def _pool_stats():
+    for label, pool_engine in _engines.items():
+        pool = pool_engine.pool
+        yield label, pool.size(), pool.checkedout(), pool.checkedin(), pool.overflow(), config.DB_MAX_OVERFLOW
+
+
+POOL_CONNECTIONS = metrics.Gauge(
+    "db_pool_connections",
+    "Số kết nối theo trạng thái (checked_out, idle, overflow)",
+    labelnames=("pool", "state"),
+    collect=lambda: [
+        item
+        for label, _, checked_out, idle, overflow, _ in _pool_stats()
+        for item in (
+            ({"pool": label, "state": "checked_out"}, checked_out),
+            ({"pool": label, "state": "idle"}, idle),
+            ({"pool": label, "state": "overflow"}, max(overflow, 0)),
+        )
+    ],
+)
+POOL_UTILIZATION = metrics.Gauge(
+    "db_pool_utilization",
+    "Tỷ lệ kết nối đang dùng trên dung lượng tối đa (pool_size + max_overflow)",
+    labelnames=("pool",),
+    collect=lambda: [
+        ({"pool": label}, checked_out / max(size + max_overflow, 1))
+        for label, size, checked_out, _, _, max_overflow in _pool_stats()
+    ],
+)
+
 # Base class cho các model ORM
 Base = declarative_base()
 
@@ -20,3 +150,20 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency: Lấy AsyncSession cho mỗi request (primary, đọc và ghi)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependency: AsyncSession cho endpoint chỉ đọc, định tuyến sang read replica.
+# Không có replica thì dùng lại session primary của request, tránh một request giữ hai kết nối
+# của cùng một pool (có thể cạn pool khi tải cao)
+async def get_async_read_db(primary: AsyncSession = Depends(get_async_db)):
+    if not replica_engines:
+        yield primary
+        return
+    async with read_session() as db:
+        yield db
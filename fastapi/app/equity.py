@@ -0,0 +1,196 @@
+# app/equity.py
+"""Đường giá trị (equity curve) lịch sử của danh mục.
+
+Toàn bộ phép tính là vector hóa: khối lượng nắm giữ theo từng khung là cumsum của
+ma trận thay đổi (asset x khung), nhân với ma trận giá đóng cửa đã forward-fill.
+Mỗi asset chỉ cần một truy vấn chuỗi giá (đọc từ rollup khi có).
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import Float, cast, func, select, true
+from sqlalchemy.orm import Session
+
+from app import config, crud, model, rollups, timeseries, valuation
+
+
+def bucket_grid(start: datetime, end: datetime, interval: str):
+    """Các mốc đầu khung từ khung chứa `start` đến khung chứa `end` (datetime64[s])."""
+    stride = timeseries.INTERVALS[interval]
+    first = timeseries.bucket_floor(start, interval)
+    count = int((timeseries.bucket_floor(end, interval) - first).total_seconds() // stride) + 1
+    if count > config.EQUITY_CURVE_MAX_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too large for interval {interval}: {count} points "
+            f"(max {config.EQUITY_CURVE_MAX_POINTS})",
+        )
+    return np.datetime64(first, "s") + np.arange(count) * np.timedelta64(stride, "s")
+
+
+def bucket_index(grid, dates):
+    """Chỉ số khung chứa từng thời điểm trong `dates` (các thời điểm trước grid[0] -> 0)."""
+    stride = grid[1] - grid[0] if len(grid) > 1 else np.timedelta64(1, "s")
+    index = (np.asarray(dates, dtype="datetime64[s]") - grid[0]) // stride
+    return np.clip(index.astype(np.int64), 0, None)
+
+
+def forward_fill(matrix):
+    """Điền NaN theo trục thời gian (axis=1) bằng giá trị khác NaN gần nhất phía trước."""
+    valid = ~np.isnan(matrix)
+    index = np.where(valid, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(index, axis=1, out=index)
+    return matrix[np.arange(matrix.shape[0])[:, None], index]
+
+
+def equity_series(asset_index, tx_bucket, signed_quantity, cash_flow, prices):
+    """Tính chuỗi giá trị, vốn ròng, lợi suất và drawdown từ các mảng đã căn theo khung.
+
+    - asset_index, tx_bucket, signed_quantity, cash_flow: một phần tử cho mỗi giao dịch
+      (cash_flow = tiền mua dương, tiền bán âm).
+    - prices: ma trận giá đóng cửa (asset x khung) đã forward-fill, NaN nếu chưa có giá.
+
+    Lợi suất từng khung loại bỏ dòng tiền vào/ra trong khung:
+    r_t = (V_t - V_{t-1} - flow_t) / V_{t-1}; lợi suất tích lũy là time-weighted
+    (tích của 1 + r_t) và drawdown đo trên chỉ số tích lũy này.
+    """
+    n_assets, n_points = prices.shape
+    delta = np.zeros((n_assets, n_points))
+    np.add.at(delta, (asset_index, tx_bucket), signed_quantity)
+    positions = np.cumsum(delta, axis=1)
+    market_value = np.nansum(positions * prices, axis=0)
+
+    flows = np.bincount(tx_bucket, weights=cash_flow, minlength=n_points)
+    net_invested = np.cumsum(flows)
+
+    previous = np.concatenate(([0.0], market_value[:-1]))
+    gain = market_value - previous - flows
+    period_return = np.divide(gain, previous, out=np.zeros(n_points), where=previous > 0)
+    wealth = np.cumprod(1.0 + period_return)
+    drawdown = wealth / np.maximum.accumulate(wealth) - 1.0
+    return {
+        "market_value": market_value,
+        "net_invested": net_invested,
+        "pnl": market_value - net_invested,
+        "period_return": period_return,
+        "cumulative_return": wealth - 1.0,
+        "drawdown": drawdown,
+    }
+
+
+def price_matrix(db: Session, asset_ids, grid, interval: str):
+    """Ma trận giá đóng cửa (asset x khung), forward-fill từ giá gần nhất trước grid[0]."""
+    prices = np.full((len(asset_ids), len(grid)), np.nan)
+    start = grid[0].astype(datetime)
+    end = grid[-1].astype(datetime) + timedelta(seconds=timeseries.INTERVALS[interval])
+    builder = rollups.series_select_builder(interval)
+
+    # Giá đóng cửa cuối cùng trước khung đầu tiên, một truy vấn cho mọi asset
+    table = model.PriceHistory.__table__
+    asset = model.Asset.__table__
+    opening = (
+        select(table.c.close_price)
+        .where(
+            table.c.asset_id == asset.c.id,
+            table.c.close_price.isnot(None),
+            table.c.date < start,
+        )
+        .order_by(table.c.date.desc())
+        .limit(1)
+        .lateral("opening")
+    )
+    opening_prices = dict(
+        db.execute(
+            select(asset.c.id, cast(opening.c.close_price, Float))
+            .select_from(asset.join(opening, true()))
+            .where(asset.c.id.in_(asset_ids))
+        ).all()
+    )
+
+    for row, asset_id in enumerate(asset_ids):
+        if asset_id in opening_prices:
+            prices[row, 0] = opening_prices[asset_id]
+        stmt = builder(asset_id, start=start, end=end, order="asc").subquery()
+        series = db.execute(
+            select(stmt.c.date, cast(stmt.c.close_price, Float)).where(
+                stmt.c.close_price.isnot(None), stmt.c.date < end
+            )
+        ).all()
+        if series:
+            dates, closes = zip(*series)
+            # Các khung trùng chỉ số (chuỗi thô mịn hơn interval): giữ giá cuối cùng
+            prices[row, bucket_index(grid, dates)] = closes
+    return forward_fill(prices)
+
+
+def equity_frame(
+    db: Session,
+    portfolio_id: int,
+    start: datetime = None,
+    end: datetime = None,
+    interval: str = "1d",
+):
+    """Lưới thời gian (datetime64[s]) và các chuỗi numpy giá trị danh mục theo khung `interval`."""
+    start, end = crud.naive_utc(start), crud.naive_utc(end)
+    tx = model.Transaction.__table__
+    side = valuation.side_expression(tx.c.transaction_type)
+    if end is None:
+        end = datetime.now(timezone.utc).replace(tzinfo=None)
+    conditions = [tx.c.portfolio_id == portfolio_id, side != 0, tx.c.transaction_date <= end]
+    if start is None:
+        start = db.execute(select(func.min(tx.c.transaction_date)).where(*conditions)).scalar()
+        start = start or end
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    grid = bucket_grid(start, end, interval)
+    rows = db.execute(
+        select(
+            tx.c.asset_id,
+            tx.c.transaction_date,
+            side,
+            cast(tx.c.quantity, Float),
+            cast(tx.c.price, Float),
+        ).where(*conditions)
+    ).all()
+
+    if rows:
+        asset_ids, dates, sides, quantity, price = (np.array(column) for column in zip(*rows))
+        unique_assets, asset_index = np.unique(asset_ids, return_inverse=True)
+        unique_assets = unique_assets.tolist()
+        tx_bucket = bucket_index(grid, dates.astype("datetime64[s]"))
+        signed_quantity = sides * quantity
+        cash_flow = signed_quantity * price
+    else:
+        unique_assets = []
+        asset_index = tx_bucket = np.zeros(0, dtype=np.int64)
+        signed_quantity = cash_flow = np.zeros(0)
+
+    prices = price_matrix(db, unique_assets, grid, interval)
+    return grid, equity_series(asset_index, tx_bucket, signed_quantity, cash_flow, prices)
+
+
+def equity_curve(
+    db: Session,
+    portfolio_id: int,
+    start: datetime = None,
+    end: datetime = None,
+    interval: str = "1d",
+) -> dict:
+    """Giá trị danh mục theo từng khung `interval` trong [start, end]."""
+    grid, series = equity_frame(db, portfolio_id, start=start, end=end, interval=interval)
+    dates = grid.astype(datetime).tolist()
+    points = [
+        dict(zip(series, values), date=date)
+        for date, values in zip(dates, zip(*(array.tolist() for array in series.values())))
+    ]
+    return {
+        "portfolio_id": portfolio_id,
+        "interval": interval,
+        "start": dates[0],
+        "end": dates[-1],
+        "points": points,
+        "total_return": points[-1]["cumulative_return"],
+        "max_drawdown": float(series["drawdown"].min()),
+    }
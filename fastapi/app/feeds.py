@@ -0,0 +1,659 @@
+# app/feeds.py
+"""Tiến trình nền nạp giá thị trường vào price_history, chạy riêng với API.
+
+    python -m app.feeds run [--config feeds.json]
+    python -m app.feeds replay candles.ndjson [--speed 60]
+
+File cấu hình (FEEDS_CONFIG) khai báo các nguồn; `symbols` ánh xạ symbol asset trong DB sang mã
+phía nguồn:
+
+    {"feeds": [
+        {"name": "binance", "adapter": "rest", "url": "https://api.binance.com/api/v3/klines",
+         "symbols": {"BTC": "BTCUSDT"}, "interval": "1m", "poll_seconds": 30, "rate_limit": 10},
+        {"name": "binance-live", "adapter": "websocket", "url": "wss://stream.binance.com:9443/stream",
+         "rest_url": "https://api.binance.com/api/v3/klines", "symbols": {"ETH": "ETHUSDT"}},
+        {"name": "archive", "adapter": "file", "path": "candles.csv"}
+    ]}
+
+Adapter REST/WebSocket đọc định dạng kline kiểu Binance (nhiều sàn khác dùng cùng dạng); adapter
+file phát lại NDJSON/CSV (cột symbol hoặc asset_id) để chạy offline. Nến được gom lô và ghi qua
+ingest.process_batch, tức là cũng cập nhật rollup, validator HTTP và NOTIFY cho client realtime.
+
+Khoảng trống (thiếu nến giữa hai nến liên tiếp) trong FEED_BACKFILL_DAYS gần nhất được tìm bằng SQL
+khi khởi động và mỗi lần kết nối lại luồng, và được phát hiện ngay khi nến mới tới cách nến trước
+hơn một khung; adapter có `fetch` thì tự lấy lại phần thiếu.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import orjson
+import websockets
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import config, crud, database, ingest, metrics, model, response_cache, timeseries
+from app.logger import setup_logging
+from app.throttle import SlidingWindowLimiter
+
+logger = logging.getLogger(__name__)
+
+_newest = {}  # nguồn -> thời điểm nến mới nhất đã ghi, cho metric độ trễ
+
+RECEIVED = metrics.Counter("feed_candles_received_total", "Nến nhận từ nguồn", labelnames=("feed",))
+WRITTEN = metrics.Counter(
+    "feed_candles_written_total", "Nến đã ghi vào price_history (tốc độ nạp)", labelnames=("feed",)
+)
+REJECTED = metrics.Counter(
+    "feed_candles_rejected_total", "Nến bị loại: dữ liệu sai hoặc asset không có trong DB", labelnames=("feed",)
+)
+ERRORS = metrics.Counter(
+    "feed_errors_total", "Lỗi khi lấy dữ liệu (fetch, stream) hoặc ghi lô (write)", labelnames=("feed", "stage")
+)
+FETCH_SECONDS = metrics.Histogram("feed_fetch_seconds", "Thời gian một lần fetch của nguồn", labelnames=("feed",))
+WRITE_SECONDS = metrics.Histogram("feed_write_seconds", "Thời gian ghi một lô nến")
+WRITE_LAG = metrics.Histogram(
+    "feed_write_lag_seconds", "Từ lúc nhận nến tới lúc lô chứa nó được commit", labelnames=("feed",)
+)
+THROTTLED = metrics.Counter(
+    "feed_throttled_seconds_total", "Thời gian chờ do giới hạn tần suất của nguồn", labelnames=("feed",)
+)
+GAPS = metrics.Counter("feed_gaps_total", "Khoảng trống phát hiện trong dữ liệu nến", labelnames=("feed",))
+BACKFILLED = metrics.Counter(
+    "feed_backfilled_candles_total", "Nến lấy lại để bù khoảng trống", labelnames=("feed",)
+)
+QUEUED = metrics.Gauge("feed_queue_candles", "Nến đang chờ ghi")
+LAG = metrics.Gauge(
+    "feed_lag_seconds",
+    "Độ trễ dữ liệu: hiện tại trừ thời điểm nến mới nhất đã ghi của nguồn",
+    labelnames=("feed",),
+    collect=lambda: [
+        ({"feed": feed}, (utcnow() - newest).total_seconds()) for feed, newest in list(_newest.items())
+    ],
+)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def parse_date(value):
+    """datetime UTC không múi giờ từ datetime hoặc chuỗi ISO; None nếu không đọc được."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return crud.naive_utc(value) if isinstance(value, datetime) else None
+
+
+# --- Adapter ---
+
+
+class FeedAdapter:
+    """Nguồn nến. Lớp con cài đặt `fetch` (lấy nến trong một khoảng: poll định kỳ và bù khoảng
+    trống) và/hoặc `stream` (async iterator các nến tới liên tục), và bật cờ `can_fetch` /
+    `can_stream` tương ứng; cài đặt mặc định không trả về nến nào.
+
+    Nến là dict theo cột price_history kèm `symbol` (symbol asset trong DB) hoặc `asset_id`.
+    """
+
+    kind = None
+    finite = False  # stream kết thúc là xong (file), không kết nối lại
+    can_fetch = False
+    can_stream = False
+
+    def __init__(
+        self,
+        name: str,
+        symbols=None,
+        interval: str = "1m",
+        poll_seconds: float = None,
+        rate_limit: int = 10,
+        rate_window: float = 1.0,
+    ):
+        if interval not in timeseries.INTERVALS:
+            raise ValueError(f"{name}: unsupported interval {interval!r}")
+        self.name = name
+        self.symbols = dict(symbols) if isinstance(symbols, dict) else {symbol: symbol for symbol in symbols or ()}
+        self.interval = interval
+        self.step = timedelta(seconds=timeseries.INTERVALS[interval])
+        self.poll_seconds = poll_seconds or self.step.total_seconds()
+        self.concurrency = asyncio.Semaphore(config.FEED_MAX_CONCURRENCY)
+        self._limiter = SlidingWindowLimiter(rate_limit, rate_window, max_keys=1)
+
+    async def throttle(self):
+        """Chờ tới lượt gửi request kế tiếp (tối đa rate_limit request mỗi rate_window giây)."""
+        while (wait := self._limiter.retry_after(self.name)) > 0:
+            THROTTLED.inc(wait, feed=self.name)
+            await asyncio.sleep(wait)
+        self._limiter.hit(self.name)
+
+    async def fetch(self, symbol: str, start: datetime, end: datetime) -> list:
+        """Các nến của `symbol` có thời điểm trong [start, end)."""
+        return []
+
+    async def stream(self):
+        return
+        yield
+
+    async def close(self):
+        pass
+
+
+def _from_millis(value) -> datetime:
+    return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _to_millis(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def kline_candle(symbol: str, open_time, open_price, high_price, low_price, close_price, volume) -> dict:
+    return {
+        "symbol": symbol,
+        "date": _from_millis(open_time),
+        "open_price": open_price,
+        "close_price": close_price,
+        "high_price": high_price,
+        "low_price": low_price,
+        "volume": volume,
+    }
+
+
+class KlinesRestFeed(FeedAdapter):
+    """GET `url`?symbol=&interval=&startTime=&endTime=&limit= trả về mảng kline
+    [open_time_ms, open, high, low, close, volume, ...]."""
+
+    kind = "rest"
+    can_fetch = True
+
+    def __init__(self, name: str, url: str, page_size: int = 1000, **options):
+        super().__init__(name, **options)
+        self.url = url
+        self.page_size = page_size
+        self.client = httpx.AsyncClient(timeout=config.FEED_HTTP_TIMEOUT)
+
+    async def fetch(self, symbol: str, start: datetime, end: datetime) -> list:
+        candles = []
+        while start < end:
+            await self.throttle()
+            response = await self.client.get(
+                self.url,
+                params={
+                    "symbol": self.symbols[symbol],
+                    "interval": self.interval,
+                    "startTime": _to_millis(start),
+                    "endTime": _to_millis(end) - 1,
+                    "limit": self.page_size,
+                },
+            )
+            response.raise_for_status()
+            page = response.json()
+            candles.extend(kline_candle(symbol, *row[:6]) for row in page)
+            if len(page) < self.page_size:
+                break
+            start = candles[-1]["date"] + self.step
+        return candles
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class KlinesWebSocketFeed(FeedAdapter):
+    """Luồng kline kết hợp `url`?streams=<mã>@kline_<interval>/...; chỉ ghi nến đã đóng (`k.x`),
+    các cập nhật của nến đang chạy bị bỏ qua. `rest_url` (tùy chọn) dùng để bù khoảng trống khi
+    luồng bị đứt."""
+
+    kind = "websocket"
+    can_stream = True
+
+    def __init__(self, name: str, url: str, rest_url: str = None, page_size: int = 1000, **options):
+        super().__init__(name, **options)
+        self.url = url
+        self.rest = KlinesRestFeed(name, rest_url, page_size=page_size, **options) if rest_url else None
+        self.can_fetch = self.rest is not None
+        self._symbols_by_code = {code.lower(): symbol for symbol, code in self.symbols.items()}
+
+    async def fetch(self, symbol: str, start: datetime, end: datetime) -> list:
+        return await self.rest.fetch(symbol, start, end)
+
+    async def stream(self):
+        streams = "/".join(f"{code.lower()}@kline_{self.interval}" for code in self.symbols.values())
+        async with websockets.connect(f"{self.url}?streams={streams}", max_size=1 << 20) as connection:
+            async for message in connection:
+                data = orjson.loads(message).get("data") or {}
+                kline = data.get("k")
+                # Nến đang chạy cập nhật mỗi tick: ghi từng bản sẽ ghi đè cùng một dòng liên tục
+                if data.get("e") != "kline" or not kline or not kline.get("x"):
+                    continue
+                symbol = self._symbols_by_code.get(str(kline.get("s", "")).lower())
+                if symbol is not None:
+                    yield kline_candle(symbol, kline["t"], kline["o"], kline["h"], kline["l"], kline["c"], kline["v"])
+
+    async def close(self):
+        if self.rest is not None:
+            await self.rest.close()
+
+
+class FileFeed(FeedAdapter):
+    """Phát lại nến từ file NDJSON hoặc CSV (cùng định dạng với API nạp hàng loạt, thêm cột symbol).
+
+    speed=0 nạp nhanh nhất có thể; speed=N phát theo nhịp thời gian của dữ liệu, nhanh gấp N lần.
+    """
+
+    kind = "file"
+    finite = True
+    can_stream = True
+
+    def __init__(self, name: str, path: str, speed: float = 0, format: str = None, **options):
+        super().__init__(name, **options)
+        self.path = path
+        self.speed = speed
+        self.format = format or ("csv" if path.lower().endswith(".csv") else "ndjson")
+
+    async def _lines(self):
+        with open(self.path, encoding="utf-8") as file:
+            while True:
+                # Đọc từng khối trong thread: file lớn không chặn event loop
+                lines = await asyncio.to_thread(file.readlines, 1 << 16)
+                if not lines:
+                    return
+                for line in lines:
+                    yield line.rstrip("\r\n")
+
+    async def stream(self):
+        previous = None
+        async for line, record in ingest.iter_line_records(self._lines(), self.format):
+            if not isinstance(record, dict):
+                logger.warning("%s line %s: %s", self.name, line, record)
+                REJECTED.inc(feed=self.name)
+                continue
+            if self.symbols and record.get("symbol") not in self.symbols:
+                continue
+            if self.speed:
+                date = parse_date(record.get("date"))
+                if date is not None:
+                    if previous is not None and date > previous:
+                        await asyncio.sleep((date - previous).total_seconds() / self.speed)
+                    previous = date
+            yield record
+
+
+ADAPTERS = {adapter.kind: adapter for adapter in (KlinesRestFeed, KlinesWebSocketFeed, FileFeed)}
+
+
+def build_adapters(specs) -> list:
+    adapters = []
+    for spec in specs:
+        spec = dict(spec)
+        kind = spec.pop("adapter", None)
+        if kind not in ADAPTERS:
+            raise ValueError(f"Unknown feed adapter {kind!r}; expected one of {', '.join(ADAPTERS)}")
+        spec.setdefault("name", kind)
+        adapters.append(ADAPTERS[kind](**spec))
+    return adapters
+
+
+def load_adapters(path: str) -> list:
+    with open(path, encoding="utf-8") as file:
+        return build_adapters(json.load(file)["feeds"])
+
+
+# --- Truy vấn DB (đồng bộ, chạy trong thread) ---
+
+
+def asset_ids_for(db: Session, symbols) -> dict:
+    stmt = select(model.Asset.symbol, model.Asset.id).where(model.Asset.symbol.in_(list(symbols)))
+    return dict(db.execute(stmt).all())
+
+
+def latest_dates(db: Session, asset_ids) -> dict:
+    table = model.PriceHistory.__table__
+    stmt = (
+        select(table.c.asset_id, func.max(table.c.date))
+        .where(table.c.asset_id.in_(list(asset_ids)))
+        .group_by(table.c.asset_id)
+    )
+    return dict(db.execute(stmt).all())
+
+
+def find_gaps(db: Session, asset_id: int, step: timedelta, start: datetime, end: datetime = None) -> list:
+    """Các khoảng [từ, tới) thiếu nến giữa hai nến liên tiếp (cách nhau hơn `step`) trong [start, end)."""
+    table = model.PriceHistory.__table__
+    conditions = [table.c.asset_id == asset_id, table.c.date >= start]
+    if end is not None:
+        conditions.append(table.c.date < end)
+    ordered = (
+        select(table.c.date, func.lag(table.c.date).over(order_by=table.c.date).label("previous"))
+        .where(*conditions)
+        .subquery()
+    )
+    stmt = select(ordered.c.previous, ordered.c.date).where(ordered.c.date - ordered.c.previous > step)
+    return [(previous + step, date) for previous, date in db.execute(stmt)]
+
+
+def _run_db(function, *args):
+    db = database.SessionLocal()
+    try:
+        return function(db, *args)
+    finally:
+        db.close()
+
+
+# --- Tiến trình nạp ---
+
+
+class Ingestor:
+    """Chạy các adapter đồng thời, gom nến thành lô và ghi vào price_history.
+
+    Nguồn chỉ đẩy nến vào hàng đợi có giới hạn (đầy thì chờ, tạo áp lực ngược khi DB chậm);
+    một tác vụ ghi lấy tối đa `batch_size` nến hoặc chờ tối đa `flush_seconds` cho mỗi lô.
+    """
+
+    def __init__(
+        self,
+        adapters,
+        batch_size: int = config.FEED_BATCH_SIZE,
+        flush_seconds: float = config.FEED_FLUSH_SECONDS,
+        method: str = "copy",
+        write_attempts: int = 3,
+    ):
+        self.adapters = adapters
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.method = method
+        self.write_attempts = write_attempts
+        self.queue = asyncio.Queue(config.FEED_QUEUE_SIZE)
+        self.assets = {}  # symbol -> asset_id (None: không có trong DB)
+        self.latest = {}  # asset_id -> thời điểm nến mới nhất đã biết, để phát hiện khoảng trống
+        self.written = self.rejected = 0
+        self._known_assets = set()  # asset_id đã kiểm tra tồn tại (ingest.process_batch)
+        self._tasks = set()
+
+    async def resolve(self, symbols):
+        missing = [symbol for symbol in symbols if symbol not in self.assets]
+        if not missing:
+            return
+        found = await asyncio.to_thread(_run_db, asset_ids_for, missing)
+        for symbol in missing:
+            self.assets[symbol] = found.get(symbol)
+            if symbol not in found:
+                logger.warning("Feed symbol %s has no matching asset; its candles are skipped", symbol)
+        if found:
+            self.latest.update(await asyncio.to_thread(_run_db, latest_dates, found.values()))
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, adapter: FeedAdapter, candle: dict, live: bool = False):
+        """Đưa một nến vào hàng đợi ghi; nến trực tiếp (`live`) cách nến trước hơn một khung thì bù phần thiếu."""
+        RECEIVED.inc(feed=adapter.name)
+        asset_id = candle.get("asset_id")
+        if asset_id is None and candle.get("symbol") is not None:
+            await self.resolve([candle["symbol"]])
+            asset_id = self.assets[candle["symbol"]]
+        try:
+            asset_id = int(asset_id)
+        except (TypeError, ValueError):
+            REJECTED.inc(feed=adapter.name)
+            self.rejected += 1
+            return
+        date = parse_date(candle.get("date"))
+        if date is not None:
+            previous = self.latest.get(asset_id)
+            if previous is not None and date - previous > adapter.step:
+                GAPS.inc(feed=adapter.name)
+                if live and adapter.can_fetch and candle.get("symbol") in adapter.symbols:
+                    self._spawn(self.fetch(adapter, candle["symbol"], previous + adapter.step, date, backfill=True))
+            if previous is None or date > previous:
+                self.latest[asset_id] = date
+        await self.queue.put((adapter.name, time.monotonic(), {**candle, "asset_id": asset_id}))
+
+    async def fetch(self, adapter: FeedAdapter, symbol: str, start: datetime, end: datetime, backfill: bool = False):
+        async with adapter.concurrency:
+            started = time.perf_counter()
+            try:
+                candles = await adapter.fetch(symbol, start, end)
+            except Exception:
+                ERRORS.inc(feed=adapter.name, stage="fetch")
+                logger.exception("Feed %s failed to fetch %s from %s to %s", adapter.name, symbol, start, end)
+                return
+            finally:
+                FETCH_SECONDS.observe(time.perf_counter() - started, feed=adapter.name)
+        if backfill:
+            BACKFILLED.inc(len(candles), feed=adapter.name)
+        for candle in candles:
+            await self.submit(adapter, candle)
+
+    async def backfill(self, adapter: FeedAdapter):
+        """Bù khoảng trống trong FEED_BACKFILL_DAYS: giữa các nến đã có và từ nến cuối tới hiện tại."""
+        now = utcnow()
+        since = now - timedelta(days=config.FEED_BACKFILL_DAYS)
+        jobs = []
+        for symbol in adapter.symbols:
+            asset_id = self.assets.get(symbol)
+            if asset_id is None:
+                continue
+            gaps = await asyncio.to_thread(_run_db, find_gaps, asset_id, adapter.step, since)
+            GAPS.inc(len(gaps), feed=adapter.name)
+            latest = self.latest.get(asset_id)
+            # Nến cuối có thể chưa đóng khi được ghi: lấy lại từ chính nến đó
+            gaps.append((max(latest, since) if latest is not None else since, now))
+            jobs.extend(self.fetch(adapter, symbol, start, end, backfill=True) for start, end in gaps)
+        await asyncio.gather(*jobs)
+
+    async def poll(self, adapter: FeedAdapter):
+        """Nguồn chỉ có fetch: định kỳ lấy nến từ nến mới nhất đã biết tới hiện tại."""
+        await self.backfill(adapter)
+        while True:
+            await asyncio.sleep(adapter.poll_seconds)
+            now = utcnow()
+            jobs = []
+            for symbol in adapter.symbols:
+                asset_id = self.assets.get(symbol)
+                if asset_id is not None:
+                    start = self.latest.get(asset_id, now - adapter.step)
+                    jobs.append(self.fetch(adapter, symbol, start, now))
+            await asyncio.gather(*jobs)
+
+    async def consume(self, adapter: FeedAdapter):
+        """Nguồn có stream: nhận nến liên tục; lỗi thì chờ rồi kết nối lại và bù phần đã lỡ."""
+        while True:
+            try:
+                if adapter.can_fetch:
+                    await self.backfill(adapter)
+                async for candle in adapter.stream():
+                    await self.submit(adapter, candle, live=True)
+                if adapter.finite:
+                    return
+                logger.warning("Feed %s stream ended; reconnecting", adapter.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                ERRORS.inc(feed=adapter.name, stage="stream")
+                logger.exception("Feed %s stream failed", adapter.name)
+                if adapter.finite:
+                    return
+            await asyncio.sleep(config.FEED_RECONNECT_SECONDS)
+
+    async def write_loop(self):
+        """Gom và ghi lô cho tới khi nhận None (mọi nguồn hữu hạn đã xong)."""
+        done = False
+        while not done:
+            batch = []
+            item = await self.queue.get()
+            deadline = time.monotonic() + self.flush_seconds
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                if not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            done = item is None
+            QUEUED.set(self.queue.qsize())
+            if batch:
+                await self.write(batch)
+
+    def _write_rows(self, records):
+        db = database.SessionLocal()
+        try:
+            method = ingest.resolve_method(db, self.method)
+            return ingest.process_batch(db, records, None, self._known_assets, method)
+        finally:
+            db.close()
+
+    def _rewind(self, batch):
+        """Lô bị bỏ sau lần ghi cuối thất bại: lùi `latest` về trước nến sớm nhất bị bỏ của mỗi asset.
+
+        Lần poll kế tiếp lấy lại từ đó; với nguồn stream, nến trực tiếp tới sau bị xem là cách
+        khoảng trống và phần bị bỏ được bù như mọi khoảng trống khác.
+        """
+        steps = {adapter.name: adapter.step for adapter in self.adapters}
+        resume = {}
+        for feed, _, row in batch:
+            date = parse_date(row.get("date"))
+            if date is not None:
+                date -= steps.get(feed, timedelta(0))
+                if row["asset_id"] not in resume or date < resume[row["asset_id"]]:
+                    resume[row["asset_id"]] = date
+        for asset_id, date in resume.items():
+            latest = self.latest.get(asset_id)
+            if latest is None or date < latest:
+                self.latest[asset_id] = date
+        logger.warning("Dropped %d candles after %d failed writes; will refetch them", len(batch), self.write_attempts)
+
+    async def write(self, batch):
+        records = [(feed, row) for feed, _, row in batch]
+        for attempt in range(1, self.write_attempts + 1):
+            started = time.perf_counter()
+            try:
+                _, rejects = await asyncio.to_thread(self._write_rows, records)
+                break
+            except Exception:
+                for feed in {feed for feed, _ in records}:
+                    ERRORS.inc(feed=feed, stage="write")
+                logger.exception("Failed to write %d candles (attempt %d)", len(batch), attempt)
+                if attempt == self.write_attempts:
+                    self._rewind(batch)
+                    return
+                await asyncio.sleep(config.FEED_RECONNECT_SECONDS)
+        WRITE_SECONDS.observe(time.perf_counter() - started)
+
+        committed = time.monotonic()
+        rejected = {}
+        for reject in rejects:
+            rejected[reject["line"]] = rejected.get(reject["line"], 0) + 1
+        received, asset_ids = {}, set()
+        for feed, received_at, row in batch:
+            received[feed] = min(received.get(feed, received_at), received_at)
+            asset_ids.add(row["asset_id"])
+            date = parse_date(row.get("date"))
+            if date is not None and (feed not in _newest or date > _newest[feed]):
+                _newest[feed] = date
+        for feed, oldest in received.items():
+            count = sum(1 for item in batch if item[0] == feed) - rejected.get(feed, 0)
+            WRITTEN.inc(count, feed=feed)
+            REJECTED.inc(rejected.get(feed, 0), feed=feed)
+            WRITE_LAG.observe(committed - oldest, feed=feed)
+            self.written += count
+        self.rejected += len(rejects)
+        # Thế hệ tag chỉ tới được các worker API qua backend chung (CACHE_REDIS_URL); không có thì
+        # cache response ở đó tự hết hạn sau RESPONSE_CACHE_TTL, ETag vẫn đổi theo asset.prices_updated_at
+        if response_cache.responses.shared is not None:
+            await response_cache.responses.invalidate(*(f"prices:{asset_id}" for asset_id in sorted(asset_ids)))
+
+    async def run(self, metrics_port: int = 0):
+        server = await serve_metrics(metrics_port) if metrics_port else None
+        if response_cache.responses.shared is None:
+            logger.warning(
+                "CACHE_REDIS_URL is not set: API workers serve cached price responses for up to %ss after new candles",
+                config.RESPONSE_CACHE_TTL,
+            )
+        writer = asyncio.get_running_loop().create_task(self.write_loop())
+        try:
+            await self.resolve({symbol for adapter in self.adapters for symbol in adapter.symbols})
+            await asyncio.gather(
+                *(
+                    self.consume(adapter) if adapter.can_stream else self.poll(adapter)
+                    for adapter in self.adapters
+                )
+            )
+            # Chỉ tới đây khi mọi nguồn đều hữu hạn: chờ các lần bù còn chạy rồi ghi nốt hàng đợi
+            while self._tasks:
+                await asyncio.gather(*self._tasks)
+            await self.queue.put(None)
+            await writer
+        finally:
+            writer.cancel()
+            for task in self._tasks:
+                task.cancel()
+            for adapter in self.adapters:
+                await adapter.close()
+            if server is not None:
+                server.close()
+
+
+async def serve_metrics(port: int):
+    """HTTP tối giản: mọi request đều nhận /metrics (text exposition của Prometheus)."""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = metrics.render().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {metrics.CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "0.0.0.0", port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nạp giá thị trường từ các nguồn vào price_history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="Chạy các nguồn trong file cấu hình (không dừng)")
+    run.add_argument("--config", default=config.FEEDS_CONFIG)
+    replay = subparsers.add_parser("replay", help="Nạp nến từ file NDJSON/CSV rồi thoát")
+    replay.add_argument("path")
+    replay.add_argument("--speed", type=float, default=0, help="0: nhanh nhất có thể; N: nhanh gấp N lần nhịp dữ liệu")
+    replay.add_argument("--format", choices=("ndjson", "csv"))
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        setup_logging()
+        ingestor = Ingestor(load_adapters(args.config))
+        asyncio.run(ingestor.run(metrics_port=config.FEED_METRICS_PORT))
+        return 0
+
+    ingestor = Ingestor([FileFeed("replay", args.path, speed=args.speed, format=args.format)])
+    started = time.perf_counter()
+    asyncio.run(ingestor.run())
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {ingestor.written} candles in {elapsed:.1f}s, rejected {ingestor.rejected}")
+    return 1 if ingestor.rejected else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
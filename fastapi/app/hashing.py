@@ -0,0 +1,70 @@
+# app/hashing.py
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app import config
+
+# Module này được import lại trong tiến trình con: chỉ phụ thuộc passlib và config
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=config.BCRYPT_ROUNDS)
+
+_executor = None
+_pending = 0
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str):
+    """Trả về (hợp lệ, hash mới). Hash mới khác None khi tham số băm đã đổi (pwd_context.needs_update)."""
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    if pwd_context.needs_update(hashed_password):
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: không fork tiến trình đang chạy event loop và các thread của server
+        _executor = ProcessPoolExecutor(
+            max_workers=config.PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _submit(fn, *args):
+    global _pending
+    if _pending >= config.PASSWORD_HASH_MAX_PENDING:
+        # Hàng đợi đầy: từ chối sớm thay vì để request chờ lâu rồi timeout
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _submit(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    return await _submit(verify_password, plain_password, hashed_password)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
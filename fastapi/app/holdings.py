@@ -0,0 +1,274 @@
+# app/holdings.py
+"""Bảng ảnh chụp vị thế (portfolio_holding) được cập nhật tăng dần.
+
+Giá vốn theo bình quân gia quyền di động: mua cộng khối lượng và tiền vào giá vốn, bán trừ
+phần giá vốn theo giá bình quân tại thời điểm bán. Kết quả phụ thuộc thứ tự giao dịch nên
+mỗi vị thế lưu kèm giao dịch cuối cùng đã cộng vào: giao dịch mới hơn (trường hợp thường gặp)
+chỉ cộng tiếp từ trạng thái đã lưu; giao dịch ghi lùi ngày, bị sửa hoặc xóa thì phát lại nhật
+ký giao dịch của cặp (portfolio, asset) đó. Cả hai đường dùng chung hàm fold nên luôn khớp
+từng chữ số với lần phát lại toàn bộ nhật ký, trong cùng giao dịch DB với bảng transaction.
+
+Kiểm tra sai lệch và dựng lại từ nhật ký giao dịch:
+    python -m app.holdings check [--portfolio-id 1]
+    python -m app.holdings rebuild [--portfolio-id 1]
+"""
+import argparse
+import decimal
+import itertools
+from datetime import datetime
+
+from sqlalchemy import Integer, String, cast, column, delete, func, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import database, model, valuation
+
+SNAPSHOT_COLUMNS = ("quantity", "cost_basis", "realized_pnl")
+POSITION_COLUMNS = ("last_transaction_date", "last_transaction_id")
+
+_ZERO = decimal.Decimal(0)
+_SCALE = decimal.Decimal("1e-8")  # Thang số của các cột Numeric(.., 8)
+_CONTEXT = decimal.Context(prec=80)  # Đủ chữ số cho tích hai giá trị Numeric(38, 8) trước khi làm tròn
+
+# Kênh NOTIFY báo vị thế của danh mục thay đổi (payload: portfolio_id); app.live_valuation
+# nạp lại định giá của các danh mục đang được theo dõi. Tin chỉ được gửi khi giao dịch DB commit.
+NOTIFY_CHANNEL = "portfolio_holdings"
+
+
+def notify_statement(portfolio_ids):
+    """SELECT pg_notify(...) cho mỗi danh mục trong `portfolio_ids`."""
+    ids = values(column("portfolio_id", Integer), name="portfolios").data(
+        [(portfolio_id,) for portfolio_id in sorted(set(portfolio_ids))]
+    )
+    return select(func.pg_notify(NOTIFY_CHANNEL, cast(ids.c.portfolio_id, String)))
+
+
+def ledger_select(*conditions):
+    """Giao dịch mua/bán thỏa `conditions` theo thứ tự phát lại (portfolio, asset, thời gian, id)."""
+    tx = model.Transaction.__table__
+    side = valuation.side_expression(tx.c.transaction_type)
+    return (
+        select(
+            tx.c.portfolio_id,
+            tx.c.asset_id,
+            tx.c.transaction_date,
+            tx.c.id,
+            side.label("side"),
+            tx.c.quantity,
+            # Làm tròn theo từng giao dịch về đúng thang số của cột để cộng dồn và phát lại khớp nhau
+            func.round(tx.c.quantity * tx.c.price, 8).label("amount"),
+        )
+        .where(side != 0, *conditions)
+        .order_by(tx.c.portfolio_id, tx.c.asset_id, tx.c.transaction_date, tx.c.id)
+    )
+
+
+def fold(state, rows):
+    """Cộng các giao dịch (side, khối lượng, thành tiền) vào (khối lượng, giá vốn, lãi/lỗ đã thực hiện).
+
+    Bán không đổi giá bình quân: giá vốn phần bán = giá vốn * khối lượng bán / khối lượng đang giữ,
+    chênh lệch với tiền bán là lãi/lỗ đã thực hiện. Bán hết đưa giá vốn về 0 nên lần mua lại bắt đầu
+    giá bình quân mới. Giả định khối lượng nắm giữ không bao giờ âm (không bán khống).
+    """
+    quantity, cost_basis, realized_pnl = state
+    with decimal.localcontext(_CONTEXT):
+        for side, traded, amount in rows:
+            if side > 0:
+                quantity += traded
+                cost_basis += amount
+                continue
+            cost_of_sold = _ZERO
+            if quantity > 0:
+                cost_of_sold = (cost_basis * min(traded, quantity) / quantity).quantize(_SCALE)
+            quantity -= traded
+            cost_basis -= cost_of_sold
+            realized_pnl += amount - cost_of_sold
+    return quantity, cost_basis, realized_pnl
+
+
+def _position(date, transaction_id):
+    return (date or datetime.min, transaction_id)
+
+
+def _by_pair(rows):
+    """Nhóm các dòng của ledger_select theo (portfolio_id, asset_id)."""
+    for pair, group in itertools.groupby(rows, key=lambda row: (row.portfolio_id, row.asset_id)):
+        yield pair, list(group)
+
+
+def _snapshot(state, rows) -> dict:
+    quantity, cost_basis, realized_pnl = fold(state, ((row.side, row.quantity, row.amount) for row in rows))
+    return {
+        "quantity": quantity,
+        "cost_basis": cost_basis,
+        "realized_pnl": realized_pnl,
+        "last_transaction_date": rows[-1].transaction_date,
+        "last_transaction_id": rows[-1].id,
+    }
+
+
+def replay(db: Session, *conditions) -> dict:
+    """Phát lại nhật ký giao dịch thỏa `conditions`: {(portfolio_id, asset_id): vị thế}."""
+    rows = db.execute(ledger_select(*conditions))
+    return {pair: _snapshot((_ZERO, _ZERO, _ZERO), group) for pair, group in _by_pair(rows)}
+
+
+def _pair_condition(columns, pairs):
+    return tuple_(columns.portfolio_id, columns.asset_id).in_(sorted(pairs))
+
+
+def _write(db: Session, snapshots: dict, removed=()):
+    table = model.PortfolioHolding.__table__
+    if snapshots:
+        stmt = pg_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["portfolio_id", "asset_id"],
+            set_={
+                **{name: stmt.excluded[name] for name in (*SNAPSHOT_COLUMNS, *POSITION_COLUMNS)},
+                "updated_at": func.now(),
+            },
+        )
+        db.execute(
+            stmt,
+            [
+                {"portfolio_id": portfolio_id, "asset_id": asset_id, **snapshot}
+                for (portfolio_id, asset_id), snapshot in snapshots.items()
+            ],
+        )
+    if removed:
+        # Vị thế không còn giao dịch mua/bán nào thì xóa hẳn
+        db.execute(delete(table).where(_pair_condition(table.c, removed)))
+
+
+def apply_transaction(db: Session, transaction_id: int, sign: int = 1):
+    """Cập nhật portfolio_holding sau khi thêm (sign=1) hoặc trước khi bỏ (sign=-1) một giao dịch.
+
+    Gọi sau khi giao dịch đã được flush (khi tạo/sửa) hoặc trước khi xóa; không commit.
+    """
+    apply_transactions(db, [transaction_id], sign=sign)
+
+
+def apply_transactions(db: Session, transaction_ids, sign: int = 1):
+    """Như apply_transaction nhưng cho một lô giao dịch, mỗi cặp (portfolio, asset) ghi một lần.
+
+    Cũng cập nhật portfolio.updated_at (validator HTTP của API đọc danh mục) cho mọi giao dịch
+    trong lô, kể cả loại không làm đổi vị thế. UPDATE này khóa dòng portfolio tới hết giao dịch DB
+    nên các lần cập nhật vị thế đồng thời của cùng danh mục được tuần tự hóa.
+    """
+    if not transaction_ids:
+        return
+    table = model.PortfolioHolding.__table__
+    tx = model.Transaction.__table__
+    portfolio = model.Portfolio.__table__
+    db.execute(
+        update(portfolio)
+        .where(portfolio.c.id.in_(select(tx.c.portfolio_id).where(tx.c.id.in_(transaction_ids))))
+        .values(updated_at=func.now())
+    )
+    batch = dict(_by_pair(db.execute(ledger_select(tx.c.id.in_(transaction_ids)))))
+    if not batch:
+        return
+
+    snapshots, stale = {}, set(batch)
+    if sign > 0:
+        stored = {
+            (row.portfolio_id, row.asset_id): row
+            for row in db.execute(select(table).where(_pair_condition(table.c, batch)))
+        }
+        for pair, rows in batch.items():
+            current = stored.get(pair)
+            if current is None:
+                snapshots[pair] = _snapshot((_ZERO, _ZERO, _ZERO), rows)
+            elif _position(current.last_transaction_date, current.last_transaction_id) < _position(
+                rows[0].transaction_date, rows[0].id
+            ):
+                snapshots[pair] = _snapshot(tuple(current._mapping[name] for name in SNAPSHOT_COLUMNS), rows)
+        stale -= snapshots.keys()
+    if stale:
+        # Ghi lùi ngày, sửa hoặc xóa: giá vốn của mọi giao dịch sau đó đổi theo, phát lại cả cặp
+        excluded = [tx.c.id.notin_(transaction_ids)] if sign < 0 else []
+        replayed = replay(db, _pair_condition(tx.c, stale), *excluded)
+        snapshots.update(replayed)
+        _write(db, snapshots, stale - replayed.keys())
+    else:
+        _write(db, snapshots)
+    db.execute(notify_statement(portfolio_id for portfolio_id, _ in batch))
+
+
+def check(db: Session, portfolio_id: int = None):
+    """So sánh portfolio_holding với kết quả phát lại nhật ký giao dịch.
+
+    Trả về danh sách các cặp (portfolio, asset) bị lệch kèm giá trị lưu và giá trị đúng.
+    """
+    table = model.PortfolioHolding.__table__
+    tx = model.Transaction.__table__
+    stmt = select(table)
+    conditions = []
+    if portfolio_id is not None:
+        stmt = stmt.where(table.c.portfolio_id == portfolio_id)
+        conditions.append(tx.c.portfolio_id == portfolio_id)
+    stored = {(row.portfolio_id, row.asset_id): row._mapping for row in db.execute(stmt)}
+    expected = replay(db, *conditions)
+
+    drift = []
+    for pair in sorted(stored.keys() | expected.keys()):
+        row = {"portfolio_id": pair[0], "asset_id": pair[1]}
+        for name in SNAPSHOT_COLUMNS:
+            row[f"stored_{name}"] = stored[pair][name] if pair in stored else None
+            row[f"expected_{name}"] = expected[pair][name] if pair in expected else None
+        if any((row[f"stored_{name}"] or 0) != (row[f"expected_{name}"] or 0) for name in SNAPSHOT_COLUMNS):
+            drift.append(row)
+    return drift
+
+
+def rebuild(db: Session, portfolio_id: int = None) -> int:
+    """Xóa và dựng lại portfolio_holding từ toàn bộ giao dịch; trả về số vị thế. Không commit."""
+    table = model.PortfolioHolding.__table__
+    tx = model.Transaction.__table__
+    stmt = delete(table)
+    conditions = []
+    if portfolio_id is not None:
+        stmt = stmt.where(table.c.portfolio_id == portfolio_id)
+        conditions.append(tx.c.portfolio_id == portfolio_id)
+    db.execute(stmt)
+    snapshots = replay(db, *conditions)
+    _write(db, snapshots)
+    return len(snapshots)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra và dựng lại bảng vị thế danh mục")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (
+        ("check", "Báo cáo các vị thế lệch so với nhật ký giao dịch"),
+        ("rebuild", "Dựng lại vị thế từ nhật ký giao dịch"),
+    ):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("--portfolio-id", type=int)
+    args = parser.parse_args(argv)
+
+    db = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            count = rebuild(db, args.portfolio_id)
+            db.commit()
+            print(f"Rebuilt {count} holdings from the transaction log")
+            return 0
+        drift = check(db, args.portfolio_id)
+        for row in drift:
+            print(
+                f"Portfolio {row['portfolio_id']} asset {row['asset_id']}: "
+                + ", ".join(
+                    f"{column} {row[f'stored_{column}']} != {row[f'expected_{column}']}"
+                    for column in SNAPSHOT_COLUMNS
+                    if (row[f"stored_{column}"] or 0) != (row[f"expected_{column}"] or 0)
+                )
+            )
+        print(f"{len(drift)} holdings out of sync")
+        return 1 if drift else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
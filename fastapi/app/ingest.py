@@ -0,0 +1,465 @@
+# app/ingest.py
+import csv
+import json
+import math
+import time
+from datetime import timezone
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import config, crud, holdings, model, valuation
+from app.schemas import PriceHistoryBulkItem, TransactionBulkItem
+
+FORMATS = ("json", "ndjson", "csv")
+METHODS = ("copy", "insert")
+
+# Content-Type -> định dạng dữ liệu đầu vào
+CONTENT_TYPES = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+    "application/csv": "csv",
+}
+
+# Tên cột CSV viết tắt -> tên trường trong PriceHistory
+CSV_ALIASES = {
+    "timestamp": "date",
+    "time": "date",
+    "open": "open_price",
+    "close": "close_price",
+    "high": "high_price",
+    "low": "low_price",
+}
+
+# Tên cột thường gặp trong file xuất lệnh khớp của các sàn -> tên trường giao dịch
+TRANSACTION_CSV_ALIASES = {
+    "side": "transaction_type",
+    "type": "transaction_type",
+    "qty": "quantity",
+    "amount": "quantity",
+    "size": "quantity",
+    "date": "transaction_date",
+    "time": "transaction_date",
+    "timestamp": "transaction_date",
+    "trade_id": "external_id",
+    "tradeid": "external_id",
+    "txid": "external_id",
+    "id": "external_id",
+    "asset": "symbol",
+    "coin": "symbol",
+}
+
+# Giới hạn phần nguyên của các cột Numeric(18, 8) và Numeric(28, 8)
+# Số dòng vật lý tối đa của một bản ghi CSV (trường trong ngoặc kép chứa xuống dòng, ví dụ ghi chú)
+CSV_MAX_RECORD_LINES = 100
+
+FIELD_LIMITS = {
+    "open_price": 10**10,
+    "close_price": 10**10,
+    "high_price": 10**10,
+    "low_price": 10**10,
+    "volume": 10**20,
+}
+
+
+def detect_format(content_type: str = None, fmt: str = None) -> str:
+    """Xác định định dạng dữ liệu từ tham số `format` hoặc header Content-Type."""
+    if fmt:
+        if fmt not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+        return fmt
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type not in CONTENT_TYPES:
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported content type: {media_type}"
+        )
+    return CONTENT_TYPES[media_type]
+
+
+def resolve_method(db: Session, method: str) -> str:
+    """COPY chỉ dùng được với PostgreSQL qua psycopg2/psycopg, còn lại dùng INSERT nhiều dòng."""
+    if method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"Unsupported method: {method}")
+    dialect = db.get_bind().dialect
+    if method == "copy" and (
+        dialect.name != "postgresql" or dialect.driver not in ("psycopg2", "psycopg")
+    ):
+        return "insert"
+    return method
+
+
+async def iter_lines(chunks):
+    """Tách luồng bytes thành từng dòng văn bản mà không đọc toàn bộ body vào bộ nhớ."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def iter_records(request: Request, fmt: str, aliases: dict = CSV_ALIASES):
+    """Sinh các cặp (số dòng, bản ghi) từ body; bản ghi lỗi cú pháp được trả về dạng Exception."""
+    if fmt == "json":
+        try:
+            data = json.loads(await request.body())
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {exc}")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array")
+        for index, item in enumerate(data, start=1):
+            yield index, item
+        return
+
+    async for item in iter_line_records(iter_lines(request.stream()), fmt, aliases):
+        yield item
+
+
+def csv_record_complete(lines) -> bool:
+    """Các dòng đã đủ một bản ghi CSV chưa: trường trong ngoặc kép còn mở thì cần đọc thêm dòng."""
+    try:
+        for _ in csv.reader(lines, strict=True):
+            pass
+    except csv.Error as exc:
+        return "unexpected end of data" not in str(exc)
+    return True
+
+
+async def iter_line_records(lines, fmt: str, aliases: dict = CSV_ALIASES):
+    """Như iter_records cho NDJSON/CSV, từ một async iterable các dòng (body request, file).
+
+    Bản ghi CSV có thể trải trên nhiều dòng; số dòng trả về là dòng đầu của bản ghi.
+    """
+    header = None
+    line_no = start = 0
+    pending = []  # CSV: các dòng của bản ghi đang đọc dở
+    async for line in lines:
+        line_no += 1
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as exc:
+                yield line_no, exc
+            continue
+        if not pending:
+            if not line.strip():
+                continue
+            start = line_no
+        pending.append(line + "\n")
+        if ('"' in line or len(pending) > 1) and not csv_record_complete(pending):
+            if len(pending) < CSV_MAX_RECORD_LINES:
+                continue
+            yield start, ValueError(f"Unterminated quoted field spanning {len(pending)} lines")
+            pending = []
+            continue
+        values = next(csv.reader(pending))
+        pending = []
+        if header is None:
+            header = [
+                aliases.get(name.strip().lower(), name.strip().lower())
+                for name in values
+            ]
+            continue
+        if len(values) != len(header):
+            yield start, ValueError(
+                f"Expected {len(header)} columns, got {len(values)}"
+            )
+            continue
+        yield start, {
+            name: (value if value != "" else None) for name, value in zip(header, values)
+        }
+    if pending:
+        yield start, ValueError("Unterminated quoted field")
+
+
+def validate_record(record, asset_id: int = None) -> dict:
+    """Kiểm tra một bản ghi và trả về dict sẵn sàng để ghi vào price_history."""
+    if isinstance(record, Exception):
+        raise ValueError(str(record))
+    if not isinstance(record, dict):
+        raise ValueError("Expected an object")
+    item = PriceHistoryBulkItem(**record)
+    row = item.model_dump()
+    if asset_id is not None:
+        if row["asset_id"] is not None and row["asset_id"] != asset_id:
+            raise ValueError("asset_id does not match the asset in the URL")
+        row["asset_id"] = asset_id
+    elif row["asset_id"] is None:
+        raise ValueError("asset_id is required")
+
+    for field, limit in FIELD_LIMITS.items():
+        value = row[field]
+        if value is not None and (not math.isfinite(value) or abs(value) >= limit):
+            raise ValueError(f"{field} is out of range")
+    if (
+        row["high_price"] is not None
+        and row["low_price"] is not None
+        and row["high_price"] < row["low_price"]
+    ):
+        raise ValueError("high_price must be greater than or equal to low_price")
+    if row["date"].tzinfo is not None:
+        # Cột date lưu thời gian UTC không kèm múi giờ
+        row["date"] = row["date"].astimezone(timezone.utc).replace(tzinfo=None)
+    return row
+
+
+def reject_message(exc: Exception) -> str:
+    """Thông báo lỗi gọn cho một dòng bị loại (ValidationError -> "trường: lỗi")."""
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+            for err in exc.errors()
+        )
+    return str(exc)
+
+
+def process_batch(
+    db: Session,
+    batch,
+    asset_id,
+    known_assets: set,
+    method: str,
+    refresh_rollups: bool = True,
+):
+    """Kiểm tra và ghi một lô bản ghi; trả về (số dòng đã ghi, danh sách dòng lỗi)."""
+    rows = []
+    rejects = []
+    for line, record in batch:
+        try:
+            rows.append((line, validate_record(record, asset_id)))
+        except (ValueError, TypeError) as exc:
+            rejects.append({"line": line, "error": reject_message(exc)})
+
+    # Tra cứu các asset chưa biết bằng một truy vấn cho cả lô
+    unknown = {row["asset_id"] for _, row in rows} - known_assets
+    if unknown:
+        found = db.query(model.Asset.id).filter(model.Asset.id.in_(unknown)).all()
+        known_assets.update(asset for (asset,) in found)
+        missing = unknown - known_assets
+        if missing:
+            rejects.extend(
+                {"line": line, "error": f"Asset {row['asset_id']} not found"}
+                for line, row in rows
+                if row["asset_id"] in missing
+            )
+            rows = [(line, row) for line, row in rows if row["asset_id"] not in missing]
+
+    rows = [row for _, row in rows]
+    if method == "copy":
+        loaded = crud.copy_price_history(db, rows, refresh_rollups=refresh_rollups)
+    else:
+        loaded = crud.upsert_price_history(db, rows, refresh_rollups=refresh_rollups)
+    return loaded, rejects
+
+
+async def ingest_price_history(
+    db: Session,
+    request: Request,
+    asset_id: int = None,
+    fmt: str = None,
+    method: str = "copy",
+    refresh_rollups: bool = True,
+) -> dict:
+    """Nạp nến giá hàng loạt từ JSON array, NDJSON hoặc CSV theo từng lô.
+
+    Khi backfill khối lượng lớn có thể tắt `refresh_rollups` rồi chạy
+    `python -m app.rollups rebuild --asset-id ...` sau khi nạp xong.
+    """
+    fmt = detect_format(request.headers.get("content-type"), fmt)
+    method = resolve_method(db, method)
+    known_assets = set() if asset_id is None else {asset_id}
+
+    started = time.perf_counter()
+    received = loaded = rejected = 0
+    rejected_rows = []
+    batch = []
+
+    async def flush():
+        nonlocal loaded, rejected
+        batch_loaded, batch_rejects = await run_in_threadpool(
+            process_batch, db, batch, asset_id, known_assets, method, refresh_rollups
+        )
+        loaded += batch_loaded
+        rejected += len(batch_rejects)
+        room = config.BULK_INGEST_MAX_REJECTS_REPORTED - len(rejected_rows)
+        rejected_rows.extend(batch_rejects[: max(room, 0)])
+        batch.clear()
+
+    async for line, record in iter_records(request, fmt):
+        received += 1
+        batch.append((line, record))
+        if len(batch) >= config.BULK_INGEST_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "method": method,
+        "received": received,
+        "loaded": loaded,
+        "rejected": rejected,
+        "rejected_rows": rejected_rows,
+        "elapsed_seconds": round(elapsed, 6),
+        "rows_per_second": round(loaded / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def validate_transaction_record(record) -> dict:
+    """Kiểm tra một giao dịch nhập từ file; trả về dict (asset chưa được phân giải)."""
+    if isinstance(record, Exception):
+        raise ValueError(str(record))
+    if not isinstance(record, dict):
+        raise ValueError("Expected an object")
+    row = TransactionBulkItem(**record).model_dump()
+    if row["asset_id"] is None and not row["symbol"]:
+        raise ValueError("asset_id or symbol is required")
+    if valuation.transaction_side(row["transaction_type"]) == 0:
+        raise ValueError(f"Unsupported transaction_type: {row['transaction_type']}")
+    for field in ("quantity", "price"):
+        if not math.isfinite(row[field]) or row[field] >= 10**10:
+            raise ValueError(f"{field} is out of range")
+    if row["transaction_date"] is not None and row["transaction_date"].tzinfo is not None:
+        row["transaction_date"] = (
+            row["transaction_date"].astimezone(timezone.utc).replace(tzinfo=None)
+        )
+    return row
+
+
+def resolve_assets(db: Session, rows, known_assets: dict, known_ids: set):
+    """Phân giải symbol -> asset_id cho cả lô bằng một truy vấn; trả về các dòng không tìm thấy."""
+    symbols = {row["symbol"].upper() for _, row in rows if row["asset_id"] is None}
+    symbols -= known_assets.keys()
+    if symbols:
+        found = db.query(func.upper(model.Asset.symbol), model.Asset.id).filter(
+            func.upper(model.Asset.symbol).in_(symbols)
+        )
+        known_assets.update(found.all())
+    ids = {row["asset_id"] for _, row in rows if row["asset_id"] is not None} - known_ids
+    if ids:
+        found = db.query(model.Asset.id).filter(model.Asset.id.in_(ids)).all()
+        known_ids.update(asset for (asset,) in found)
+
+    resolved, rejects = [], []
+    for line, row in rows:
+        if row["asset_id"] is None:
+            row["asset_id"] = known_assets.get(row["symbol"].upper())
+            if row["asset_id"] is None:
+                rejects.append({"line": line, "error": f"Asset {row['symbol']} not found"})
+                continue
+        elif row["asset_id"] not in known_ids:
+            rejects.append({"line": line, "error": f"Asset {row['asset_id']} not found"})
+            continue
+        resolved.append(row)
+    return resolved, rejects
+
+
+def insert_transactions(db: Session, portfolio_id: int, rows) -> int:
+    """Ghi một lô giao dịch; external_id đã có trong danh mục thì bỏ qua. Trả về số dòng đã ghi.
+
+    Vị thế portfolio_holding được cập nhật cho đúng các dòng vừa ghi, cùng giao dịch DB.
+    """
+    if not rows:
+        return 0
+    table = model.Transaction.__table__
+    # NULL sẽ ghi đè server_default, nên điền sẵn thời điểm nhập theo đồng hồ của DB
+    if any(row["transaction_date"] is None for row in rows):
+        imported_at = db.execute(select(func.localtimestamp())).scalar()
+    stmt = (
+        pg_insert(table)
+        .on_conflict_do_nothing(index_elements=["portfolio_id", "external_id"])
+        .returning(table.c.id)
+    )
+    inserted_ids = []
+    for index in range(0, len(rows), crud.UPSERT_CHUNK_SIZE):
+        chunk = [
+            {
+                "portfolio_id": portfolio_id,
+                "asset_id": row["asset_id"],
+                "quantity": row["quantity"],
+                "price": row["price"],
+                "transaction_type": row["transaction_type"],
+                "transaction_date": row["transaction_date"] or imported_at,
+                "external_id": row["external_id"],
+            }
+            for row in rows[index : index + crud.UPSERT_CHUNK_SIZE]
+        ]
+        # executemany: câu lệnh được biên dịch một lần, gửi theo lô nhiều VALUES (insertmanyvalues)
+        inserted_ids.extend(db.execute(stmt, chunk).scalars().all())
+    holdings.apply_transactions(db, inserted_ids)
+    db.commit()
+    return len(inserted_ids)
+
+
+def process_transaction_batch(
+    db: Session, portfolio_id: int, batch, known_assets: dict, known_ids: set
+):
+    """Kiểm tra, phân giải asset và ghi một lô; trả về (số dòng hợp lệ, số dòng đã ghi, dòng lỗi)."""
+    rows, rejects = [], []
+    for line, record in batch:
+        try:
+            rows.append((line, validate_transaction_record(record)))
+        except (ValueError, TypeError) as exc:
+            rejects.append({"line": line, "error": reject_message(exc)})
+    rows, missing = resolve_assets(db, rows, known_assets, known_ids)
+    rejects.extend(missing)
+    return len(rows), insert_transactions(db, portfolio_id, rows), rejects
+
+
+async def ingest_transactions(
+    db: Session, request: Request, portfolio_id: int, fmt: str = None
+) -> dict:
+    """Nhập giao dịch hàng loạt (JSON array, NDJSON hoặc CSV) vào một danh mục theo từng lô.
+
+    Mỗi lô được commit riêng; nhờ external_id, nhập lại file sau khi lỗi giữa chừng
+    không tạo giao dịch trùng.
+    """
+    fmt = detect_format(request.headers.get("content-type"), fmt)
+    known_assets, known_ids = {}, set()
+
+    started = time.perf_counter()
+    received = valid = inserted = rejected = 0
+    rejected_rows = []
+    batch = []
+
+    async def flush():
+        nonlocal valid, inserted, rejected
+        batch_valid, batch_inserted, batch_rejects = await run_in_threadpool(
+            process_transaction_batch, db, portfolio_id, batch, known_assets, known_ids
+        )
+        valid += batch_valid
+        inserted += batch_inserted
+        rejected += len(batch_rejects)
+        room = config.BULK_INGEST_MAX_REJECTS_REPORTED - len(rejected_rows)
+        rejected_rows.extend(batch_rejects[: max(room, 0)])
+        batch.clear()
+
+    async for line, record in iter_records(request, fmt, TRANSACTION_CSV_ALIASES):
+        received += 1
+        batch.append((line, record))
+        if len(batch) >= config.BULK_INGEST_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "received": received,
+        "inserted": inserted,
+        "duplicates": valid - inserted,
+        "rejected": rejected,
+        "rejected_rows": rejected_rows,
+        "elapsed_seconds": round(elapsed, 6),
+        "rows_per_second": round(inserted / elapsed, 2) if elapsed > 0 else 0.0,
+    }
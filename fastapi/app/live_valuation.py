@@ -0,0 +1,302 @@
+# app/live_valuation.py
+"""Đẩy định giá danh mục (giá trị thị trường, lãi/lỗ) tới client khi có giá mới.
+
+Mỗi worker giữ định giá của các danh mục đang được theo dõi trong bộ nhớ, kèm chỉ mục ngược
+asset -> danh mục: một nến chỉ định giá lại các danh mục đang giữ asset đó, bằng cách tính
+lại vị thế của asset trong bộ nhớ (không truy vấn DB). Các nến tới dồn dập được gộp: danh mục
+bị đánh dấu và chỉ được cộng lại tổng, gửi tin sau mỗi LIVE_VALUATION_DEBOUNCE_SECONDS.
+
+Giao dịch làm đổi vị thế (app.holdings phát NOTIFY) thì danh mục được nạp lại từ DB.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import config, database, holdings, metrics, model, realtime, valuation
+
+logger = logging.getLogger(__name__)
+
+LOAD_CONCURRENCY = 4  # Số danh mục nạp lại đồng thời, tránh chiếm hết pool khi LISTEN lại
+
+
+async def load_valuation(portfolio_id: int, method: str) -> dict:
+    # Đọc từ primary: nạp lại ngay sau NOTIFY, replica có thể chưa có giao dịch vừa ghi
+    async with database.AsyncSessionLocal() as db:
+        return await db.run_sync(valuation.value_portfolio, portfolio_id, method=method)
+
+
+class _Tracked:
+    """Định giá đang giữ của một (danh mục, phương pháp) và các subscriber của nó."""
+
+    __slots__ = ("valuation", "holdings", "subscribers", "message")
+
+    def __init__(self):
+        self.valuation = None  # None cho tới lần nạp đầu
+        self.holdings = {}  # asset_id -> vị thế (dict trong valuation["holdings"])
+        self.subscribers = set()
+        self.message = None  # Tin gửi gần nhất, trả ngay cho subscriber mới
+
+
+class ValuationHub:
+    """Định giá theo thời gian thực; khóa theo dõi là (portfolio_id, method)."""
+
+    def __init__(self, load=load_valuation, debounce: float = config.LIVE_VALUATION_DEBOUNCE_SECONDS):
+        self._load = load
+        self.debounce = debounce
+        self._subscribers = set()
+        self._tracked = {}  # (portfolio_id, method) -> _Tracked
+        self._by_asset = {}  # asset_id -> set(khóa): chỉ các danh mục đang giữ asset
+        self._by_portfolio = {}  # portfolio_id -> set(khóa)
+        self._dirty = set()  # Giá đã đổi, chờ cộng lại tổng và gửi
+        self._stale = set()  # Vị thế đã đổi hoặc mới theo dõi, chờ nạp lại từ DB
+        self._recent = None  # Trong lúc nạp: asset_id -> (giá, thời điểm) của nến mới tới
+        self._flusher = None
+
+    def open(self, transport: str) -> realtime.Subscriber:
+        subscriber = realtime.Subscriber(transport)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def close(self, subscriber: realtime.Subscriber):
+        self.unsubscribe(subscriber, list(subscriber.topics))
+        self._subscribers.discard(subscriber)
+
+    def subscribe(self, subscriber: realtime.Subscriber, keys):
+        for key in keys:
+            tracked = self._tracked.get(key)
+            if tracked is None:
+                tracked = self._tracked[key] = _Tracked()
+                self._by_portfolio.setdefault(key[0], set()).add(key)
+                self._stale.add(key)
+                self._schedule()
+            elif tracked.message is not None:
+                subscriber.push(tracked.message)
+            tracked.subscribers.add(subscriber)
+            subscriber.topics.add(key)
+
+    def unsubscribe(self, subscriber: realtime.Subscriber, keys):
+        for key in keys:
+            subscriber.topics.discard(key)
+            tracked = self._tracked.get(key)
+            if tracked is None:
+                continue
+            tracked.subscribers.discard(subscriber)
+            if not tracked.subscribers:
+                self._untrack(key)
+
+    def _untrack(self, key):
+        tracked = self._tracked.pop(key)
+        self._reindex(key, tracked.holdings, ())
+        keys = self._by_portfolio[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_portfolio[key[0]]
+        self._dirty.discard(key)
+        self._stale.discard(key)
+
+    def _reindex(self, key, old_asset_ids, new_asset_ids):
+        for asset_id in old_asset_ids:
+            keys = self._by_asset.get(asset_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_asset[asset_id]
+        for asset_id in new_asset_ids:
+            self._by_asset.setdefault(asset_id, set()).add(key)
+
+    # --- Sự kiện từ app.realtime (gọi đồng bộ trong event loop) ---
+
+    def on_candle(self, candle: dict):
+        asset_id, price = candle.get("asset_id"), candle.get("close_price")
+        if price is None:
+            return
+        keys = self._by_asset.get(asset_id)
+        if not keys and self._recent is None:
+            return
+        date = datetime.fromisoformat(candle["date"])
+        if self._recent is not None:
+            seen = self._recent.get(asset_id)
+            if seen is None or date >= seen[1]:
+                self._recent[asset_id] = (price, date)
+        for key in keys or ():
+            holding = self._tracked[key].holdings[asset_id]
+            if holding["last_price_date"] is not None and date < holding["last_price_date"]:
+                continue  # Sửa nến cũ: giá cuối không đổi
+            valuation.reprice_holding(holding, price, date)
+            if key in self._dirty:
+                COALESCED.inc()
+            else:
+                self._dirty.add(key)
+        if keys:
+            self._schedule()
+
+    def on_holdings_changed(self, portfolio_id):
+        keys = self._by_portfolio.get(portfolio_id)
+        if keys:
+            self._stale |= keys
+            self._schedule()
+
+    def reload_all(self):
+        # Sau khi LISTEN lại: nến và thay đổi vị thế trong lúc mất kết nối đã bị lỡ
+        if self._tracked:
+            self._stale |= self._tracked.keys()
+            self._schedule()
+
+    # --- Gộp và gửi ---
+
+    def _schedule(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        # Cửa sổ cố định: sự kiện đầu tiên mở cửa sổ, mọi sự kiện tới trước khi hết cửa sổ đi chung một lần gửi
+        while self._dirty or self._stale:
+            await asyncio.sleep(self.debounce)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Live valuation flush failed")
+
+    async def flush(self):
+        stale, self._stale = self._stale, set()
+        dirty, self._dirty = self._dirty - stale, set()
+        if stale:
+            await self._reload(stale)
+        for key in dirty:
+            tracked = self._tracked.get(key)
+            if tracked is None or tracked.valuation is None:
+                continue
+            tracked.valuation = valuation.summarize(*key, tracked.valuation["holdings"])
+            RECOMPUTATIONS.inc(kind="reprice")
+            self._publish(tracked)
+
+    async def _reload(self, keys):
+        keys = list(keys)
+        limit = asyncio.Semaphore(LOAD_CONCURRENCY)
+
+        async def load(key):
+            async with limit:
+                return await self._load(*key)
+
+        self._recent = {}
+        try:
+            results = await asyncio.gather(*(load(key) for key in keys), return_exceptions=True)
+        finally:
+            recent, self._recent = self._recent, None
+        for key, result in zip(keys, results):
+            tracked = self._tracked.get(key)
+            if tracked is None:
+                continue  # Hủy theo dõi trong lúc nạp
+            if isinstance(result, Exception):
+                # Giữ định giá cũ; lỗi DB thường kèm mất kết nối LISTEN, reload_all sẽ nạp lại
+                logger.error("Failed to reload valuation of portfolio %s", key[0], exc_info=result)
+                continue
+            by_asset = {holding["asset_id"]: holding for holding in result["holdings"]}
+            # Nến tới trong lúc nạp có thể chưa có trong kết quả đọc từ DB
+            repriced = False
+            for asset_id, (price, date) in recent.items():
+                holding = by_asset.get(asset_id)
+                if holding is not None and (holding["last_price_date"] is None or date >= holding["last_price_date"]):
+                    valuation.reprice_holding(holding, price, date)
+                    repriced = True
+            if repriced:
+                result = valuation.summarize(*key, result["holdings"])
+            self._reindex(key, tracked.holdings, by_asset)
+            tracked.holdings = by_asset
+            tracked.valuation = result
+            RECOMPUTATIONS.inc(kind="reload")
+            self._publish(tracked)
+
+    def _publish(self, tracked: _Tracked):
+        tracked.message = realtime.encode({"type": "valuation", **tracked.valuation})
+        for subscriber in tracked.subscribers:
+            subscriber.push(tracked.message)
+
+    def counts(self) -> dict:
+        result = {}
+        for subscriber in self._subscribers:
+            result[subscriber.transport] = result.get(subscriber.transport, 0) + 1
+        return result
+
+    def tracked_count(self) -> int:
+        return len(self._tracked)
+
+
+async def owned_portfolio_ids(user_id: int, portfolio_ids) -> set:
+    async with database.AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(model.Portfolio.id).where(
+                model.Portfolio.id.in_(portfolio_ids), model.Portfolio.user_id == user_id
+            )
+        )
+        return set(result.scalars())
+
+
+class PortfolioFeed:
+    """Định giá các danh mục của người dùng, cho realtime.serve_websocket/sse_response."""
+
+    param = "portfolio_ids"
+    limit = config.LIVE_VALUATION_MAX_PORTFOLIOS
+
+    def __init__(self, target: ValuationHub):
+        self.hub = target
+
+    def open(self, transport: str) -> realtime.Subscriber:
+        return self.hub.open(transport)
+
+    def close(self, subscriber: realtime.Subscriber):
+        self.hub.close(subscriber)
+
+    def parse(self, raw) -> list:
+        return realtime.parse_values(raw, self.param, self.limit, int)
+
+    async def subscribe(self, principal, subscriber: realtime.Subscriber, portfolio_ids, options) -> dict:
+        method = options.get("method", "average")
+        if method not in valuation.METHODS:
+            raise ValueError("method must be 'average' or 'fifo'")
+        owned = await owned_portfolio_ids(principal.id, portfolio_ids) if portfolio_ids else set()
+        allowed = [portfolio_id for portfolio_id in portfolio_ids if portfolio_id in owned]
+        self.hub.subscribe(subscriber, [(portfolio_id, method) for portfolio_id in allowed])
+        return {
+            "type": "subscribed",
+            "method": method,
+            "portfolio_ids": allowed,
+            # Không tồn tại hoặc của người khác: không phân biệt để tránh lộ id danh mục
+            "unavailable": [portfolio_id for portfolio_id in portfolio_ids if portfolio_id not in owned],
+        }
+
+    async def unsubscribe(self, principal, subscriber: realtime.Subscriber, portfolio_ids, options) -> dict:
+        keys = [key for key in subscriber.topics if key[0] in portfolio_ids]
+        self.hub.unsubscribe(subscriber, keys)
+        return {"type": "unsubscribed", "portfolio_ids": sorted({key[0] for key in keys})}
+
+
+hub = ValuationHub()
+portfolios = PortfolioFeed(hub)
+
+realtime.add_channel(realtime.CHANNEL, hub.on_candle)
+realtime.add_channel(holdings.NOTIFY_CHANNEL, hub.on_holdings_changed)
+realtime.add_reconnect_handler(hub.reload_all)
+
+SUBSCRIBERS = metrics.Gauge(
+    "live_valuation_subscribers",
+    "Số kết nối đang nhận định giá danh mục theo thời gian thực",
+    labelnames=("transport",),
+    collect=lambda: [({"transport": transport}, count) for transport, count in hub.counts().items()],
+)
+TRACKED = metrics.Gauge(
+    "live_valuation_portfolios",
+    "Số (danh mục, phương pháp) đang được định giá trong bộ nhớ",
+    collect=lambda: [({}, hub.tracked_count())],
+)
+RECOMPUTATIONS = metrics.Counter(
+    "live_valuation_recomputations_total",
+    "Lần định giá lại: cộng lại tổng sau nến mới (reprice) hoặc nạp lại từ DB (reload)",
+    labelnames=("kind",),
+)
+COALESCED = metrics.Counter(
+    "live_valuation_coalesced_ticks_total",
+    "Nến được gộp vào một lần định giá lại đang chờ",
+)
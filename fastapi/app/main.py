@@ -1,13 +1,17 @@
 # app/main.py
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from app.router import (
     users_router,
     assets_router,
     portfolios_router,
     transactions_router,
+    realtime_router,
 )
-from app import logger, config, database
+from app import logger, config, conditional, database, hashing, metrics, partitions, realtime, tokens
 
 # Khởi tạo ứng dụng FastAPI
 app = FastAPI(
@@ -23,8 +27,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Disposition"],  # Cursor phân trang, tên file export
 )
 
+# Response GET không tự khai báo Cache-Control được coi là dữ liệu riêng (private, no-cache)
+app.add_middleware(conditional.DefaultCacheControlMiddleware)
+
 
 # Root endpoint
 @app.get("/", tags=["Root"])
@@ -42,11 +50,18 @@ async def health_check():
     return {"status": "healthy"}
 
 
+# Metrics endpoint (định dạng text của Prometheus): thời gian chờ và mức sử dụng connection pool
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def read_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # Gắn các router vào ứng dụng
 app.include_router(users_router)
 app.include_router(assets_router)
 app.include_router(portfolios_router)
 app.include_router(transactions_router)
+app.include_router(realtime_router)
 
 
 # Sự kiện khởi động ứng dụng
@@ -56,10 +71,25 @@ def startup_event():
     logger.setup_logging()
     # Tạo bảng trong DB (dùng cho môi trường phát triển)
     database.Base.metadata.create_all(bind=database.engine)
+    # Tạo sẵn partition price_history cho tháng hiện tại và tháng kế tiếp
+    partitions.ensure_upcoming_partitions(database.engine)
     print("Application startup: Database tables checked/created.")
 
 
+@app.on_event("startup")
+async def start_background_tasks():
+    # Đồng bộ danh sách access token bị thu hồi giữa các worker
+    app.state.revocation_sync = asyncio.create_task(tokens.revocation_sync_loop())
+    # Nhận nến mới và thay đổi vị thế từ mọi worker (LISTEN/NOTIFY), đẩy tới client WebSocket/SSE
+    app.state.realtime_listener = asyncio.create_task(realtime.listen_loop())
+
+
 # Sự kiện tắt ứng dụng
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
+    app.state.revocation_sync.cancel()
+    app.state.realtime_listener.cancel()
+    # Đóng các kết nối asyncpg trong pool (primary và replica)
+    await database.dispose_engines()
+    hashing.shutdown()
     print("Application shutdown.")
@@ -8,6 +8,8 @@ from sqlalchemy import (
     ForeignKey,
     func,
     Numeric,
+    Index,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 
@@ -21,6 +23,10 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Integer, default=1)
+    # Tăng khi đổi mật khẩu hoặc xóa tài khoản: token mang version cũ không còn hợp lệ
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Mốc thay đổi dùng làm validator HTTP (ETag/Last-Modified) cho API đọc người dùng
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
 
     def __repr__(self):
         return f"<User(username='{self.username}', email='{self.email}')>"
@@ -33,6 +39,9 @@ class Asset(Base):
     symbol = Column(String(50), unique=True, nullable=False, index=True)
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
+    # Mốc thay đổi dùng làm validator HTTP (ETag/Last-Modified) cho API đọc thông tin và giá
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+    prices_updated_at = Column(DateTime, nullable=False, server_default=func.now())  # Ghi/sửa/xóa nến gần nhất
 
     def __repr__(self):
         return f"<Asset(symbol='{self.symbol}', name='{self.name}')>"
@@ -46,6 +55,9 @@ class Portfolio(Base):
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
+    # Sửa danh mục hoặc ghi/sửa/xóa giao dịch gần nhất (app.holdings cập nhật cùng giao dịch DB);
+    # validator HTTP cho API đọc danh mục, giao dịch, định giá và phân tích
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
 
     def __repr__(self):
         return f"<Portfolio(name='{self.name}', user_id={self.user_id})>"
@@ -53,21 +65,56 @@ class Portfolio(Base):
 
 class PriceHistory(Base):
     __tablename__ = "price_history"
+    # Bảng được phân vùng theo tháng trên cột date (partition tạo bởi app.partitions);
+    # khóa chính (asset_id, date) phục vụ truy vấn theo khoảng thời gian của một asset
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
 
-    id = Column(Integer, primary_key=True, index=True)
-    asset_id = Column(Integer, ForeignKey("asset.id"), nullable=False, index=True)
-    date = Column(DateTime, nullable=False)
+    asset_id = Column(Integer, ForeignKey("asset.id"), primary_key=True)
+    date = Column(DateTime, primary_key=True)
     open_price = Column(Numeric(18, 8), nullable=True)
     close_price = Column(Numeric(18, 8), nullable=True)
     high_price = Column(Numeric(18, 8), nullable=True)
     low_price = Column(Numeric(18, 8), nullable=True)
+    volume = Column(Numeric(28, 8), nullable=True)
 
     def __repr__(self):
         return f"<PriceHistory(asset_id={self.asset_id}, date={self.date})>"
 
 
+class PriceRollup(Base):
+    __tablename__ = "price_rollup"
+    # Nến gộp sẵn theo giờ/ngày/tuần, được cập nhật tăng dần bởi app.rollups khi ghi price_history
+
+    asset_id = Column(Integer, ForeignKey("asset.id"), primary_key=True)
+    resolution = Column(String(3), primary_key=True)  # '1h', '1d', '1w'
+    bucket = Column(DateTime, primary_key=True)  # Thời điểm bắt đầu khung
+    open_price = Column(Numeric(18, 8), nullable=True)
+    close_price = Column(Numeric(18, 8), nullable=True)
+    high_price = Column(Numeric(18, 8), nullable=True)
+    low_price = Column(Numeric(18, 8), nullable=True)
+    volume = Column(Numeric(28, 8), nullable=True)
+    candle_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PriceRollup(asset_id={self.asset_id}, resolution='{self.resolution}', bucket={self.bucket})>"
+
+
 class Transaction(Base):
     __tablename__ = "transaction"
+    # Index theo thứ tự duyệt của phần định giá FIFO (tránh sort khi đọc giao dịch của danh mục)
+    __table_args__ = (
+        Index(
+            "ix_transaction_portfolio_asset_date",
+            "portfolio_id",
+            "asset_id",
+            "transaction_date",
+            "id",
+        ),
+        # Phân trang keyset danh sách giao dịch của danh mục (transaction_date, id giảm dần)
+        Index("ix_transaction_portfolio_date", "portfolio_id", "transaction_date", "id"),
+        # Mã giao dịch từ sàn: nhập lại cùng file không tạo giao dịch trùng
+        UniqueConstraint("portfolio_id", "external_id", name="uq_transaction_portfolio_external_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     portfolio_id = Column(
@@ -78,6 +125,65 @@ class Transaction(Base):
     price = Column(Numeric(18, 8), nullable=False)
     transaction_type = Column(String(10), nullable=False)  # Ví dụ: 'mua', 'bán'
     transaction_date = Column(DateTime, server_default=func.now())
+    external_id = Column(String(100), nullable=True)  # Mã giao dịch phía sàn (nếu có)
 
     def __repr__(self):
         return f"<Transaction(type='{self.transaction_type}', portfolio_id={self.portfolio_id}, asset_id={self.asset_id})>"
+
+
+
+class PortfolioHolding(Base):
+    __tablename__ = "portfolio_holding"
+    # Ảnh chụp vị thế theo (portfolio, asset), cập nhật cùng giao dịch DB với bảng transaction.
+    # Giá vốn theo bình quân gia quyền di động (app.holdings.fold): phụ thuộc thứ tự giao dịch,
+    # nên lưu kèm vị trí (transaction_date, id) của giao dịch cuối cùng đã cộng vào.
+
+    portfolio_id = Column(
+        Integer, ForeignKey("portfolio.id", ondelete="CASCADE"), primary_key=True
+    )
+    asset_id = Column(Integer, ForeignKey("asset.id"), primary_key=True)
+    quantity = Column(Numeric(28, 8), nullable=False, default=0)
+    cost_basis = Column(Numeric(38, 8), nullable=False, default=0)
+    realized_pnl = Column(Numeric(38, 8), nullable=False, default=0)
+    last_transaction_date = Column(DateTime)
+    last_transaction_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<PortfolioHolding(portfolio_id={self.portfolio_id}, asset_id={self.asset_id}, quantity={self.quantity})>"
+
+
+class RefreshToken(Base):
+    """Refresh token dạng chuỗi ngẫu nhiên; chỉ lưu SHA-256, mỗi lần dùng được thay bằng token mới.
+
+    Các token xoay vòng từ cùng một lần đăng nhập chung `family_id`: dùng lại token đã thay
+    (dấu hiệu bị lộ) sẽ thu hồi cả họ.
+    """
+
+    __tablename__ = "refresh_token"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    token_hash = Column(String(64), nullable=False, unique=True)
+    family_id = Column(String(32), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<RefreshToken(user_id={self.user_id}, family_id='{self.family_id}')>"
+
+
+class RevokedToken(Base):
+    """Access token (theo jti) bị thu hồi trước hạn; mỗi worker nạp định kỳ vào bộ nhớ."""
+
+    __tablename__ = "revoked_token"
+
+    id = Column(Integer, primary_key=True)  # Tăng dần: worker chỉ đọc các dòng mới hơn lần trước
+    jti = Column(String(32), nullable=False, unique=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<RevokedToken(jti='{self.jti}')>"
@@ -0,0 +1,79 @@
+# app/ownership.py
+from fastapi import HTTPException
+from sqlalchemy import select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app import crud, model, pagination
+
+# Nạp tài nguyên kèm chủ sở hữu trong một truy vấn: không có dòng -> 404, khác user -> 403.
+# `action` điền vào thông báo 403, ví dụ "view this portfolio".
+
+
+def _check(row_exists: bool, owner_id, user_id: int, not_found: str, action: str):
+    if not row_exists:
+        raise HTTPException(status_code=404, detail=not_found)
+    if owner_id != user_id:
+        raise HTTPException(status_code=403, detail=f"Not authorized to {action}")
+
+
+async def get_owned_portfolio(
+    db: AsyncSession, portfolio_id: int, user_id: int, action: str = "view this portfolio"
+) -> model.Portfolio:
+    # db.get dùng identity map: các lần gọi sau trong cùng request không truy vấn lại
+    portfolio = await db.get(model.Portfolio, portfolio_id)
+    _check(portfolio is not None, portfolio and portfolio.user_id, user_id, "Portfolio not found", action)
+    return portfolio
+
+
+async def get_owned_transaction(
+    db: AsyncSession, transaction_id: int, user_id: int, action: str = "view this transaction"
+) -> model.Transaction:
+    row = (
+        await db.execute(
+            select(model.Transaction, model.Portfolio.user_id)
+            .join(model.Portfolio, model.Portfolio.id == model.Transaction.portfolio_id)
+            .where(model.Transaction.id == transaction_id)
+        )
+    ).first()
+    _check(row is not None, row and row.user_id, user_id, "Transaction not found", action)
+    return row.Transaction
+
+
+async def list_owned_transactions(
+    db: AsyncSession,
+    portfolio_id: int,
+    user_id: int,
+    limit: int,
+    after=None,
+    action: str = "view transactions of this portfolio",
+    **filters,
+):
+    """Một trang giao dịch của danh mục; trả về (danh sách, cursor trang sau, portfolio.updated_at).
+
+    Trang được lấy trong subquery LATERAL (index scan theo keyset, dừng sau limit + 1 dòng) rồi
+    LEFT JOIN từ portfolio: danh mục không có giao dịch phù hợp vẫn trả về một dòng để phân biệt
+    404 với danh sách rỗng.
+    """
+    page = pagination.keyset(
+        select(model.Transaction).where(
+            model.Transaction.portfolio_id == model.Portfolio.id,
+            *crud.transaction_filters(**filters),
+        ),
+        crud.TRANSACTION_SORT,
+        after,
+        descending=True,
+    ).limit(limit + 1).lateral("page")
+    transaction = aliased(model.Transaction, page)
+    rows = (
+        await db.execute(
+            select(model.Portfolio.user_id, model.Portfolio.updated_at, transaction)
+            .select_from(model.Portfolio)
+            .outerjoin(page, true())
+            .where(model.Portfolio.id == portfolio_id)
+            .order_by(page.c.transaction_date.desc(), page.c.id.desc())
+        )
+    ).all()
+    _check(bool(rows), rows and rows[0].user_id, user_id, "Portfolio not found", action)
+    transactions = [row[2] for row in rows if row[2] is not None]
+    return (*pagination.split_page(transactions, limit, crud.transaction_cursor), rows[0].updated_at)
@@ -0,0 +1,67 @@
+# app/pagination.py
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import literal, tuple_
+
+
+def encode_cursor(*values) -> str:
+    """Mã hóa giá trị khóa sắp xếp của dòng cuối trang thành cursor mờ (opaque)."""
+    payload = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """Giải mã cursor và ép kiểu từng phần tử theo `types` (datetime, int, str...)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("cursor shape mismatch")
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, values)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_condition(columns, after, descending: bool = False):
+    """Điều kiện "đứng sau `after`" theo bộ giá trị (row value) của `columns`."""
+    key = tuple_(*columns)
+    bound = tuple_(*(literal(value, column.type) for column, value in zip(columns, after)))
+    return key < bound if descending else key > bound
+
+
+def keyset_order(columns, descending: bool = False):
+    return [column.desc() if descending else column.asc() for column in columns]
+
+
+def keyset(stmt, columns, after=None, descending: bool = False):
+    """Sắp xếp theo `columns` (cột cuối là khóa duy nhất, thường là id) và lấy các dòng sau `after`.
+
+    So sánh theo bộ giá trị nên PostgreSQL đi thẳng vào index trên các cột này: trang sâu
+    tốn như trang đầu, không phải quét bỏ các dòng phía trước như OFFSET.
+    """
+    if after is not None:
+        stmt = stmt.where(keyset_condition(columns, after, descending))
+    return stmt.order_by(*keyset_order(columns, descending))
+
+
+def split_page(rows, limit: int, key):
+    """Tách `rows` (đã đọc limit + 1 dòng) thành trang hiện tại và cursor của trang sau (None nếu hết)."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], encode_cursor(*key(rows[limit - 1]))
+
+
+async def fetch_page(db, stmt, limit: int, key):
+    """Chạy câu SELECT một thực thể đã qua `keyset`; trả về (danh sách, cursor trang sau)."""
+    rows = (await db.execute(stmt.limit(limit + 1))).scalars().all()
+    return split_page(rows, limit, key)
@@ -0,0 +1,87 @@
+# app/partitions.py
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError, IntegrityError
+
+PRICE_HISTORY_TABLE = "price_history"
+
+# Cache các partition đã biết là tồn tại để tránh truy vấn catalog trên mỗi lần ghi
+_known_partitions = set()
+
+
+def month_start(value: datetime) -> datetime:
+    """Trả về thời điểm đầu tháng chứa `value`."""
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value: datetime) -> datetime:
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1)
+    return datetime(value.year, value.month + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    """Tên partition theo tháng, ví dụ: price_history_y2024m01."""
+    return f"{PRICE_HISTORY_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def _create_partition(connection, month: datetime):
+    """Tạo bảng rời rồi ATTACH vào bảng cha.
+
+    ATTACH PARTITION chỉ cần khóa SHARE UPDATE EXCLUSIVE trên bảng cha nên không chặn
+    (và không bị chặn bởi) các giao dịch đang đọc/ghi price_history, khác với
+    CREATE TABLE ... PARTITION OF vốn cần ACCESS EXCLUSIVE.
+    """
+    name = partition_name(month)
+    try:
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} "
+                f"(LIKE {PRICE_HISTORY_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+        )
+        attached = connection.execute(
+            text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:name)"),
+            {"name": name},
+        ).scalar()
+        if not attached:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {PRICE_HISTORY_TABLE} ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+                )
+            )
+    except (ProgrammingError, IntegrityError):
+        # Một tiến trình khác vừa tạo và gắn cùng partition
+        attached = connection.execute(
+            text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:name)"),
+            {"name": name},
+        ).scalar()
+        if not attached:
+            raise
+
+
+def ensure_price_history_partitions(bind, dates):
+    """Đảm bảo đã có partition tháng cho mọi ngày trong `dates` trước khi ghi dữ liệu.
+
+    `bind` là Engine hoặc Session; DDL chạy trên một kết nối AUTOCOMMIT riêng để
+    không giữ khóa trên bảng cha trong suốt giao dịch của người gọi.
+    """
+    engine = bind.get_bind() if hasattr(bind, "get_bind") else bind
+    if engine.dialect.name != "postgresql":
+        return
+    months = {month_start(date) for date in dates if date is not None}
+    missing = sorted(months - _known_partitions)
+    if not missing:
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for month in missing:
+            _create_partition(connection, month)
+            _known_partitions.add(month)
+
+
+def ensure_upcoming_partitions(bind):
+    """Tạo sẵn partition cho tháng hiện tại và tháng kế tiếp (gọi khi khởi động)."""
+    current = month_start(datetime.now(timezone.utc).replace(tzinfo=None))
+    ensure_price_history_partitions(bind, [current, next_month(current)])
@@ -0,0 +1,506 @@
+# app/realtime.py
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+
+import anyio
+import asyncpg
+import orjson
+from fastapi import HTTPException, WebSocket, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, column, func, select, values
+from sqlalchemy.engine import make_url
+from starlette.requests import HTTPConnection
+
+from app import auth, config, database, metrics, model, streaming, tokens
+
+logger = logging.getLogger(__name__)
+
+# Nến mới được phát bằng pg_notify trong chính giao dịch ghi giá (listener chỉ nhận khi commit).
+# Mỗi worker LISTEN trên một kết nối riêng và phân phối tin tới các client đang đăng ký trong tiến trình:
+# mọi tin (kể cả do chính worker ghi) đi cùng một đường nên thứ tự giống nhau ở mọi worker.
+CHANNEL = "price_candles"
+
+
+def encode(event: dict) -> str:
+    return orjson.dumps(event).decode()
+
+
+def notify_statement(rows, columns):
+    """SELECT pg_notify(...) cho nến mới nhất của mỗi asset trong lô `rows` (dict theo `columns`).
+
+    Lô lớn chỉ phát một tin mỗi asset: mỗi tin NOTIFY tối đa 8000 byte và client chỉ cần nến cuối.
+    """
+    latest = {}
+    for row in rows:
+        current = latest.get(row["asset_id"])
+        if current is None or row["date"] >= current["date"]:
+            latest[row["asset_id"]] = row
+    payloads = values(column("payload", String), name="candles").data(
+        [
+            (orjson.dumps(streaming.row_to_dict([row.get(name) for name in columns], columns)).decode(),)
+            for row in latest.values()
+        ]
+    )
+    return select(func.pg_notify(CHANNEL, payloads.c.payload))
+
+
+class Subscriber:
+    """Hàng đợi gửi có giới hạn của một kết nối.
+
+    Hub chỉ đẩy vào hàng đợi (không await) nên client chậm không làm chậm fan-out tới client khác;
+    hàng đợi đầy thì bỏ tin cũ nhất và báo số tin đã bỏ (`lagged`) ở lần gửi kế tiếp.
+    """
+
+    __slots__ = ("transport", "maxsize", "queue", "dropped", "ready", "topics")
+
+    def __init__(self, transport: str, maxsize: int = config.REALTIME_QUEUE_SIZE):
+        self.transport = transport
+        self.maxsize = maxsize
+        self.queue = deque()
+        self.dropped = 0
+        self.ready = asyncio.Event()
+        self.topics = set()  # Khóa đã đăng ký (asset_id với nến giá)
+
+    def push(self, message: str):
+        if len(self.queue) >= self.maxsize:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(message)
+        self.ready.set()
+
+    async def drain(self, timeout: float = None) -> list:
+        """Chờ tới khi có tin (tối đa `timeout` giây) rồi lấy hết các tin đang chờ."""
+        if not self.queue:
+            self.ready.clear()
+            if timeout is None:
+                await self.ready.wait()
+            else:
+                with anyio.move_on_after(timeout):
+                    await self.ready.wait()
+                if not self.queue:
+                    return []
+        messages = list(self.queue)
+        self.queue.clear()
+        if self.dropped:
+            MESSAGES.inc(self.dropped, result="dropped")
+            messages.insert(0, encode({"type": "lagged", "dropped": self.dropped}))
+            self.dropped = 0
+        return messages
+
+
+class PriceHub:
+    """Pub/sub trong tiến trình: asset_id -> các Subscriber đang theo dõi."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._topics = {}  # asset_id -> set(Subscriber)
+        self._symbols = {}  # asset_id -> symbol, ghi vào tin gửi client
+
+    def open(self, transport: str) -> Subscriber:
+        subscriber = Subscriber(transport)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def close(self, subscriber: Subscriber):
+        self.unsubscribe(subscriber, list(subscriber.topics))
+        self._subscribers.discard(subscriber)
+
+    def subscribe(self, subscriber: Subscriber, assets: dict):
+        """`assets`: {asset_id: symbol}."""
+        for asset_id, symbol in assets.items():
+            self._topics.setdefault(asset_id, set()).add(subscriber)
+            self._symbols[asset_id] = symbol
+            subscriber.topics.add(asset_id)
+
+    def unsubscribe(self, subscriber: Subscriber, asset_ids):
+        for asset_id in asset_ids:
+            subscriber.topics.discard(asset_id)
+            topic = self._topics.get(asset_id)
+            if topic is None:
+                continue
+            topic.discard(subscriber)
+            if not topic:
+                del self._topics[asset_id]
+                del self._symbols[asset_id]
+
+    def publish(self, candle: dict) -> int:
+        """Gửi một nến tới mọi subscriber của asset; tin được mã hóa JSON một lần cho tất cả."""
+        topic = self._topics.get(candle.get("asset_id"))
+        if not topic:
+            return 0
+        message = encode({"type": "candle", "symbol": self._symbols[candle["asset_id"]], **candle})
+        for subscriber in topic:
+            subscriber.push(message)
+        return len(topic)
+
+    def broadcast(self, event: dict):
+        message = encode(event)
+        for subscriber in self._subscribers:
+            subscriber.push(message)
+
+    def counts(self) -> dict:
+        result = {}
+        for subscriber in self._subscribers:
+            result[subscriber.transport] = result.get(subscriber.transport, 0) + 1
+        return result
+
+
+hub = PriceHub()
+
+SUBSCRIBERS = metrics.Gauge(
+    "realtime_subscribers",
+    "Số kết nối đang nhận nến theo thời gian thực",
+    labelnames=("transport",),
+    collect=lambda: [({"transport": transport}, count) for transport, count in hub.counts().items()],
+)
+MESSAGES = metrics.Counter(
+    "realtime_messages_total",
+    "Tin gửi tới client (sent) hoặc bị bỏ do client nhận chậm (dropped)",
+    labelnames=("result",),
+)
+NOTIFICATIONS = metrics.Counter(
+    "realtime_notifications_total", "Tin NOTIFY nhận từ PostgreSQL", labelnames=("channel",)
+)
+SLOW_CONSUMERS = metrics.Counter(
+    "realtime_slow_consumer_disconnects_total",
+    "Kết nối bị ngắt vì không nhận kịp trong REALTIME_SEND_TIMEOUT",
+    labelnames=("transport",),
+)
+EXPIRED = metrics.Counter(
+    "realtime_auth_expired_disconnects_total",
+    "Kết nối bị ngắt vì token hết hạn hoặc bị thu hồi sau khi kết nối",
+    labelnames=("transport",),
+)
+
+
+# --- Bus giữa các worker: PostgreSQL LISTEN/NOTIFY ---
+
+
+def listener_dsn(url: str = config.ASYNC_DATABASE_URL) -> str:
+    # Kết nối asyncpg riêng, ngoài pool: LISTEN giữ kết nối suốt vòng đời worker
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+_channels = {}  # kênh NOTIFY -> các hàm nhận payload đã giải mã JSON
+_reconnect_handlers = []
+
+
+def add_channel(channel: str, handler):
+    """Đăng ký `handler(event)` cho tin trên `channel`; gọi đồng bộ trong event loop, không được chặn."""
+    _channels.setdefault(channel, []).append(handler)
+
+
+def add_reconnect_handler(handler):
+    """Đăng ký `handler()` gọi sau khi LISTEN lại: tin phát trong lúc mất kết nối không được gửi lại."""
+    _reconnect_handlers.append(handler)
+
+
+def _dispatch(connection, pid, channel, payload):
+    NOTIFICATIONS.inc(channel=channel)
+    try:
+        event = orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        logger.warning("Ignoring malformed notification on %s", channel)
+        return
+    for handler in _channels.get(channel, ()):
+        try:
+            handler(event)
+        except Exception:
+            logger.exception("Notification handler failed on %s", channel)
+
+
+async def listen_loop():
+    """Tác vụ nền của mỗi worker: LISTEN các kênh đã đăng ký và phân phối tin; mất kết nối thì kết nối lại."""
+    reconnecting = False
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(listener_dsn())
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            for channel in _channels:
+                await connection.add_listener(channel, _dispatch)
+            if reconnecting:
+                for handler in _reconnect_handlers:
+                    handler()
+            await lost.wait()
+            logger.warning("Realtime listener connection lost")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Realtime listener failed")
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        reconnecting = True
+        await asyncio.sleep(config.REALTIME_RECONNECT_SECONDS)
+
+
+add_channel(CHANNEL, hub.publish)
+# Client giá tải lại qua REST khi nhận resync
+add_reconnect_handler(lambda: hub.broadcast({"type": "resync"}))
+
+
+# --- Kết nối client ---
+# serve_websocket/sse_response dùng chung cho mọi nguồn tin (feed): feed cho biết tên tham số
+# đăng ký (`param`), số mục tối đa (`limit`) và cách đăng ký/hủy cho một Subscriber.
+
+
+def parse_values(raw, name: str, limit: int, item_type=str) -> list:
+    """Danh sách giá trị từ chuỗi "a,b" (query) hoặc list JSON (lệnh); bỏ trùng, giữ thứ tự."""
+    items = raw.split(",") if isinstance(raw, str) else raw
+    if not isinstance(items, list):
+        raise ValueError(f"{name} must be a list")
+    result = []
+    for item in items:
+        if isinstance(item, str):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                item = item_type(item)
+            except ValueError:
+                raise ValueError(f"{name} must be a list of {item_type.__name__}")
+        elif type(item) is not item_type:
+            raise ValueError(f"{name} must be a list of {item_type.__name__}")
+        result.append(item)
+    result = list(dict.fromkeys(result))
+    if len(result) > limit:
+        raise ValueError(f"At most {limit} {name} per connection")
+    return result
+
+
+def parse_symbols(raw) -> list:
+    return parse_values(raw, "symbols", config.REALTIME_MAX_SYMBOLS)
+
+
+async def resolve_symbols(symbols) -> dict:
+    """{asset_id: symbol} của các symbol có trong bảng asset."""
+    if not symbols:
+        return {}
+    async with database.read_session() as db:
+        result = await db.execute(
+            select(model.Asset.id, model.Asset.symbol).where(model.Asset.symbol.in_(symbols))
+        )
+        return dict(result.all())
+
+
+class PriceFeed:
+    """Nến mới theo symbol."""
+
+    param = "symbols"
+    limit = config.REALTIME_MAX_SYMBOLS
+
+    def __init__(self, target: PriceHub):
+        self.hub = target
+
+    def open(self, transport: str) -> Subscriber:
+        return self.hub.open(transport)
+
+    def close(self, subscriber: Subscriber):
+        self.hub.close(subscriber)
+
+    def parse(self, raw) -> list:
+        return parse_symbols(raw)
+
+    async def subscribe(self, principal, subscriber: Subscriber, symbols, options) -> dict:
+        assets = await resolve_symbols(symbols)
+        self.hub.subscribe(subscriber, assets)
+        known = set(assets.values())
+        return {
+            "type": "subscribed",
+            "symbols": [symbol for symbol in symbols if symbol in known],
+            "unknown": [symbol for symbol in symbols if symbol not in known],
+        }
+
+    async def unsubscribe(self, principal, subscriber: Subscriber, symbols, options) -> dict:
+        assets = await resolve_symbols(symbols)
+        self.hub.unsubscribe(subscriber, list(assets))
+        return {"type": "unsubscribed", "symbols": list(assets.values())}
+
+
+prices = PriceFeed(hub)
+
+
+def stream_token(connection: HTTPConnection):
+    # Trình duyệt không đặt được header Authorization cho WebSocket/EventSource: nhận thêm query `token`
+    scheme, _, token = connection.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    return connection.query_params.get("token")
+
+
+class Credentials:
+    """Principal của kết nối cùng `exp`/`jti` của token dùng lúc kết nối.
+
+    Kết nối sống lâu hơn token: vòng gửi tin kiểm tra lại và ngắt khi token hết hạn hoặc bị thu hồi.
+    """
+
+    __slots__ = ("principal", "jti", "expires_at")
+
+    def __init__(self, principal: auth.Principal, jti: str = None, expires_at: float = None):
+        self.principal = principal
+        self.jti = jti
+        self.expires_at = expires_at  # Epoch giây; None: token không có `exp`
+
+    def valid(self) -> bool:
+        if self.expires_at is not None and time.time() >= self.expires_at:
+            return False
+        return not tokens.is_revoked(self.jti)
+
+    def next_check(self, interval: float = None) -> float:
+        """Số giây tối đa được chờ trước lần kiểm tra kế tiếp."""
+        if interval is None:
+            interval = config.REALTIME_AUTH_CHECK_SECONDS
+        if self.expires_at is None:
+            return interval
+        return max(0.0, min(interval, self.expires_at - time.time()))
+
+
+async def authenticate(connection: HTTPConnection):
+    """Credentials của token trong request, hoặc None.
+
+    Dùng session ngắn thay cho Depends(get_async_db): kết nối sống lâu không được giữ kết nối DB.
+    """
+    token = stream_token(connection)
+    if not token:
+        return None
+    async with database.AsyncSessionLocal() as db:
+        try:
+            principal = await auth.get_current_user(db=db, token=token)
+        except HTTPException:
+            return None
+    claims = auth.token_claims(token)
+    return Credentials(principal, claims.get("jti"), claims.get("exp"))
+
+
+async def _read_commands(websocket: WebSocket, feed, principal, subscriber: Subscriber):
+    # {"action": "subscribe" | "unsubscribe", <feed.param>: [...], ...tùy chọn của feed}
+    async for text in websocket.iter_text():
+        try:
+            command = orjson.loads(text)
+            action = command.get("action")
+            values = feed.parse(command.get(feed.param, []))
+            if action == "subscribe":
+                if len(subscriber.topics) + len(values) > feed.limit:
+                    raise ValueError(f"At most {feed.limit} {feed.param} per connection")
+                reply = await feed.subscribe(principal, subscriber, values, command)
+            elif action == "unsubscribe":
+                reply = await feed.unsubscribe(principal, subscriber, values, command)
+            else:
+                raise ValueError("action must be 'subscribe' or 'unsubscribe'")
+        except (orjson.JSONDecodeError, AttributeError, ValueError) as exc:
+            reply = {"type": "error", "detail": str(exc)}
+        subscriber.push(encode(reply))
+
+
+async def _write_messages(websocket: WebSocket, subscriber: Subscriber, credentials: Credentials) -> int:
+    """Gửi tin trong hàng đợi; trả về mã đóng kết nối khi client không nhận kịp
+    trong REALTIME_SEND_TIMEOUT (1013) hoặc token hết hạn/bị thu hồi (1008)."""
+    while True:
+        messages = await subscriber.drain(credentials.next_check())
+        if not credentials.valid():
+            EXPIRED.inc(transport=subscriber.transport)
+            return status.WS_1008_POLICY_VIOLATION
+        for message in messages:
+            with anyio.move_on_after(config.REALTIME_SEND_TIMEOUT) as scope:
+                await websocket.send_text(message)
+            if scope.cancelled_caught:
+                SLOW_CONSUMERS.inc(transport=subscriber.transport)
+                return status.WS_1013_TRY_AGAIN_LATER
+        if messages:
+            MESSAGES.inc(len(messages), result="sent")
+
+
+async def serve_websocket(websocket: WebSocket, feed=prices, options=None):
+    """Đăng ký ban đầu theo query `feed.param`, với tùy chọn `options` mà endpoint đã nhận
+    (không truyền thì đọc từ query của kết nối)."""
+    credentials = await authenticate(websocket)
+    if credentials is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    principal = credentials.principal
+    if options is None:
+        options = websocket.query_params
+    try:
+        values = feed.parse(websocket.query_params.get(feed.param, ""))
+    except ValueError as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc))
+        return
+    await websocket.accept()
+    subscriber = feed.open("websocket")
+    code = None
+    try:
+        if values:
+            subscriber.push(encode(await feed.subscribe(principal, subscriber, values, options)))
+        # Task phụ đọc lệnh, task của kết nối gửi tin (chỉ nó ghi vào socket); một bên dừng thì dừng cả hai
+        async with anyio.create_task_group() as group:
+
+            async def read():
+                await _read_commands(websocket, feed, principal, subscriber)
+                group.cancel_scope.cancel()
+
+            group.start_soon(read)
+            # _write_messages chỉ tự kết thúc khi client nhận quá chậm hoặc token hết hiệu lực
+            code = await _write_messages(websocket, subscriber, credentials)
+            group.cancel_scope.cancel()
+        if code is not None:
+            reason = "Token expired or revoked" if code == status.WS_1008_POLICY_VIOLATION else None
+            with anyio.move_on_after(1), contextlib.suppress(Exception):
+                await websocket.close(code=code, reason=reason)
+    finally:
+        feed.close(subscriber)
+
+
+async def _sse_events(feed, credentials: Credentials, values, options):
+    # Đăng ký ngay trong generator: client ngắt trước khi stream bắt đầu thì không để lại subscriber
+    subscriber = feed.open("sse")
+    try:
+        first = await feed.subscribe(credentials.principal, subscriber, values, options)
+        yield f"data: {encode(first)}\n\n".encode()
+        heartbeat_at = time.monotonic() + config.REALTIME_HEARTBEAT_SECONDS
+        while True:
+            wait = min(credentials.next_check(), max(0.0, heartbeat_at - time.monotonic()))
+            messages = await subscriber.drain(wait)
+            if not credentials.valid():
+                # Kết thúc stream; EventSource kết nối lại sẽ nhận 401 nếu vẫn dùng token cũ
+                EXPIRED.inc(transport=subscriber.transport)
+                yield f"data: {encode({'type': 'error', 'detail': 'Token expired or revoked'})}\n\n".encode()
+                return
+            if not messages:
+                if time.monotonic() < heartbeat_at:
+                    continue
+                heartbeat_at = time.monotonic() + config.REALTIME_HEARTBEAT_SECONDS
+                yield b": ping\n\n"
+                continue
+            heartbeat_at = time.monotonic() + config.REALTIME_HEARTBEAT_SECONDS
+            yield "".join(f"data: {message}\n\n" for message in messages).encode()
+            MESSAGES.inc(len(messages), result="sent")
+    finally:
+        feed.close(subscriber)
+
+
+async def sse_response(request, feed=prices, values: str = None, options=None) -> StreamingResponse:
+    """Server-Sent Events: đăng ký cố định theo `values` (chuỗi "a,b" của tham số `feed.param`)
+    và tùy chọn `options` mà endpoint đã nhận; không truyền thì đọc từ query của request.
+
+    Client chậm làm đầy hàng đợi của nó (tin cũ nhất bị bỏ) thay vì làm tăng bộ nhớ.
+    """
+    credentials = await authenticate(request)
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if values is None:
+        values = request.query_params.get(feed.param, "")
+    try:
+        values = feed.parse(values)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return StreamingResponse(
+        _sse_events(feed, credentials, values, request.query_params if options is None else options),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx chuyển từng sự kiện ngay, không gom vào buffer
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
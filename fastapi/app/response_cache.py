@@ -0,0 +1,143 @@
+# app/response_cache.py
+import hashlib
+import json
+import secrets
+
+from fastapi.responses import Response
+
+from app import cache, config, metrics
+
+REQUESTS = metrics.Counter(
+    "response_cache_requests_total",
+    "Số lần tra cache response theo kết quả (hit_local, hit_shared, miss)",
+    labelnames=("endpoint", "result"),
+)
+INVALIDATIONS = metrics.Counter(
+    "response_cache_invalidations_total", "Số lần vô hiệu hóa cache theo tag", labelnames=("tag",)
+)
+
+# Header không lưu vào entry: tính lại khi dựng response từ cache
+_SKIPPED_HEADERS = {"content-length", "content-type", "x-cache"}
+
+
+class ResponseCache:
+    """Cache body response JSON theo endpoint + tham số; hai tầng: LRU trong tiến trình và
+    backend dùng chung tùy chọn (RedisCache, hoặc cache.MemoryCache trong test).
+
+    Mỗi entry gắn các tag (ví dụ "assets", "prices:3"). Vô hiệu hóa một tag là đổi thế hệ của tag:
+    khóa tính từ thế hệ mới không còn trỏ tới entry cũ, entry cũ tự bị loại theo LRU/TTL.
+    Thế hệ được lưu ở backend dùng chung nên các worker khác thấy ngay; không có backend dùng chung
+    thì worker khác thấy thay đổi sau tối đa `ttl` giây.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, shared=None, max_body: int = 1_000_000, enabled: bool = True):
+        self.ttl = ttl
+        self.local = cache.LRUCache(maxsize, ttl)
+        self.shared = shared
+        self.max_body = max_body
+        self.enabled = enabled
+        self._generations = {}  # tag -> thế hệ cục bộ
+
+    def _local_ttl(self, immutable: bool):
+        """TTL của entry trong LRU (None: TTL mặc định, 0: không hết hạn).
+
+        Chỉ giữ entry immutable không hết hạn khi có backend dùng chung: thế hệ tag đọc từ đó nên
+        ghi ở worker khác vẫn vô hiệu hóa được. Không có backend dùng chung thì thế hệ chỉ có trong
+        tiến trình, entry phải hết hạn sau `ttl` như mọi entry khác.
+        """
+        return 0 if immutable and self.shared is not None else None
+
+    async def _key(self, endpoint: str, params: dict, tags) -> str:
+        generations = [self._generations.get(tag, 0) for tag in tags]
+        if self.shared is not None:
+            generations += [await self.shared.get(f"tag:{tag}", 0) for tag in tags]
+        raw = json.dumps([endpoint, sorted(params.items()), list(tags), generations], default=str)
+        return f"{endpoint}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    async def lookup(self, endpoint: str, params: dict, tags):
+        """Trả về (khóa, Response từ cache hoặc None); khóa dùng lại cho store khi miss."""
+        if not self.enabled:
+            return None, None
+        key = await self._key(endpoint, params, tags)
+        entry, result = self.local.get(key), "hit_local"
+        if entry is None and self.shared is not None:
+            entry, result = await self.shared.get(key), "hit_shared"
+            if entry is not None:
+                self.local.set(key, entry, self._local_ttl(entry["immutable"]))
+        if entry is None:
+            REQUESTS.inc(endpoint=endpoint, result="miss")
+            return key, None
+        REQUESTS.inc(endpoint=endpoint, result=result)
+        return key, Response(
+            entry["body"].encode("utf-8"),
+            media_type=entry["media_type"],
+            headers={**entry["headers"], "X-Cache": "HIT"},
+        )
+
+    async def _put(self, key: str, body: bytes, response: Response, immutable: bool):
+        entry = {
+            "body": body.decode("utf-8"),
+            "media_type": response.media_type,
+            "headers": {
+                name: value for name, value in response.headers.items() if name not in _SKIPPED_HEADERS
+            },
+            "immutable": immutable,
+        }
+        # immutable: ở backend dùng chung đặt TTL dài để các entry của thế hệ cũ không tồn tại mãi
+        self.local.set(key, entry, self._local_ttl(immutable))
+        if self.shared is not None:
+            await self.shared.set(key, entry, config.RESPONSE_CACHE_IMMUTABLE_TTL if immutable else None)
+
+    async def store(self, key: str, response, immutable: bool = False):
+        """Lưu response đã dựng sẵn body (Response) rồi trả lại chính nó."""
+        if key is None or not isinstance(response, Response) or response.status_code != 200:
+            return response
+        if len(response.body) <= self.max_body:
+            await self._put(key, response.body, response, immutable)
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    def store_stream(self, key: str, response, immutable: bool = False):
+        """Bọc body của StreamingResponse: vừa gửi vừa gom bytes, stream xong và không vượt
+        max_body thì lưu vào cache."""
+        if key is None:
+            return response
+        body = response.body_iterator
+
+        async def tee():
+            chunks, size = [], 0
+            async for chunk in body:
+                if chunks is not None:
+                    size += len(chunk)
+                    if size <= self.max_body:
+                        chunks.append(chunk)
+                    else:
+                        chunks = None
+                yield chunk
+            if chunks is not None:
+                await self._put(key, b"".join(chunks), response, immutable)
+
+        response.body_iterator = tee()
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    async def invalidate(self, *tags: str):
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            if self.shared is not None:
+                # Giá trị ngẫu nhiên thay vì tăng dần: hai worker ghi cùng lúc không cần đọc trước
+                await self.shared.set(f"tag:{tag}", secrets.token_hex(8), 0)
+            INVALIDATIONS.inc(tag=tag.split(":", 1)[0])
+
+
+responses = ResponseCache(
+    config.RESPONSE_CACHE_SIZE,
+    config.RESPONSE_CACHE_TTL,
+    shared=(
+        cache.RedisCache(config.CACHE_REDIS_URL, config.RESPONSE_CACHE_TTL, prefix="cryptonav:response:")
+        if config.CACHE_REDIS_URL
+        else None
+    ),
+    max_body=config.RESPONSE_CACHE_MAX_BODY,
+    enabled=config.RESPONSE_CACHE_ENABLED,
+)
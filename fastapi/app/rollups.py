@@ -0,0 +1,246 @@
+# app/rollups.py
+"""Bảng nến gộp sẵn (price_rollup) theo giờ, ngày, tuần.
+
+Mỗi lần ghi price_history chỉ tính lại các khung bị ảnh hưởng: khung giờ từ nến thô,
+khung ngày từ khung giờ, khung tuần từ khung ngày. Nhờ vậy chi phí cập nhật nhỏ và
+luôn đúng với cả ghi đè lẫn xóa nến.
+
+Dựng lại rollup của một asset sau khi backfill:
+    python -m app.rollups rebuild --asset-id 1
+"""
+import argparse
+import math
+from datetime import timedelta
+from functools import partial
+
+from sqlalchemy import delete, func, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import config, crud, database, model, timeseries
+
+# Độ phân giải được gộp sẵn và nguồn dữ liệu của từng mức (None = nến thô)
+RESOLUTIONS = ("1h", "1d", "1w")
+SOURCES = {"1h": None, "1d": "1h", "1w": "1d"}
+
+# Namespace cho pg_advisory_xact_lock(namespace, asset_id)
+ROLLUP_LOCK_NAMESPACE = 5001
+
+
+def _recompute_statement(asset_id: int, resolution: str, range_start, range_end):
+    """INSERT ... SELECT tính lại các khung `resolution` trong [range_start, range_end)."""
+    source = SOURCES[resolution]
+    if source is None:
+        table = model.PriceHistory.__table__
+        time_column = table.c.date
+        candle_count = func.count()
+        conditions = [table.c.asset_id == asset_id]
+    else:
+        table = model.PriceRollup.__table__
+        time_column = table.c.bucket
+        candle_count = func.sum(table.c.candle_count)
+        conditions = [table.c.asset_id == asset_id, table.c.resolution == source]
+    bucket = timeseries.bucket_expression(resolution, time_column)
+    source_select = (
+        select(
+            literal(asset_id),
+            literal(resolution),
+            bucket,
+            timeseries.first_in_group(table.c.open_price, time_column),
+            timeseries.first_in_group(table.c.close_price, time_column, descending=True),
+            func.max(table.c.high_price),
+            func.min(table.c.low_price),
+            func.sum(table.c.volume),
+            candle_count,
+        )
+        .where(*conditions, time_column >= range_start, time_column < range_end)
+        .group_by(bucket)
+    )
+    columns = [
+        "asset_id",
+        "resolution",
+        "bucket",
+        "open_price",
+        "close_price",
+        "high_price",
+        "low_price",
+        "volume",
+        "candle_count",
+    ]
+    stmt = pg_insert(model.PriceRollup).from_select(columns, source_select)
+    return stmt.on_conflict_do_update(
+        index_elements=["asset_id", "resolution", "bucket"],
+        set_={column: stmt.excluded[column] for column in columns[3:]},
+    )
+
+
+def refresh_rollups(db: Session, asset_id: int, start, end):
+    """Tính lại mọi khung rollup của `asset_id` chứa khoảng [start, end].
+
+    Chạy trong giao dịch của người gọi (không commit) để rollup luôn khớp với nến thô.
+    Khóa advisory theo asset tuần tự hóa các lần cập nhật đồng thời trên cùng asset.
+    """
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(:namespace, :asset_id)"),
+        {"namespace": ROLLUP_LOCK_NAMESPACE, "asset_id": asset_id},
+    )
+    table = model.PriceRollup.__table__
+    for resolution in RESOLUTIONS:
+        stride = timedelta(seconds=timeseries.INTERVALS[resolution])
+        range_start = timeseries.bucket_floor(start, resolution)
+        range_end = timeseries.bucket_floor(end, resolution) + stride
+        # Xóa trước để các khung không còn nến nào cũng biến mất khỏi rollup
+        db.execute(
+            delete(table).where(
+                table.c.asset_id == asset_id,
+                table.c.resolution == resolution,
+                table.c.bucket >= range_start,
+                table.c.bucket < range_end,
+            )
+        )
+        db.execute(_recompute_statement(asset_id, resolution, range_start, range_end))
+
+
+def refresh_rollups_for_rows(db: Session, rows):
+    """Cập nhật rollup cho một lô nến vừa ghi, mỗi asset một khoảng [min(date), max(date)]."""
+    ranges = {}
+    for row in rows:
+        low, high = ranges.get(row["asset_id"], (row["date"], row["date"]))
+        ranges[row["asset_id"]] = (min(low, row["date"]), max(high, row["date"]))
+    # Khóa theo thứ tự asset_id để tránh deadlock giữa các lô chạy song song
+    for asset_id in sorted(ranges):
+        refresh_rollups(db, asset_id, *ranges[asset_id])
+
+
+def rebuild_asset(db: Session, asset_id: int) -> int:
+    """Xóa và dựng lại toàn bộ rollup của một asset từ nến thô; trả về số nến nguồn."""
+    table = model.PriceHistory.__table__
+    first, last, count = db.execute(
+        select(func.min(table.c.date), func.max(table.c.date), func.count()).where(
+            table.c.asset_id == asset_id
+        )
+    ).one()
+    db.execute(
+        delete(model.PriceRollup.__table__).where(
+            model.PriceRollup.__table__.c.asset_id == asset_id
+        )
+    )
+    if count:
+        refresh_rollups(db, asset_id, first, last)
+    db.execute(crud.touch_prices_statement([asset_id]))
+    db.commit()
+    return count
+
+
+def rollup_select(
+    asset_id: int,
+    interval: str,
+    start=None,
+    end=None,
+    after=None,
+    order: str = "desc",
+    keys_only: bool = False,
+):
+    """Đọc nến `interval` từ rollup với cùng các cột và ngữ nghĩa phân trang như price_history_select."""
+    start, end, after = crud.naive_utc(start), crud.naive_utc(end), crud.naive_utc(after)
+    table = model.PriceRollup.__table__
+    if keys_only:
+        stmt = select(table.c.bucket.label("date"))
+    else:
+        stmt = select(
+            table.c.asset_id,
+            table.c.bucket.label("date"),
+            table.c.open_price,
+            table.c.close_price,
+            table.c.high_price,
+            table.c.low_price,
+            table.c.volume,
+        )
+    stmt = stmt.where(table.c.asset_id == asset_id, table.c.resolution == interval)
+    if start is not None:
+        stmt = stmt.where(table.c.bucket >= timeseries.bucket_floor(start, interval))
+    if end is not None:
+        stmt = stmt.where(table.c.bucket <= end)
+    if order == "asc":
+        if after is not None:
+            stmt = stmt.where(table.c.bucket > after)
+        return stmt.order_by(table.c.bucket.asc())
+    if after is not None:
+        stmt = stmt.where(table.c.bucket < after)
+    return stmt.order_by(table.c.bucket.desc())
+
+
+def series_select_builder(interval: str = None):
+    """Chọn nguồn đọc chuỗi giá: nến thô, rollup (1h/1d/1w) hoặc gộp trực tiếp bằng SQL (1m/5m)."""
+    if interval is None:
+        return crud.price_history_select
+    if interval in RESOLUTIONS:
+        return partial(rollup_select, interval=interval)
+    return partial(timeseries.resample_select, interval=interval)
+
+
+def downsample_select(asset_id: int, start, end, max_points: int, interval: str = None):
+    """Chuỗi giá [start, end] gộp trong SQL còn tối đa khoảng max_points * PRICE_HISTORY_DOWNSAMPLE_FACTOR
+    khung (tăng dần), để LTTB chỉ chạy trên số dòng có giới hạn dù khoảng dài bao nhiêu.
+
+    Đọc từ rollup thô nhất không vượt độ dài khung gộp (khoảng nhiều năm đọc nến ngày thay vì
+    nến thô); độ dài khung được làm tròn lên bội số của nguồn để mỗi nến nguồn nằm trọn trong một khung.
+    """
+    base = timeseries.INTERVALS[interval] if interval else timeseries.RAW_CANDLE_SECONDS
+    span = max((end - start).total_seconds(), 0)
+    stride = max(base, math.ceil(span / (max_points * config.PRICE_HISTORY_DOWNSAMPLE_FACTOR)))
+    source = interval if interval in RESOLUTIONS else None
+    for resolution in RESOLUTIONS:
+        seconds = timeseries.INTERVALS[resolution]
+        if base <= seconds <= stride:
+            source = resolution
+    source_seconds = timeseries.INTERVALS[source] if source else timeseries.RAW_CANDLE_SECONDS
+    stride = math.ceil(stride / source_seconds) * source_seconds
+    stmt = series_select_builder(source)(asset_id, start=start, end=end, order="asc")
+    # Khung đầu tiên bắt đầu tại `start` (đầu khung nguồn chứa `start` khi đọc từ rollup)
+    origin = timeseries.bucket_floor(start, source) if source else start
+    return timeseries.bin_select(stmt, stride, origin)
+
+
+def load_downsampled(db: Session, asset_id: int, max_points: int, start=None, end=None, interval: str = None, order: str = "desc"):
+    """Chuỗi giá tối đa `max_points` điểm cho biểu đồ: gộp trước trong SQL rồi chọn điểm bằng LTTB."""
+    start, end = crud.naive_utc(start), crud.naive_utc(end)
+    if start is None or end is None:
+        # Khoảng mở: lấy mốc đầu/cuối dữ liệu của asset (index (asset_id, date), không quét dòng)
+        table = model.PriceHistory.__table__
+        first, last = db.execute(
+            select(func.min(table.c.date), func.max(table.c.date)).where(table.c.asset_id == asset_id)
+        ).one()
+        if first is None:
+            return []
+        start, end = start or first, end or last
+    if start > end:
+        return []
+    stmt = downsample_select(asset_id, start, end, max_points, interval)
+    return timeseries.load_downsampled(db, stmt, max_points, order=order)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quản lý bảng rollup giá")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild = subparsers.add_parser("rebuild", help="Dựng lại rollup từ price_history")
+    target = rebuild.add_mutually_exclusive_group(required=True)
+    target.add_argument("--asset-id", type=int)
+    target.add_argument("--all", action="store_true")
+    args = parser.parse_args(argv)
+
+    db = database.SessionLocal()
+    try:
+        if args.all:
+            asset_ids = [asset_id for (asset_id,) in db.query(model.Asset.id).all()]
+        else:
+            asset_ids = [args.asset_id]
+        for asset_id in asset_ids:
+            count = rebuild_asset(db, asset_id)
+            print(f"Asset {asset_id}: rebuilt rollups from {count} candles")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 # app/router.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from app import model, database, auth, crud
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
+from app import model, database, analytics, auth, columnar, conditional, crud, config, equity, hashing, ingest, live_valuation, ownership, pagination, partitions, realtime, response_cache, rollups, serializers, streaming, timeseries, tokens, valuation
 from app.schemas import (
     AssetCreate,
     AssetResponse,
@@ -15,7 +19,14 @@ from app.schemas import (
     UserCreate,
     UserResponse,
     PriceHistoryCreate,
-    PriceHistoryResponse
+    PriceHistoryResponse,
+    PriceHistoryBulkResult,
+    PortfolioValuation,
+    EquityCurve,
+    PortfolioAnalytics,
+    TransactionBulkResult,
+    TokenResponse,
+    TokenRefreshRequest,
 )
 
 # Tạo các router riêng biệt
@@ -23,8 +34,11 @@ users_router = APIRouter(prefix="/users", tags=["Users"])
 assets_router = APIRouter(prefix="/assets", tags=["Assets"])
 portfolios_router = APIRouter(prefix="/portfolios", tags=["Portfolios"])
 transactions_router = APIRouter(prefix="/transactions", tags=["Transactions"])
+realtime_router = APIRouter(tags=["Realtime"])
 
-# Dependency chung
+# Dependency chung: các endpoint dùng AsyncSession (database.get_async_db cho primary,
+# database.get_async_read_db cho endpoint chỉ đọc, đi qua read replica); session đồng bộ này
+# chỉ còn cho các endpoint nạp hàng loạt, vốn chạy trong threadpool vì COPY cần driver psycopg
 def get_db():
     db = database.SessionLocal()
     try:
@@ -36,396 +50,987 @@ def get_db():
 
 # Endpoint: Đăng ký người dùng (Register) - Không cần token
 @users_router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(
+async def register_user(
     user: UserCreate,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    existing_user = (
-        db.query(model.User)
-        .filter((model.User.username == user.username) | (model.User.email == user.email))
-        .first()
+    auth.check_login_throttle(request)
+    result = await db.execute(
+        select(model.User).where(
+            (model.User.username == user.username) | (model.User.email == user.email)
+        )
     )
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=400, detail="Username or email already registered"
         )
-    hashed_pw = auth.get_password_hash(user.password)
+    # bcrypt tốn CPU: băm trong process pool riêng, không chiếm event loop hay threadpool
+    hashed_pw = await hashing.hash_password_async(user.password)
     new_user = model.User(username=user.username, email=user.email, hashed_password=hashed_pw)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 # Endpoint: Đăng nhập (Login) - Không cần token
-@users_router.post("/login")
-def login(username: str, password: str, db: Session = Depends(get_db)):
-    user = db.query(model.User).filter(model.User.username == username).first()
-    if not user or not auth.verify_password(password, user.hashed_password):
+@users_router.post("/login", response_model=TokenResponse)
+async def login(
+    username: str,
+    password: str,
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    auth.check_login_throttle(request, username)
+    result = await db.execute(select(model.User).where(model.User.username == username))
+    user = result.scalars().first()
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await hashing.verify_password_async(password, user.hashed_password)
+    if not valid:
+        auth.record_login_failure(username)
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    access_token = auth.create_access_token({"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    auth.reset_login_failures(username)
+    if new_hash:
+        # Tham số băm (BCRYPT_ROUNDS) đã đổi: lưu hash mới, version giữ nguyên nên token cũ vẫn dùng được
+        user.hashed_password = new_hash
+    refresh_token = await tokens.issue_refresh_token(db, user.id)
+    await db.commit()
+    access_token = auth.create_access_token({"sub": user.username, "ver": user.version})
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": config.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token,
+    }
+
+# Endpoint: Cấp access token mới từ refresh token (xoay vòng refresh token) - Không cần mật khẩu
+@users_router.post("/token/refresh", response_model=TokenResponse)
+async def refresh_access_token(
+    body: TokenRefreshRequest,
+    db: AsyncSession = Depends(database.get_async_db),
+):
+    user_id, refresh_token = await tokens.rotate_refresh_token(db, body.refresh_token)
+    user = await db.get(model.User, user_id)
+    await db.commit()
+    access_token = auth.create_access_token({"sub": user.username, "ver": user.version})
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": config.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token,
+    }
+
+# Endpoint: Đăng xuất - thu hồi access token hiện tại và (nếu gửi kèm) cả họ refresh token
+@users_router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    body: Optional[TokenRefreshRequest] = None,
+    token: str = Depends(auth.oauth2_scheme),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    claims = auth.token_claims(token)
+    await tokens.revoke_access_token(
+        db, claims["jti"], datetime.fromtimestamp(claims["exp"], timezone.utc).replace(tzinfo=None)
+    )
+    if body is not None:
+        family_id = await tokens.find_refresh_family(db, current_user.id, body.refresh_token)
+        if family_id is not None:
+            await tokens.revoke_family(db, family_id)
+    return {"message": "Logged out successfully"}
 
 # Endpoint: Lấy thông tin người dùng hiện tại - Yêu cầu token
 @users_router.get("/me", response_model=UserResponse)
-def read_current_user(current_user: model.User = Depends(auth.get_current_user)):
+async def read_current_user(
+    request: Request,
+    response: Response,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    # Principal đọc từ cache: ETag theo chính các trường trả về, không truy vấn DB
+    validators = conditional.validators(
+        conditional.make_etag(
+            "read_current_user",
+            current_user.id,
+            current_user.username,
+            current_user.email,
+            current_user.is_active,
+            current_user.version,
+        ),
+        cache_control=conditional.PRIVATE,
+    )
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
     return current_user
 
+# Phân trang keyset: cursor trang sau trả qua header X-Next-Cursor (body vẫn là danh sách);
+# `skip` (OFFSET) chỉ giữ để tương thích, chi phí tăng theo độ sâu trang
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+# Validator của dữ liệu riêng người dùng: ETag theo mốc thay đổi trong DB, proxy dùng chung không lưu
+def private_validators(name: str, last_modified: Optional[datetime], *parts) -> dict:
+    return conditional.validators(
+        conditional.make_etag(name, last_modified, *parts), last_modified, conditional.PRIVATE
+    )
+
+# Định giá, equity curve và phân tích đổi khi ghi giao dịch/sửa danh mục (portfolio.updated_at) hoặc khi
+# giá của asset đã giao dịch đổi; không có `end` thì kết quả kéo dài tới khung `interval` hiện tại
+async def portfolio_data_validators(
+    db: AsyncSession,
+    portfolio: model.Portfolio,
+    name: str,
+    *parts,
+    interval: Optional[str] = None,
+    end: Optional[datetime] = None,
+    asset_ids=(),
+) -> dict:
+    prices_updated_at = await crud.get_portfolio_prices_version(db, portfolio.id, *asset_ids)
+    stamps = [portfolio.updated_at, prices_updated_at]
+    if interval is not None and end is None:
+        stamps.append(timeseries.bucket_floor(datetime.now(timezone.utc).replace(tzinfo=None), interval))
+    last_modified = max(stamp for stamp in stamps if stamp is not None)
+    return private_validators(name, last_modified, portfolio.id, *stamps, *parts)
+
 # Endpoint: Lấy danh sách tất cả người dùng - Yêu cầu token
 @users_router.get("/", response_model=List[UserResponse])
-def read_users(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+async def read_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(config.LIST_DEFAULT_LIMIT, ge=1, le=config.LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    users = db.query(model.User).offset(skip).limit(limit).all()
-    return users
+    count, last_modified = await crud.get_user_list_version(db)
+    validators = private_validators("read_users", last_modified, count, limit, cursor, skip)
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
+    after = pagination.decode_cursor(cursor, int) if cursor else None
+    stmt = pagination.keyset(select(model.User), (model.User.id,), after).offset(skip)
+    users, next_cursor = await pagination.fetch_page(db, stmt, limit, lambda user: (user.id,))
+    set_next_cursor(response, next_cursor)
+    return serializers.list_response(users, UserResponse, response)
 
 # Endpoint: Lấy thông tin người dùng theo ID - Yêu cầu token
 @users_router.get("/{user_id}", response_model=UserResponse)
-def read_user(
+async def read_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    user = db.query(model.User).filter(model.User.id == user_id).first()
+    user = await db.get(model.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    validators = private_validators("read_user", user.updated_at, user_id)
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
     return user
 
 # Endpoint: Cập nhật thông tin người dùng - Yêu cầu token
 @users_router.put("/me", response_model=UserResponse)
-def update_user(
+async def update_user(
     email: str = None,
     password: str = None,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
+    # current_user là Principal (đọc từ cache): nạp bản ghi ORM để sửa
+    user = await db.get(model.User, current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
     if email:
-        current_user.email = email
+        user.email = email
     if password:
-        current_user.hashed_password = auth.get_password_hash(password)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+        user.hashed_password = await hashing.hash_password_async(password)
+        # Đổi mật khẩu: tăng version để các access token đã cấp không còn hợp lệ, thu hồi refresh token
+        user.version += 1
+        await tokens.revoke_user_refresh_tokens(db, user.id)
+    await db.commit()
+    await db.refresh(user)
+    await auth.invalidate_principal(current_user.username, current_user.version)
+    return user
 
 # Endpoint: Xóa tài khoản người dùng - Yêu cầu token
 @users_router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+async def delete_user(
+    token: str = Depends(auth.oauth2_scheme),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    db.delete(current_user)
-    db.commit()
+    user = await db.get(model.User, current_user.id)
+    if user is not None:
+        await db.delete(user)
+        await db.commit()
+    # Thu hồi ngay token đang dùng: worker khác có thể còn giữ principal trong cache tiến trình
+    claims = auth.token_claims(token)
+    await tokens.revoke_access_token(
+        db, claims["jti"], datetime.fromtimestamp(claims["exp"], timezone.utc).replace(tzinfo=None)
+    )
+    await auth.invalidate_principal(current_user.username, current_user.version)
     return {"message": "User deleted successfully"}
 
 # --- Asset Endpoints ---
 
 # Endpoint: Lấy danh sách tất cả tài sản - Yêu cầu token
 @assets_router.get("/", response_model=List[AssetResponse])
-def read_assets(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+async def read_assets(
+    request: Request,
+    response: Response,
+    limit: int = Query(config.LIST_DEFAULT_LIMIT, ge=1, le=config.LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    return crud.get_assets(db, skip=skip, limit=limit)
+    key, cached = await response_cache.responses.lookup(
+        "read_assets", {"limit": limit, "cursor": cursor, "skip": skip}, ["assets"]
+    )
+    if cached is not None:
+        return conditional.not_modified(request, cached.headers) or cached
+    # ETag theo phiên bản danh mục asset: If-None-Match khớp thì trả 304 mà không đọc trang
+    count, last_modified = await crud.get_asset_catalog_version(db)
+    validators = conditional.validators(
+        conditional.make_etag("read_assets", count, last_modified, limit, cursor, skip), last_modified
+    )
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    after = pagination.decode_cursor(cursor, int) if cursor else None
+    assets, next_cursor = await crud.get_assets(db, skip=skip, limit=limit, after=after)
+    set_next_cursor(response, next_cursor)
+    response.headers.update(validators)
+    return await response_cache.responses.store(
+        key, serializers.list_response(assets, AssetResponse, response)
+    )
 
 # Endpoint: Tạo tài sản mới - Yêu cầu token
 @assets_router.post("/", response_model=AssetResponse, status_code=status.HTTP_201_CREATED)
-def create_asset(
+async def create_asset(
     asset: AssetCreate,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    return crud.create_asset(db, **asset.dict())
+    new_asset = await crud.create_asset(db, **asset.dict())
+    await response_cache.responses.invalidate("assets")
+    return new_asset
 
 # Endpoint: Lấy thông tin tài sản theo ID - Yêu cầu token
 @assets_router.get("/{asset_id}", response_model=AssetResponse)
-def read_asset(
+async def read_asset(
     asset_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    asset = crud.get_asset(db, asset_id)
+    key, cached = await response_cache.responses.lookup(
+        "read_asset", {"asset_id": asset_id}, [f"asset:{asset_id}"]
+    )
+    if cached is not None:
+        return conditional.not_modified(request, cached.headers) or cached
+    asset = await crud.get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
-    return asset
+    validators = conditional.validators(
+        conditional.make_etag("read_asset", asset_id, asset.updated_at), asset.updated_at
+    )
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
+    return await response_cache.responses.store(
+        key, serializers.object_response(asset, AssetResponse, response)
+    )
 
 # Endpoint: Cập nhật thông tin tài sản - Yêu cầu token
 @assets_router.put("/{asset_id}", response_model=AssetResponse)
-def update_asset(
+async def update_asset(
     asset_id: int,
     asset: AssetCreate,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    updated_asset = crud.update_asset(db, asset_id, **asset.dict())
+    updated_asset = await crud.update_asset(db, asset_id, **asset.dict())
     if not updated_asset:
         raise HTTPException(status_code=404, detail="Asset not found")
+    await response_cache.responses.invalidate("assets", f"asset:{asset_id}")
     return updated_asset
 
 # Endpoint: Xóa tài sản - Yêu cầu token
 @assets_router.delete("/{asset_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_asset(
+async def delete_asset(
     asset_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    asset = crud.get_asset(db, asset_id)
+    asset = await crud.get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
-    crud.delete_asset(db, asset_id)
+    await crud.delete_asset(db, asset_id)
+    await response_cache.responses.invalidate("assets", f"asset:{asset_id}")
     return {"message": "Asset deleted successfully"}
 
 # --- Portfolio Endpoints ---
 
 # Endpoint: Tạo danh mục đầu tư mới - Yêu cầu token
 @portfolios_router.post("/", response_model=PortfolioResponse, status_code=status.HTTP_201_CREATED)
-def create_portfolio(
+async def create_portfolio(
     portfolio: PortfolioCreate,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
     portfolio_data = portfolio.dict()
     portfolio_data["user_id"] = current_user.id
-    new_portfolio = crud.create_portfolio(db, **portfolio_data)
+    new_portfolio = await crud.create_portfolio(db, **portfolio_data)
     return new_portfolio
 
+# Endpoint: Lấy danh sách danh mục đầu tư của người dùng hiện tại - Yêu cầu token
+# (khai báo trước /{portfolio_id} để "my-portfolios" không bị hiểu là ID)
+@portfolios_router.get("/my-portfolios", response_model=List[PortfolioResponse])
+async def read_user_portfolios(
+    request: Request,
+    response: Response,
+    limit: int = Query(config.LIST_DEFAULT_LIMIT, ge=1, le=config.LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    count, last_modified = await crud.get_portfolio_list_version(db, current_user.id)
+    validators = private_validators("read_user_portfolios", last_modified, current_user.id, count, limit, cursor)
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
+    after = pagination.decode_cursor(cursor, int) if cursor else None
+    stmt = pagination.keyset(
+        select(model.Portfolio).where(model.Portfolio.user_id == current_user.id),
+        (model.Portfolio.id,),
+        after,
+    )
+    portfolios, next_cursor = await pagination.fetch_page(db, stmt, limit, lambda portfolio: (portfolio.id,))
+    set_next_cursor(response, next_cursor)
+    return serializers.list_response(portfolios, PortfolioResponse, response)
+
 # Endpoint: Lấy thông tin danh mục đầu tư theo ID - Yêu cầu token
 @portfolios_router.get("/{portfolio_id}", response_model=PortfolioResponse)
-def read_portfolio(
+async def read_portfolio(
     portfolio_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
-):
-    portfolio = crud.get_portfolio(db, portfolio_id)
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    if portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to view this portfolio")
-    return portfolio
-
-# Endpoint: Lấy danh sách danh mục đầu tư của người dùng hiện tại - Yêu cầu token
-@portfolios_router.get("/my-portfolios", response_model=List[PortfolioResponse])
-def read_user_portfolios(
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    portfolios = db.query(model.Portfolio).filter(model.Portfolio.user_id == current_user.id).all()
-    return portfolios
+    portfolio = await ownership.get_owned_portfolio(
+        db, portfolio_id, current_user.id, "view this portfolio"
+    )
+    validators = private_validators("read_portfolio", portfolio.updated_at, portfolio_id)
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
+    return portfolio
 
 # Endpoint: Cập nhật danh mục đầu tư - Yêu cầu token và quyền sở hữu
 @portfolios_router.put("/{portfolio_id}", response_model=PortfolioResponse)
-def update_portfolio(
+async def update_portfolio(
     portfolio_id: int,
     portfolio: PortfolioBase,  # Nhận dữ liệu từ body thay vì query
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
-):
-    existing_portfolio = crud.get_portfolio(db, portfolio_id)
-    if not existing_portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    if existing_portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this portfolio")
-
-    updated_portfolio = crud.update_portfolio(db, portfolio_id, name=portfolio.name)
-    if portfolio.description is not None:
-        updated_portfolio.description = portfolio.description
-        db.commit()
-        db.refresh(updated_portfolio)
-    return updated_portfolio
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    await ownership.get_owned_portfolio(
+        db, portfolio_id, current_user.id, "update this portfolio"
+    )
+
+    return await crud.update_portfolio(
+        db, portfolio_id, name=portfolio.name, description=portfolio.description
+    )
 
 # Endpoint: Xóa danh mục đầu tư - Yêu cầu token và quyền sở hữu
 @portfolios_router.delete("/{portfolio_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_portfolio(
+async def delete_portfolio(
     portfolio_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
-):
-    portfolio = crud.get_portfolio(db, portfolio_id)
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    if portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this portfolio")
-    crud.delete_portfolio(db, portfolio_id)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    await ownership.get_owned_portfolio(
+        db, portfolio_id, current_user.id, "delete this portfolio"
+    )
+    await crud.delete_portfolio(db, portfolio_id)
     return {"message": "Portfolio deleted successfully"}
 
+# Endpoint: Định giá danh mục (khối lượng, giá vốn, lãi/lỗ) - Yêu cầu token và quyền sở hữu
+@portfolios_router.get("/{portfolio_id}/valuation", response_model=PortfolioValuation)
+async def read_portfolio_valuation(
+    portfolio_id: int,
+    request: Request,
+    response: Response,
+    method: Literal["average", "fifo"] = "average",
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    portfolio = await ownership.get_owned_portfolio(
+        db, portfolio_id, current_user.id, "view this portfolio"
+    )
+    validators = await portfolio_data_validators(db, portfolio, "read_portfolio_valuation", method)
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
+    return await db.run_sync(valuation.value_portfolio, portfolio_id, method=method)
+
+# Endpoint: Đường giá trị danh mục theo thời gian (kèm lợi suất và drawdown) - Yêu cầu token và quyền sở hữu
+@portfolios_router.get("/{portfolio_id}/equity-curve", response_model=EquityCurve)
+async def read_portfolio_equity_curve(
+    portfolio_id: int,
+    request: Request,
+    response: Response,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: Literal["1m", "5m", "1h", "1d", "1w"] = "1d",
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    # Accept: application/vnd.apache.arrow.stream hoặc application/vnd.apache.parquet -> bảng theo cột
+    format = columnar.negotiate(request.headers.get("accept"))
+    portfolio = await ownership.get_owned_portfolio(
+        db, portfolio_id, current_user.id, "view this portfolio"
+    )
+    validators = await portfolio_data_validators(
+        db, portfolio, "read_portfolio_equity_curve", start, end, format, interval=interval, end=end
+    )
+    validators["vary"] = "Accept"
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    if format is not None:
+        grid, series = await db.run_sync(
+            equity.equity_frame, portfolio_id, start=start, end=end, interval=interval
+        )
+        return columnar.table_response(
+            {"date": grid.astype("datetime64[us]"), **series},
+            format,
+            metadata={
+                "portfolio_id": portfolio_id,
+                "interval": interval,
+                "total_return": float(series["cumulative_return"][-1]),
+                "max_drawdown": float(series["drawdown"].min()),
+            },
+            headers=validators,
+        )
+    response.headers.update(validators)
+    return await db.run_sync(
+        equity.equity_curve, portfolio_id, start=start, end=end, interval=interval
+    )
+
+# Endpoint: Chỉ số rủi ro/hiệu suất (biến động, Sharpe/Sortino, drawdown, beta, tương quan) - Yêu cầu token và quyền sở hữu
+@portfolios_router.get("/{portfolio_id}/analytics", response_model=PortfolioAnalytics)
+async def read_portfolio_analytics(
+    portfolio_id: int,
+    request: Request,
+    response: Response,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: Literal["1h", "1d", "1w"] = "1d",
+    window: int = Query(30, ge=2, le=1000),
+    benchmark_asset_id: Optional[int] = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    portfolio = await ownership.get_owned_portfolio(
+        db, portfolio_id, current_user.id, "view this portfolio"
+    )
+    validators = await portfolio_data_validators(
+        db,
+        portfolio,
+        "read_portfolio_analytics",
+        start,
+        end,
+        window,
+        benchmark_asset_id,
+        interval=interval,
+        end=end,
+        asset_ids=() if benchmark_asset_id is None else (benchmark_asset_id,),
+    )
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
+    return await db.run_sync(
+        analytics.portfolio_analytics,
+        portfolio_id,
+        start=start,
+        end=end,
+        interval=interval,
+        window=window,
+        benchmark_asset_id=benchmark_asset_id,
+    )
+
+# Endpoint: Nhập giao dịch hàng loạt từ file sàn (JSON array, NDJSON hoặc CSV) - kiểm tra quyền sở hữu một lần
+@portfolios_router.post("/{portfolio_id}/transactions:bulk", response_model=TransactionBulkResult)
+async def bulk_import_transactions(
+    portfolio_id: int,
+    request: Request,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    sync_db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    await ownership.get_owned_portfolio(
+        db, portfolio_id, current_user.id, "add transaction to this portfolio"
+    )
+    return await ingest.ingest_transactions(sync_db, request, portfolio_id, fmt=format)
+
 # --- Transaction Endpoints ---
 
 # Endpoint: Tạo giao dịch mới - Yêu cầu token và quyền sở hữu danh mục
 @transactions_router.post("/", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
-def create_transaction(
+async def create_transaction(
     transaction: TransactionCreate,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
-):
-    portfolio = crud.get_portfolio(db, transaction.portfolio_id)
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    if portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to add transaction to this portfolio")
-    new_transaction = crud.create_transaction(db, **transaction.dict())
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    await ownership.get_owned_portfolio(
+        db, transaction.portfolio_id, current_user.id, "add transaction to this portfolio"
+    )
+    if transaction.external_id and await crud.get_transaction_by_external_id(
+        db, transaction.portfolio_id, transaction.external_id
+    ):
+        raise HTTPException(status_code=400, detail="Transaction with this external_id already exists")
+    new_transaction = await crud.create_transaction(db, **transaction.dict())
     return new_transaction
 
 # Endpoint: Lấy thông tin giao dịch theo ID - Yêu cầu token và quyền sở hữu danh mục
 @transactions_router.get("/{transaction_id}", response_model=TransactionResponse)
-def read_transaction(
+async def read_transaction(
     transaction_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
-):
-    transaction = db.query(model.Transaction).filter(model.Transaction.id == transaction_id).first()
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    portfolio = crud.get_portfolio(db, transaction.portfolio_id)
-    if portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to view this transaction")
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    transaction = await ownership.get_owned_transaction(
+        db, transaction_id, current_user.id, "view this transaction"
+    )
+    # Giao dịch không có mốc sửa riêng: ETag theo các cột đã đọc (304 bỏ qua serialize và truyền body)
+    validators = conditional.validators(
+        conditional.make_etag(
+            "read_transaction",
+            *(getattr(transaction, column.key) for column in model.Transaction.__table__.columns),
+        ),
+        cache_control=conditional.PRIVATE,
+    )
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
     return transaction
 
 # Endpoint: Lấy danh sách giao dịch theo danh mục đầu tư - Yêu cầu token và quyền sở hữu
 @transactions_router.get("/portfolio/{portfolio_id}", response_model=List[TransactionResponse])
-def transactions_by_portfolio(
+async def transactions_by_portfolio(
+    portfolio_id: int,
+    request: Request,
+    response: Response,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    asset_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    limit: int = Query(config.LIST_DEFAULT_LIMIT, ge=1, le=config.LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    after = pagination.decode_cursor(cursor, datetime, int) if cursor else None
+    # Kiểm tra quyền sở hữu và lấy một trang giao dịch trong cùng một truy vấn
+    transactions, next_cursor, last_modified = await ownership.list_owned_transactions(
+        db,
+        portfolio_id,
+        current_user.id,
+        limit,
+        after,
+        start=start,
+        end=end,
+        asset_id=asset_id,
+        transaction_type=transaction_type,
+    )
+    # Trang đã đọc cùng truy vấn kiểm tra quyền; 304 bỏ qua serialize và truyền body
+    validators = private_validators(
+        "transactions_by_portfolio", last_modified, portfolio_id, start, end, asset_id, transaction_type, limit, cursor
+    )
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(validators)
+    set_next_cursor(response, next_cursor)
+    return serializers.list_response(transactions, TransactionResponse, response)
+
+# Endpoint: Export toàn bộ giao dịch của danh mục (NDJSON, CSV hoặc CSV nén gzip) - Yêu cầu token và quyền sở hữu
+@transactions_router.get("/portfolio/{portfolio_id}/export")
+async def export_transactions(
     portfolio_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    format: Literal["ndjson", "csv", "csv.gz"] = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    asset_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    portfolio = crud.get_portfolio(db, portfolio_id)
-    if not portfolio:
-        raise HTTPException(status_code=404, detail="Portfolio not found")
-    if portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to view transactions of this portfolio")
-    return crud.get_transactions(db, portfolio_id)
+    await ownership.get_owned_portfolio(db, portfolio_id, current_user.id, "export this portfolio")
+    # Dòng được đọc qua server-side cursor trên session riêng, mở trong lúc stream body
+    rows = streaming.iter_with_session(
+        crud.iter_rows,
+        crud.transaction_select(
+            portfolio_id, start=start, end=end, asset_id=asset_id, transaction_type=transaction_type
+        ),
+        batch_size=config.STREAM_BATCH_SIZE,
+    )
+    return streaming.export_response(
+        rows,
+        crud.TRANSACTION_COLUMNS,
+        format,
+        f"portfolio-{portfolio_id}-transactions",
+        chunk_rows=config.STREAM_BATCH_SIZE,
+    )
 
 # Endpoint: Cập nhật giao dịch - Yêu cầu token và quyền sở hữu danh mục
 # Endpoint: Cập nhật giao dịch - Nhận dữ liệu từ body
 @transactions_router.put("/{transaction_id}", response_model=TransactionResponse)
-def update_transaction(
+async def update_transaction(
     transaction_id: int,
     transaction: TransactionCreate,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
-):
-    existing_transaction = db.query(model.Transaction).filter(model.Transaction.id == transaction_id).first()
-    if not existing_transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    portfolio = crud.get_portfolio(db, existing_transaction.portfolio_id)
-    if portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this transaction")
-
-    for key, value in transaction.dict().items():
-        setattr(existing_transaction, key, value)
-    db.commit()
-    db.refresh(existing_transaction)
-    return existing_transaction
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    existing_transaction = await ownership.get_owned_transaction(
+        db, transaction_id, current_user.id, "update this transaction"
+    )
+
+    if transaction.portfolio_id != existing_transaction.portfolio_id:
+        await ownership.get_owned_portfolio(
+            db, transaction.portfolio_id, current_user.id, "add transaction to this portfolio"
+        )
+
+    if transaction.external_id:
+        duplicate = await crud.get_transaction_by_external_id(
+            db, transaction.portfolio_id, transaction.external_id
+        )
+        if duplicate and duplicate.id != existing_transaction.id:
+            raise HTTPException(status_code=400, detail="Transaction with this external_id already exists")
+
+    return await crud.update_transaction(db, existing_transaction, **transaction.dict())
 
 # Endpoint: Xóa giao dịch - Yêu cầu token và quyền sở hữu danh mục
 @transactions_router.delete("/{transaction_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_transaction(
+async def delete_transaction(
     transaction_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
-):
-    transaction = db.query(model.Transaction).filter(model.Transaction.id == transaction_id).first()
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    portfolio = crud.get_portfolio(db, transaction.portfolio_id)
-    if portfolio.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this transaction")
-    crud.delete_transaction(db, transaction_id)
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    await ownership.get_owned_transaction(
+        db, transaction_id, current_user.id, "delete this transaction"
+    )
+    await crud.delete_transaction(db, transaction_id)
     return {"message": "Transaction deleted successfully"}
 
 
-# Endpoint: Lấy lịch sử giá của một asset
+# Endpoint: Lấy lịch sử giá của một asset (lọc theo khoảng thời gian, gộp nến, phân trang bằng cursor)
 @assets_router.get("/{asset_id}/price-history", response_model=List[PriceHistoryResponse])
-def read_price_history(
+async def read_price_history(
     asset_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(config.PRICE_HISTORY_DEFAULT_LIMIT, ge=1, le=config.PRICE_HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "asc",
+    interval: Optional[Literal["1m", "5m", "1h", "1d", "1w"]] = None,
+    max_points: Optional[int] = Query(None, ge=3, le=config.PRICE_HISTORY_MAX_POINTS),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
-    asset = crud.get_asset(db, asset_id)
+    # Accept: application/vnd.apache.arrow.stream hoặc application/vnd.apache.parquet -> batch theo cột
+    format = columnar.negotiate(request.headers.get("accept"))
+    # Chỉ cache body JSON; khoảng đã đóng (mọi nến trước `end` đã hoàn tất) được giữ không hết hạn,
+    # chỉ bị thay khi ghi/sửa/xóa giá của asset
+    params = {
+        "asset_id": asset_id,
+        "start": start,
+        "end": end,
+        "limit": limit,
+        "cursor": cursor,
+        "order": order,
+        "interval": interval,
+        "max_points": max_points,
+    }
+    key = None
+    if format is None:
+        key, cached = await response_cache.responses.lookup(
+            "read_price_history", params, [f"asset:{asset_id}", "prices", f"prices:{asset_id}"]
+        )
+        if cached is not None:
+            return conditional.not_modified(request, cached.headers) or cached
+    immutable = timeseries.is_closed_range(end, interval)
+    asset = await crud.get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
+    # ETag theo lần ghi giá gần nhất của asset: kiểm tra trước khi đọc nến
+    headers = {
+        "vary": "Accept",
+        **conditional.validators(
+            conditional.make_etag("read_price_history", params, format, asset.prices_updated_at),
+            asset.prices_updated_at,
+            conditional.IMMUTABLE if immutable else conditional.SHARED,
+        ),
+    }
+    not_modified = conditional.not_modified(request, headers)
+    if not_modified is not None:
+        return not_modified
 
-    price_history = crud.get_price_history_by_asset(db, asset_id)
-    return price_history
+    # Chế độ biểu đồ: trả về toàn bộ khoảng [start, end] đã giảm còn tối đa max_points điểm
+    if max_points is not None:
+        if cursor:
+            raise HTTPException(status_code=400, detail="cursor cannot be combined with max_points")
+        rows = await db.run_sync(
+            rollups.load_downsampled, asset_id, max_points, start=start, end=end, interval=interval, order=order
+        )
+        return response_cache.responses.store_stream(key, price_rows_response(rows, format, headers), immutable)
+
+    filters = {"start": start, "end": end, "order": order}
+    if cursor:
+        (filters["after"],) = pagination.decode_cursor(cursor, datetime)
+    # Khung 1h/1d/1w đọc từ bảng rollup, các khung nhỏ hơn gộp trực tiếp từ nến thô
+    build_select = rollups.series_select_builder(interval)
+
+    # Cursor trang sau được trả qua header để body vẫn là danh sách nến như trước
+    page_end = await crud.get_page_end(db, build_select(asset_id, keys_only=True, **filters), limit)
+    if page_end is not None:
+        headers["X-Next-Cursor"] = pagination.encode_cursor(page_end)
+
+    rows = streaming.iter_with_session(
+        crud.iter_rows,
+        build_select(asset_id, **filters).limit(limit),
+        batch_size=config.STREAM_BATCH_SIZE,
+    )
+    return response_cache.responses.store_stream(key, price_rows_response(rows, format, headers), immutable)
+
+
+def price_rows_response(rows, format: Optional[str], headers: dict):
+    if format is not None:
+        return columnar.rows_response(
+            rows,
+            columnar.price_history_schema(crud.PRICE_HISTORY_COLUMNS),
+            format,
+            config.COLUMNAR_BATCH_SIZE,
+            headers=headers,
+        )
+    return StreamingResponse(
+        streaming.json_array_stream(rows, crud.PRICE_HISTORY_COLUMNS),
+        media_type="application/json",
+        headers=headers,
+    )
+
+# Endpoint: Export toàn bộ lịch sử giá của asset (NDJSON, CSV hoặc CSV nén gzip) theo thứ tự thời gian
+@assets_router.get("/{asset_id}/price-history/export")
+async def export_price_history(
+    asset_id: int,
+    format: Literal["ndjson", "csv", "csv.gz"] = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: Optional[Literal["1m", "5m", "1h", "1d", "1w"]] = None,
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    asset = await crud.get_asset(db, asset_id)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    build_select = rollups.series_select_builder(interval)
+    rows = streaming.iter_with_session(
+        crud.iter_rows,
+        build_select(asset_id, start=start, end=end, order="asc"),
+        batch_size=config.STREAM_BATCH_SIZE,
+    )
+    return streaming.export_response(
+        rows,
+        crud.PRICE_HISTORY_COLUMNS,
+        format,
+        f"{asset.symbol}-{interval or 'raw'}-price-history",
+        chunk_rows=config.STREAM_BATCH_SIZE,
+    )
 
 # Endpoint: Tạo lịch sử giá mới cho asset
 @assets_router.post("/{asset_id}/price-history", response_model=PriceHistoryResponse, status_code=status.HTTP_201_CREATED)
-def create_price_history(
+async def create_price_history(
     asset_id: int,
     price_history: PriceHistoryCreate,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
     # Kiểm tra asset tồn tại
-    asset = crud.get_asset(db, asset_id)
+    asset = await crud.get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
     # Tạo bản ghi mới
-    new_price_history = crud.create_price_history(
+    new_price_history = await crud.create_price_history(
         db=db,
         asset_id=asset_id,
         date=price_history.date,
         open_price=price_history.open_price,
         close_price=price_history.close_price,
         high_price=price_history.high_price,
-        low_price=price_history.low_price
+        low_price=price_history.low_price,
+        volume=price_history.volume,
     )
+    await response_cache.responses.invalidate(f"prices:{asset_id}")
     return new_price_history
 
+# Endpoint: Nạp lịch sử giá hàng loạt cho một asset (JSON array, NDJSON hoặc CSV)
+@assets_router.post("/{asset_id}/price-history/bulk", response_model=PriceHistoryBulkResult)
+async def bulk_create_price_history(
+    asset_id: int,
+    request: Request,
+    format: Optional[str] = None,
+    method: str = "copy",
+    refresh_rollups: bool = True,
+    db: AsyncSession = Depends(database.get_async_db),
+    sync_db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    asset = await crud.get_asset(db, asset_id)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    # Các lô đã commit vẫn có hiệu lực khi lô sau lỗi: luôn vô hiệu hóa cache
+    try:
+        return await ingest.ingest_price_history(
+            sync_db,
+            request,
+            asset_id=asset_id,
+            fmt=format,
+            method=method,
+            refresh_rollups=refresh_rollups,
+        )
+    finally:
+        await response_cache.responses.invalidate(f"prices:{asset_id}")
+
+# Endpoint: Nạp lịch sử giá hàng loạt cho nhiều asset (mỗi dòng có asset_id)
+@assets_router.post("/price-history/bulk", response_model=PriceHistoryBulkResult)
+async def bulk_create_price_history_multi_asset(
+    request: Request,
+    format: Optional[str] = None,
+    method: str = "copy",
+    refresh_rollups: bool = True,
+    sync_db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    try:
+        return await ingest.ingest_price_history(
+            sync_db, request, fmt=format, method=method, refresh_rollups=refresh_rollups
+        )
+    finally:
+        # Lô nhiều asset: vô hiệu hóa cache giá của mọi asset
+        await response_cache.responses.invalidate("prices")
+
 # Endpoint: Cập nhật lịch sử giá cho asset
-@assets_router.put("/{asset_id}/price-history/{price_history_id}", response_model=PriceHistoryResponse)
-def update_price_history(
+@assets_router.put("/{asset_id}/price-history/{date}", response_model=PriceHistoryResponse)
+async def update_price_history(
     asset_id: int,
-    price_history_id: int,
+    date: datetime,
     price_history: PriceHistoryCreate,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
     # Kiểm tra asset tồn tại
-    asset = crud.get_asset(db, asset_id)
+    asset = await crud.get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
     # Kiểm tra price_history tồn tại
-    existing_price_history = db.query(model.PriceHistory).filter(
-        model.PriceHistory.id == price_history_id,
-        model.PriceHistory.asset_id == asset_id
-    ).first()
+    existing_price_history = await db.get(model.PriceHistory, (asset_id, date))
     if not existing_price_history:
         raise HTTPException(status_code=404, detail="Price history not found")
 
-    # Cập nhật dữ liệu
-    for key, value in price_history.dict().items():
+    # Cập nhật dữ liệu (asset_id luôn lấy theo URL; đổi date có thể chuyển nến sang partition khác)
+    old_date = existing_price_history.date
+    new_date = crud.naive_utc(price_history.date)
+    await db.run_sync(partitions.ensure_price_history_partitions, [new_date])
+    for key, value in price_history.dict(exclude={"asset_id", "date"}).items():
         setattr(existing_price_history, key, value)
-    db.commit()
-    db.refresh(existing_price_history)
+    existing_price_history.date = new_date
+    await db.flush()
+    await db.run_sync(
+        rollups.refresh_rollups, asset_id, min(old_date, new_date), max(old_date, new_date)
+    )
+    await db.execute(crud.touch_prices_statement([asset_id]))
+    await db.execute(crud.notify_prices_statement([crud.price_row(existing_price_history)]))
+    await db.commit()
+    await response_cache.responses.invalidate(f"prices:{asset_id}")
+    await db.refresh(existing_price_history)
     return existing_price_history
 
 # Endpoint: Xóa lịch sử giá cho asset
-@assets_router.delete("/{asset_id}/price-history/{price_history_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_price_history(
+@assets_router.delete("/{asset_id}/price-history/{date}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_price_history(
     asset_id: int,
-    price_history_id: int,
-    db: Session = Depends(get_db),
-    current_user: model.User = Depends(auth.get_current_user),
+    date: datetime,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
     # Kiểm tra asset tồn tại
-    asset = crud.get_asset(db, asset_id)
+    asset = await crud.get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
     # Kiểm tra price_history tồn tại
-    price_history = db.query(model.PriceHistory).filter(
-        model.PriceHistory.id == price_history_id,
-        model.PriceHistory.asset_id == asset_id
-    ).first()
+    price_history = await db.get(model.PriceHistory, (asset_id, date))
     if not price_history:
         raise HTTPException(status_code=404, detail="Price history not found")
 
-    # Xóa bản ghi
-    db.delete(price_history)
-    db.commit()
-    return {"message": "Price history deleted successfully"}
\ No newline at end of file
+    # Xóa bản ghi và cập nhật các khung rollup chứa nến này
+    await db.delete(price_history)
+    await db.flush()
+    await db.run_sync(rollups.refresh_rollups, asset_id, price_history.date, price_history.date)
+    await db.execute(crud.touch_prices_statement([asset_id]))
+    await db.commit()
+    await response_cache.responses.invalidate(f"prices:{asset_id}")
+    return {"message": "Price history deleted successfully"}
+
+# --- Realtime Endpoints ---
+
+# Endpoint: Nhận nến mới qua WebSocket - token qua query `token` (hoặc header Authorization),
+# symbol ban đầu qua query `symbols=BTC,ETH`; sau đó gửi {"action": "subscribe"|"unsubscribe", "symbols": [...]}
+@realtime_router.websocket("/ws/prices")
+async def price_stream(websocket: WebSocket):
+    await realtime.serve_websocket(websocket)
+
+# Endpoint: Nhận nến mới qua Server-Sent Events (thay thế khi không dùng được WebSocket)
+@realtime_router.get("/sse/prices")
+async def price_events(request: Request, symbols: str):
+    return await realtime.sse_response(request, realtime.prices, symbols, {})
+
+# Endpoint: Nhận định giá danh mục (giá trị, lãi/lỗ) mỗi khi asset đang giữ có giá mới, qua WebSocket -
+# token như /ws/prices, danh mục ban đầu qua query `portfolio_ids=1,2` (chỉ danh mục của người dùng);
+# sau đó gửi {"action": "subscribe"|"unsubscribe", "portfolio_ids": [...], "method": "average"|"fifo"}
+@realtime_router.websocket("/ws/portfolios")
+async def portfolio_valuation_stream(websocket: WebSocket, method: Literal["average", "fifo"] = "average"):
+    await realtime.serve_websocket(websocket, live_valuation.portfolios, {"method": method})
+
+# Endpoint: Nhận định giá danh mục qua Server-Sent Events
+@realtime_router.get("/sse/portfolios")
+async def portfolio_valuation_events(
+    request: Request, portfolio_ids: str, method: Literal["average", "fifo"] = "average"
+):
+    return await realtime.sse_response(request, live_valuation.portfolios, portfolio_ids, {"method": method})
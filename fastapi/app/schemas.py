@@ -23,6 +23,17 @@ class UserResponse(UserBase):
         orm_mode = True
 
 
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int  # Giây
+    refresh_token: str
+
+
+class TokenRefreshRequest(BaseModel):
+    refresh_token: str
+
+
 # --- Asset schemas ---
 
 
@@ -74,6 +85,7 @@ class PriceHistoryBase(BaseModel):
     close_price: Optional[float] = None
     high_price: Optional[float] = None
     low_price: Optional[float] = None
+    volume: Optional[float] = None
 
 
 class PriceHistoryCreate(PriceHistoryBase):
@@ -81,8 +93,6 @@ class PriceHistoryCreate(PriceHistoryBase):
 
 
 class PriceHistoryResponse(PriceHistoryBase):
-    id: int
-
     class Config:
         orm_mode = True
 
@@ -97,6 +107,7 @@ class TransactionBase(BaseModel):
     price: float
     transaction_type: str = Field(..., min_length=1, max_length=10)  # "mua" or "bán"
     transaction_date: Optional[datetime] = None
+    external_id: Optional[str] = Field(None, max_length=100)  # Mã giao dịch phía sàn
 
 
 class TransactionCreate(TransactionBase):
@@ -110,21 +121,139 @@ class TransactionResponse(TransactionBase):
         orm_mode = True
 
 
-class PriceHistoryBase(BaseModel):
+# --- Valuation schemas ---
+
+
+class HoldingValuation(BaseModel):
+    asset_id: int
+    symbol: str
+    quantity: float
+    average_cost: Optional[float] = None
+    cost_basis: float
+    realized_pnl: float
+    last_price: Optional[float] = None
+    last_price_date: Optional[datetime] = None
+    market_value: Optional[float] = None
+    unrealized_pnl: Optional[float] = None
+
+
+class PortfolioValuation(BaseModel):
+    portfolio_id: int
+    method: str  # "average" hoặc "fifo"
+    valued_at: datetime
+    holdings: List[HoldingValuation]
+    total_cost_basis: float
+    total_market_value: float
+    total_realized_pnl: float
+    total_unrealized_pnl: float
+
+
+class EquityCurvePoint(BaseModel):
+    date: datetime  # Đầu khung; giá trị tính tại giá đóng cửa của khung
+    market_value: float
+    net_invested: float  # Tổng tiền mua trừ tiền bán tích lũy
+    pnl: float
+    period_return: float  # Lợi suất trong khung, đã loại dòng tiền vào/ra
+    cumulative_return: float  # Lợi suất tích lũy (time-weighted)
+    drawdown: float
+
+
+class EquityCurve(BaseModel):
+    portfolio_id: int
+    interval: str
+    start: datetime
+    end: datetime
+    points: List[EquityCurvePoint]
+    total_return: float
+    max_drawdown: float
+
+
+class RiskMetrics(BaseModel):
+    annualized_return: Optional[float] = None
+    volatility: Optional[float] = None  # Độ biến động theo năm trên toàn khoảng
+    rolling_volatility: Optional[float] = None  # Độ biến động theo năm của cửa sổ gần nhất
+    sharpe: Optional[float] = None
+    sortino: Optional[float] = None
+    max_drawdown: Optional[float] = None
+    beta: Optional[float] = None
+
+
+class AssetRiskMetrics(RiskMetrics):
     asset_id: int
+    symbol: str
+    weight: float  # Tỷ trọng theo giá trị thị trường hiện tại
+
+
+class RollingVolatilityPoint(BaseModel):
+    date: datetime
+    value: Optional[float] = None
+
+
+class CorrelationMatrix(BaseModel):
+    asset_ids: List[int]
+    matrix: List[List[Optional[float]]]
+
+
+class PortfolioAnalytics(BaseModel):
+    portfolio_id: int
+    interval: str
+    window: int
+    start: datetime
+    end: datetime
+    periods: int
+    benchmark_asset_id: Optional[int] = None
+    assets: List[AssetRiskMetrics]
+    portfolio: RiskMetrics
+    rolling_volatility: List[RollingVolatilityPoint]
+    correlation: CorrelationMatrix
+
+
+# --- Bulk ingestion schemas ---
+
+
+class PriceHistoryBulkItem(BaseModel):
+    asset_id: Optional[int] = None  # Bỏ trống khi asset_id đã có trên URL
     date: datetime
     open_price: Optional[float] = None
     close_price: Optional[float] = None
     high_price: Optional[float] = None
     low_price: Optional[float] = None
+    volume: Optional[float] = None
 
 
-class PriceHistoryCreate(PriceHistoryBase):
-    pass
+class PriceHistoryBulkReject(BaseModel):
+    line: int
+    error: str
 
 
-class PriceHistoryResponse(PriceHistoryBase):
-    id: int
+class PriceHistoryBulkResult(BaseModel):
+    method: str
+    received: int
+    loaded: int
+    rejected: int
+    rejected_rows: List[PriceHistoryBulkReject] = []
+    elapsed_seconds: float
+    rows_per_second: float
 
-    class Config:
-        orm_mode = True
+
+# --- Bulk transaction import schemas ---
+
+
+class TransactionBulkItem(BaseModel):
+    asset_id: Optional[int] = None
+    symbol: Optional[str] = None  # Dùng khi không có asset_id
+    quantity: float = Field(..., gt=0)
+    price: float = Field(..., ge=0)
+    transaction_type: str = Field(..., min_length=1, max_length=10)
+    transaction_date: Optional[datetime] = None
+    external_id: Optional[str] = Field(None, max_length=100)
+
+
+class TransactionBulkResult(BaseModel):
+    received: int
+    inserted: int
+    duplicates: int  # Bỏ qua do external_id đã tồn tại
+    rejected: int
+    rejected_rows: List[PriceHistoryBulkReject] = []
+    elapsed_seconds: float
+    rows_per_second: float
@@ -0,0 +1,133 @@
+# app/streaming.py
+import csv
+import io
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+from app import database
+
+
+def jsonable_value(value):
+    """Chuyển Decimal/datetime từ DB sang kiểu JSON cơ bản."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def row_to_dict(row, columns) -> dict:
+    return {column: jsonable_value(value) for column, value in zip(columns, row)}
+
+
+async def json_array_stream(rows, columns, chunk_rows: int = 1000):
+    """Sinh body JSON array theo từng khối dòng, không dựng toàn bộ danh sách trong bộ nhớ.
+
+    `rows` có thể là iterable thường (danh sách đã tính) hoặc async iterable (đọc từ cursor).
+    """
+    yield b"["
+    first = True
+    chunk = []
+    async for row in aiterate(rows):
+        chunk.append(orjson.dumps(row_to_dict(row, columns)))
+        if len(chunk) >= chunk_rows:
+            yield (b"" if first else b",") + b",".join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield (b"" if first else b",") + b",".join(chunk)
+    yield b"]"
+
+
+async def batched(rows, size: int):
+    """Gom dòng thành các lô `size` dòng: mỗi lô thành một chunk của body chunked."""
+    batch = []
+    async for row in aiterate(rows):
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_stream(rows, columns, chunk_rows: int = 1000):
+    """Mỗi dòng một object JSON, phân tách bằng xuống dòng (NDJSON)."""
+    async for batch in batched(rows, chunk_rows):
+        yield b"".join(orjson.dumps(row_to_dict(row, columns)) + b"\n" for row in batch)
+
+
+def csv_cell(value):
+    # Decimal ghi nguyên dạng chuỗi (không làm tròn qua float), None thành ô trống
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def csv_stream(rows, columns, chunk_rows: int = 1000):
+    """CSV có dòng tiêu đề; mỗi lô dòng được ghi vào buffer riêng rồi trả ra ngay."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+    async for batch in batched(rows, chunk_rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([csv_cell(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def gzip_stream(chunks, level: int = 6):
+    """Nén gzip tăng dần từng chunk, không giữ toàn bộ dữ liệu trong bộ nhớ."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: định dạng gzip
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+# Định dạng export: media type và phần mở rộng tên file
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+}
+
+
+def export_response(rows, columns, format: str, filename: str, chunk_rows: int = 1000):
+    """StreamingResponse (chunked) cho `rows` theo định dạng export; bộ nhớ không phụ thuộc số dòng."""
+    media_type, extension = EXPORT_FORMATS[format]
+    if format == "ndjson":
+        body = ndjson_stream(rows, columns, chunk_rows)
+    else:
+        body = csv_stream(rows, columns, chunk_rows)
+        if format == "csv.gz":
+            body = gzip_stream(body)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+    )
+
+
+async def aiterate(rows):
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+async def iter_with_session(fn, *args, **kwargs):
+    """Chạy async generator đọc DB trên AsyncSession riêng (read replica), đóng session khi response stream xong."""
+    async with database.read_session() as db:
+        async for row in fn(db, *args, **kwargs):
+            yield row
@@ -0,0 +1,42 @@
+# app/throttle.py
+import time
+from collections import deque
+
+from app.cache import LRUCache
+
+
+class SlidingWindowLimiter:
+    """Giới hạn số lần trong cửa sổ trượt `window` giây cho mỗi khóa (IP, username, ...).
+
+    Trạng thái nằm trong tiến trình; số khóa theo dõi bị chặn bởi `max_keys` (LRU).
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100_000):
+        self.limit = limit
+        self.window = window
+        self._hits = LRUCache(max_keys, ttl=window)
+
+    def _recent(self, key, now: float) -> deque:
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = deque()
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        return hits
+
+    def retry_after(self, key) -> float:
+        """Số giây phải chờ nếu khóa đã chạm giới hạn, ngược lại 0."""
+        now = time.monotonic()
+        hits = self._recent(key, now)
+        if len(hits) < self.limit:
+            return 0
+        return max(hits[0] + self.window - now, 0)
+
+    def hit(self, key):
+        now = time.monotonic()
+        hits = self._recent(key, now)
+        hits.append(now)
+        self._hits.set(key, hits)
+
+    def reset(self, key):
+        self._hits.pop(key)
@@ -0,0 +1,169 @@
+# app/timeseries.py
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import Numeric, func, literal, select, text, type_coerce
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, array_agg
+from sqlalchemy.orm import Session
+
+from app import crud, model
+
+# Độ dài mỗi khung thời gian (giây)
+INTERVALS = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "1h": 60 * 60,
+    "1d": 24 * 60 * 60,
+    "1w": 7 * 24 * 60 * 60,
+}
+
+# Nến thô coi như đã đóng sau khoảng này (giây) kể từ thời điểm của nến
+RAW_CANDLE_SECONDS = 60
+
+
+def is_closed_range(end: datetime, interval: str = None, now: datetime = None) -> bool:
+    """True nếu mọi nến trong khoảng kết thúc tại `end` đã đóng (không còn nhận dữ liệu mới)."""
+    if end is None:
+        return False
+    end = crud.naive_utc(end)
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    return end + timedelta(seconds=INTERVALS.get(interval, RAW_CANDLE_SECONDS)) <= now
+
+
+# Mốc căn chỉnh cho date_bin: 2000-01-03 là thứ Hai nên nến tuần bắt đầu từ thứ Hai
+BUCKET_ORIGIN = "2000-01-03"
+BUCKET_ORIGIN_DATETIME = datetime(2000, 1, 3)
+
+
+def bucket_expression(interval: str, column):
+    """Biểu thức SQL làm tròn `column` xuống đầu khung thời gian `interval`."""
+    return bin_expression(INTERVALS[interval], column)
+
+
+def bin_expression(seconds: int, column, origin: datetime = None):
+    """Như bucket_expression nhưng với khung dài `seconds` giây bất kỳ, căn theo `origin` nếu có."""
+    return func.date_bin(
+        text(f"interval '{int(seconds)} seconds'"),
+        column,
+        text(f"timestamp '{BUCKET_ORIGIN}'") if origin is None else literal(origin),
+    )
+
+
+def bucket_floor(value: datetime, interval: str) -> datetime:
+    """Bản Python của bucket_expression: đầu khung thời gian chứa `value`."""
+    stride = timedelta(seconds=INTERVALS[interval])
+    return BUCKET_ORIGIN_DATETIME + ((value - BUCKET_ORIGIN_DATETIME) // stride) * stride
+
+
+def first_in_group(column, order_column, descending=False):
+    """Giá trị đầu tiên (hoặc cuối cùng) khác NULL trong nhóm theo thứ tự thời gian."""
+    ordering = order_column.desc() if descending else order_column.asc()
+    aggregated = array_agg(aggregate_order_by(column, ordering)).filter(column.isnot(None))
+    return type_coerce(aggregated, ARRAY(Numeric))[1]
+
+
+def resample_select(
+    asset_id: int,
+    interval: str,
+    start=None,
+    end=None,
+    after=None,
+    order: str = "desc",
+    keys_only: bool = False,
+):
+    """Gộp nến thô thành nến `interval`: open đầu tiên, high lớn nhất, low nhỏ nhất, close cuối cùng.
+
+    `after` là thời điểm bắt đầu của khung cuối trang trước (keyset).
+    """
+    start, end, after = crud.naive_utc(start), crud.naive_utc(end), crud.naive_utc(after)
+    table = model.PriceHistory.__table__
+    bucket = bucket_expression(interval, table.c.date)
+    if keys_only:
+        stmt = select(bucket.label("date"))
+    else:
+        stmt = select(
+            literal(asset_id).label("asset_id"),
+            bucket.label("date"),
+            first_in_group(table.c.open_price, table.c.date).label("open_price"),
+            first_in_group(table.c.close_price, table.c.date, descending=True).label("close_price"),
+            func.max(table.c.high_price).label("high_price"),
+            func.min(table.c.low_price).label("low_price"),
+            func.sum(table.c.volume).label("volume"),
+        )
+    stmt = stmt.where(table.c.asset_id == asset_id)
+    if start is not None:
+        stmt = stmt.where(table.c.date >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.date <= end)
+    # Lọc trên cột date thô (thay vì HAVING) để vẫn tận dụng index và partition pruning
+    if after is not None:
+        if order == "asc":
+            stmt = stmt.where(table.c.date >= after + timedelta(seconds=INTERVALS[interval]))
+        else:
+            stmt = stmt.where(table.c.date < after)
+    stmt = stmt.group_by(bucket)
+    return stmt.order_by(bucket.asc() if order == "asc" else bucket.desc())
+
+
+def bin_select(stmt, seconds: int, origin: datetime = None):
+    """Gộp chuỗi nến `stmt` (các cột như crud.PRICE_HISTORY_COLUMNS) thành khung `seconds` giây, tăng dần."""
+    series = stmt.order_by(None).subquery("series")
+    bucket = bin_expression(seconds, series.c.date, origin)
+    return (
+        select(
+            func.min(series.c.asset_id).label("asset_id"),
+            bucket.label("date"),
+            first_in_group(series.c.open_price, series.c.date).label("open_price"),
+            first_in_group(series.c.close_price, series.c.date, descending=True).label("close_price"),
+            func.max(series.c.high_price).label("high_price"),
+            func.min(series.c.low_price).label("low_price"),
+            func.sum(series.c.volume).label("volume"),
+        )
+        .group_by(bucket)
+        .order_by(bucket.asc())
+    )
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: chọn `threshold` điểm giữ được hình dạng chuỗi.
+
+    Vòng lặp chỉ chạy theo số bucket (tối đa bằng số điểm trả về), phần tính diện tích
+    trong mỗi bucket được vector hóa bằng NumPy.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+    edges = np.append(np.linspace(1, n - 1, threshold - 1).astype(np.int64), n)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        avg_x = x[edges[i + 1] : edges[i + 2]].mean()
+        avg_y = y[edges[i + 1] : edges[i + 2]].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def load_downsampled(db: Session, stmt, max_points: int, order: str = "desc"):
+    """Đọc chuỗi giá từ `stmt` (sắp xếp tăng dần theo date) và giảm còn tối đa `max_points` điểm bằng LTTB.
+
+    `stmt` phải có số dòng giới hạn (rollups.downsample_select): mọi dòng được nạp vào bộ nhớ.
+    """
+    rows = db.execute(stmt).all()
+    if len(rows) > max_points:
+        date_index = crud.PRICE_HISTORY_COLUMNS.index("date")
+        close_index = crud.PRICE_HISTORY_COLUMNS.index("close_price")
+        x = np.fromiter((row[date_index].timestamp() for row in rows), float, len(rows))
+        y = np.fromiter(
+            (np.nan if row[close_index] is None else row[close_index] for row in rows),
+            float,
+            len(rows),
+        )
+        rows = [rows[index] for index in lttb_indices(x, y, max_points)]
+    return rows if order == "asc" else rows[::-1]
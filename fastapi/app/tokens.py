@@ -0,0 +1,170 @@
+# app/tokens.py
+import asyncio
+import hashlib
+import logging
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import config, database, model
+
+logger = logging.getLogger(__name__)
+
+# --- Refresh token ---
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def issue_refresh_token(db: AsyncSession, user_id: int, family_id: str = None) -> str:
+    """Tạo refresh token mới (họ mới khi đăng nhập, giữ họ cũ khi xoay vòng). Người gọi commit."""
+    token = secrets.token_urlsafe(32)
+    db.add(
+        model.RefreshToken(
+            user_id=user_id,
+            token_hash=hash_token(token),
+            family_id=family_id or uuid.uuid4().hex,
+            expires_at=_utcnow() + timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+    return token
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str):
+    """Đổi refresh token lấy token mới; trả về (user_id, token mới) hoặc 401.
+
+    Thu hồi bằng một câu UPDATE ... WHERE revoked_at IS NULL nên hai request dùng cùng token
+    chỉ một request thành công. Token đã bị thu hồi mà vẫn được dùng lại thì thu hồi cả họ.
+    """
+    invalid = HTTPException(status_code=401, detail="Invalid refresh token")
+    now = _utcnow()
+    token_hash = hash_token(token)
+    claimed = (
+        await db.execute(
+            update(model.RefreshToken)
+            .where(model.RefreshToken.token_hash == token_hash, model.RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=now)
+            .returning(model.RefreshToken.user_id, model.RefreshToken.family_id, model.RefreshToken.expires_at)
+        )
+    ).first()
+    if claimed is None:
+        family_id = (
+            await db.execute(
+                select(model.RefreshToken.family_id).where(model.RefreshToken.token_hash == token_hash)
+            )
+        ).scalar()
+        if family_id is not None:
+            logger.warning("Refresh token reuse detected, revoking family %s", family_id)
+            await revoke_family(db, family_id)
+        raise invalid
+    if claimed.expires_at <= now:
+        await db.commit()
+        raise invalid
+    new_token = await issue_refresh_token(db, claimed.user_id, claimed.family_id)
+    return claimed.user_id, new_token
+
+
+async def revoke_family(db: AsyncSession, family_id: str):
+    await db.execute(
+        update(model.RefreshToken)
+        .where(model.RefreshToken.family_id == family_id, model.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_utcnow())
+    )
+    await db.commit()
+
+
+async def revoke_user_refresh_tokens(db: AsyncSession, user_id: int):
+    """Thu hồi mọi refresh token còn hiệu lực của người dùng (đổi mật khẩu). Người gọi commit."""
+    await db.execute(
+        update(model.RefreshToken)
+        .where(model.RefreshToken.user_id == user_id, model.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_utcnow())
+    )
+
+
+async def find_refresh_family(db: AsyncSession, user_id: int, token: str):
+    return (
+        await db.execute(
+            select(model.RefreshToken.family_id).where(
+                model.RefreshToken.token_hash == hash_token(token),
+                model.RefreshToken.user_id == user_id,
+            )
+        )
+    ).scalar()
+
+
+# --- Danh sách thu hồi access token ---
+# jti -> thời điểm hết hạn (UTC naive). Kiểm tra ở mỗi request chỉ là một lần tra dict;
+# bảng revoked_token là nguồn chung, mỗi worker nạp lại sau mỗi REVOCATION_SYNC_SECONDS.
+
+_revoked = {}
+
+
+def is_revoked(jti: str) -> bool:
+    return jti is not None and jti in _revoked
+
+
+async def revoke_access_token(db: AsyncSession, jti: str, expires_at: datetime):
+    _revoked[jti] = expires_at
+    await db.execute(
+        pg_insert(model.RevokedToken)
+        .values(jti=jti, expires_at=expires_at)
+        .on_conflict_do_nothing(index_elements=["jti"])
+    )
+    await db.commit()
+
+
+async def sync_revocations(db: AsyncSession):
+    """Nạp mọi jti bị thu hồi còn hạn (từ mọi worker) và bỏ các jti đã hết hạn.
+
+    Nạp lại toàn bộ thay vì theo mốc id: id do sequence cấp trước khi commit nên một giao dịch
+    commit muộn có id nhỏ hơn mốc đã đọc sẽ bị bỏ qua vĩnh viễn. Bảng chỉ giữ jti của access token
+    còn hạn (vài phút) nên mỗi lần nạp nhỏ.
+    """
+    now = _utcnow()
+    rows = (
+        await db.execute(
+            select(model.RevokedToken.jti, model.RevokedToken.expires_at).where(model.RevokedToken.expires_at > now)
+        )
+    ).all()
+    for row in rows:
+        _revoked[row.jti] = row.expires_at
+    for jti in [jti for jti, expires_at in _revoked.items() if expires_at <= now]:
+        del _revoked[jti]
+    return len(rows)
+
+
+async def purge_expired(db: AsyncSession):
+    """Xóa dữ liệu hết hạn: jti đã quá hạn access token và refresh token quá hạn."""
+    now = _utcnow()
+    await db.execute(delete(model.RevokedToken).where(model.RevokedToken.expires_at <= now))
+    await db.execute(delete(model.RefreshToken).where(model.RefreshToken.expires_at <= now))
+    await db.commit()
+
+
+async def revocation_sync_loop():
+    """Tác vụ nền của mỗi worker: đồng bộ danh sách thu hồi, dọn bảng khoảng mỗi giờ."""
+    purge_every = max(int(3600 / config.REVOCATION_SYNC_SECONDS), 1)
+    iteration = 0
+    while True:
+        try:
+            async with database.AsyncSessionLocal() as db:
+                await sync_revocations(db)
+                if iteration % purge_every == 0:
+                    await purge_expired(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Revocation sync failed")
+        iteration += 1
+        await asyncio.sleep(config.REVOCATION_SYNC_SECONDS)
@@ -0,0 +1,207 @@
+# app/valuation.py
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import Float, case, cast, func, select, true
+from sqlalchemy.orm import Session
+
+from app import model
+
+# Giá trị transaction_type được chấp nhận (so sánh không phân biệt hoa thường)
+BUY_TYPES = ("buy", "mua")
+SELL_TYPES = ("sell", "bán", "ban")
+
+METHODS = ("average", "fifo")
+
+
+def transaction_side(transaction_type: str) -> int:
+    """Bản Python của side_expression."""
+    lowered = (transaction_type or "").lower()
+    if lowered in BUY_TYPES:
+        return 1
+    if lowered in SELL_TYPES:
+        return -1
+    return 0
+
+
+def side_expression(type_column):
+    """+1 cho lệnh mua, -1 cho lệnh bán, 0 cho loại khác."""
+    lowered = func.lower(type_column)
+    return case((lowered.in_(BUY_TYPES), 1), (lowered.in_(SELL_TYPES), -1), else_=0)
+
+
+def latest_close_lateral(asset_id_column):
+    """Subquery LATERAL lấy giá đóng cửa mới nhất của asset (dùng khóa chính asset_id, date)."""
+    table = model.PriceHistory.__table__
+    return (
+        select(table.c.close_price, table.c.date)
+        .where(table.c.asset_id == asset_id_column, table.c.close_price.isnot(None))
+        .order_by(table.c.date.desc())
+        .limit(1)
+        .lateral("latest")
+    )
+
+
+def _holding(asset_id, symbol, quantity, cost_basis, realized_pnl, last_price, last_date):
+    quantity = float(quantity)
+    cost_basis = float(cost_basis)
+    holding = {
+        "asset_id": asset_id,
+        "symbol": symbol,
+        "quantity": quantity,
+        "average_cost": cost_basis / quantity if quantity else None,
+        "cost_basis": cost_basis,
+        "realized_pnl": float(realized_pnl),
+    }
+    return reprice_holding(holding, last_price, last_date)
+
+
+def reprice_holding(holding: dict, last_price, last_date) -> dict:
+    """Gán giá cuối và tính lại giá trị thị trường, lãi/lỗ chưa thực hiện của vị thế (sửa tại chỗ)."""
+    market_value = holding["quantity"] * last_price if last_price is not None else None
+    holding["last_price"] = last_price
+    holding["last_price_date"] = last_date
+    holding["market_value"] = market_value
+    holding["unrealized_pnl"] = market_value - holding["cost_basis"] if market_value is not None else None
+    return holding
+
+
+def average_cost_holdings(db: Session, portfolio_id: int):
+    """Giá vốn bình quân gia quyền di động: đọc thẳng từ bảng vị thế portfolio_holding.
+
+    Mỗi lệnh mua cập nhật giá bình quân của phần đang giữ; lệnh bán được khớp với giá bình quân
+    tại thời điểm bán để ra lãi/lỗ đã thực hiện (app.holdings.fold).
+    """
+    holding = model.PortfolioHolding.__table__
+    asset = model.Asset.__table__
+    latest = latest_close_lateral(holding.c.asset_id)
+    stmt = (
+        select(
+            holding.c.asset_id,
+            asset.c.symbol,
+            holding.c.quantity,
+            holding.c.cost_basis,
+            holding.c.realized_pnl,
+            cast(latest.c.close_price, Float).label("last_price"),
+            latest.c.date.label("last_price_date"),
+        )
+        .select_from(
+            holding.join(asset, asset.c.id == holding.c.asset_id).outerjoin(latest, true())
+        )
+        .where(holding.c.portfolio_id == portfolio_id)
+        .order_by(asset.c.symbol)
+    )
+    return [_holding(*row) for row in db.execute(stmt)]
+
+
+def fifo_cost_of_sold(asset_index, is_buy, quantity, price, n_assets):
+    """Giá vốn FIFO của phần đã bán cho từng asset, tính vector hóa bằng NumPy.
+
+    Với FIFO, S đơn vị đã bán luôn là S đơn vị mua sớm nhất, nên giá vốn phần đã bán
+    là tổng tiền của S đơn vị đầu tiên trên đường tích lũy (khối lượng mua, tiền mua)
+    của asset đó - nội suy tuyến tính trên mảng cumsum thay vì khớp từng lệnh.
+    Giả định khối lượng nắm giữ không bao giờ âm (không bán khống).
+
+    Các mảng đầu vào đã được sắp xếp theo (asset, thời gian giao dịch).
+    """
+    buy_asset = asset_index[is_buy]
+    buy_quantity = quantity[is_buy]
+    cumulative_quantity = np.concatenate(([0.0], np.cumsum(buy_quantity)))
+    cumulative_cost = np.concatenate(([0.0], np.cumsum(buy_quantity * price[is_buy])))
+
+    # Vị trí bắt đầu/kết thúc đoạn mua của từng asset trên mảng tích lũy toàn cục
+    starts = np.searchsorted(buy_asset, np.arange(n_assets), side="left")
+    ends = np.searchsorted(buy_asset, np.arange(n_assets), side="right")
+    quantity_offset = cumulative_quantity[starts]
+    cost_offset = cumulative_cost[starts]
+    bought = cumulative_quantity[ends] - quantity_offset
+
+    sold = np.bincount(asset_index[~is_buy], weights=quantity[~is_buy], minlength=n_assets)
+    target = quantity_offset + np.minimum(sold, bought)
+    return np.interp(target, cumulative_quantity, cumulative_cost) - cost_offset
+
+
+def fifo_holdings(db: Session, portfolio_id: int):
+    """Giá vốn FIFO: đọc các giao dịch một lần theo thứ tự rồi tính toàn bộ bằng NumPy."""
+    tx = model.Transaction.__table__
+    side = side_expression(tx.c.transaction_type)
+    rows = db.execute(
+        select(
+            tx.c.asset_id,
+            side,
+            cast(tx.c.quantity, Float),
+            cast(tx.c.price, Float),
+        )
+        .where(tx.c.portfolio_id == portfolio_id, side != 0)
+        .order_by(tx.c.asset_id, tx.c.transaction_date, tx.c.id)
+    ).all()
+    if not rows:
+        return []
+
+    asset_ids, sides, quantity, price = (np.array(column) for column in zip(*rows))
+    unique_assets, asset_index = np.unique(asset_ids, return_inverse=True)
+    n_assets = len(unique_assets)
+    is_buy = sides == 1
+
+    buy_quantity = np.bincount(asset_index, weights=np.where(is_buy, quantity, 0.0), minlength=n_assets)
+    buy_cost = np.bincount(asset_index, weights=np.where(is_buy, quantity * price, 0.0), minlength=n_assets)
+    sell_quantity = np.bincount(asset_index, weights=np.where(is_buy, 0.0, quantity), minlength=n_assets)
+    sell_proceeds = np.bincount(asset_index, weights=np.where(is_buy, 0.0, quantity * price), minlength=n_assets)
+    cost_of_sold = fifo_cost_of_sold(asset_index, is_buy, quantity, price, n_assets)
+
+    prices = latest_prices(db, unique_assets.tolist())
+    holdings = []
+    for index, asset_id in enumerate(unique_assets.tolist()):
+        symbol, last_price, last_date = prices[asset_id]
+        holdings.append(
+            _holding(
+                asset_id,
+                symbol,
+                buy_quantity[index] - sell_quantity[index],
+                buy_cost[index] - cost_of_sold[index],
+                sell_proceeds[index] - cost_of_sold[index],
+                last_price,
+                last_date,
+            )
+        )
+    return sorted(holdings, key=lambda holding: holding["symbol"])
+
+
+def latest_prices(db: Session, asset_ids):
+    """Trả về {asset_id: (symbol, giá đóng cửa mới nhất, thời điểm)} bằng một truy vấn."""
+    asset = model.Asset.__table__
+    latest = latest_close_lateral(asset.c.id)
+    stmt = (
+        select(
+            asset.c.id,
+            asset.c.symbol,
+            cast(latest.c.close_price, Float),
+            latest.c.date,
+        )
+        .select_from(asset.outerjoin(latest, true()))
+        .where(asset.c.id.in_(asset_ids))
+    )
+    return {row[0]: tuple(row[1:]) for row in db.execute(stmt)}
+
+
+def value_portfolio(db: Session, portfolio_id: int, method: str = "average") -> dict:
+    """Định giá danh mục: khối lượng, giá vốn, lãi/lỗ đã và chưa thực hiện theo từng asset."""
+    if method == "fifo":
+        holdings = fifo_holdings(db, portfolio_id)
+    else:
+        holdings = average_cost_holdings(db, portfolio_id)
+    return summarize(portfolio_id, method, holdings)
+
+
+def summarize(portfolio_id: int, method: str, holdings) -> dict:
+    """Kết quả định giá danh mục từ danh sách vị thế (cộng các tổng)."""
+    return {
+        "portfolio_id": portfolio_id,
+        "method": method,
+        "valued_at": datetime.now(timezone.utc),
+        "holdings": holdings,
+        "total_cost_basis": sum(holding["cost_basis"] for holding in holdings),
+        "total_market_value": sum(holding["market_value"] or 0.0 for holding in holdings),
+        "total_realized_pnl": sum(holding["realized_pnl"] for holding in holdings),
+        "total_unrealized_pnl": sum(holding["unrealized_pnl"] or 0.0 for holding in holdings),
+    }
@@ -0,0 +1,80 @@
+# benchmarks/serialization.py
+"""So sánh đường trả JSON mặc định (response_model) với app.serializers.list_response.
+
+Không cần DB: dựng sẵn các object ORM trong bộ nhớ rồi gọi hai endpoint giống nhau qua TestClient.
+Chạy: python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import model, serializers
+from app.schemas import TransactionResponse
+
+
+def make_transactions(count: int):
+    start = datetime(2024, 1, 1)
+    return [
+        model.Transaction(
+            id=index,
+            portfolio_id=1,
+            asset_id=index % 20 + 1,
+            quantity=Decimal("0.12345678"),
+            price=Decimal("42123.45678900"),
+            transaction_type="buy" if index % 2 else "sell",
+            transaction_date=start + timedelta(minutes=index),
+            external_id=f"ext-{index}",
+        )
+        for index in range(count)
+    ]
+
+
+def build_app(rows) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/response-model", response_model=List[TransactionResponse])
+    async def response_model_path():
+        return rows
+
+    @app.get("/fast", response_model=List[TransactionResponse])
+    async def fast_path():
+        return serializers.list_response(rows, TransactionResponse)
+
+    return app
+
+
+def measure(client: TestClient, path: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return statistics.median(timings), response.json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark serialize danh sách giao dịch")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    client = TestClient(build_app(make_transactions(args.rows)))
+    client.get("/fast")  # khởi động (sinh encoder, import lười)
+    baseline, expected = measure(client, "/response-model", args.repeat)
+    fast, actual = measure(client, "/fast", args.repeat)
+
+    assert actual == expected, "fast path output differs from response_model output"
+    print(f"rows={args.rows} repeat={args.repeat} (median)")
+    print(f"response_model  {baseline * 1000:9.1f} ms")
+    print(f"serializers     {fast * 1000:9.1f} ms  ({baseline / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# tests/test_analytics.py
+import numpy as np
+
+from app import analytics
+
+
+def test_correlation_matrix_matches_numpy_on_complete_data():
+    rng = np.random.default_rng(7)
+    returns = rng.normal(size=(5, 200))
+
+    assert np.allclose(analytics.correlation_matrix(returns), np.corrcoef(returns))
+
+
+def test_correlation_matrix_uses_pairwise_complete_observations():
+    rng = np.random.default_rng(11)
+    returns = rng.normal(size=(3, 100))
+    returns[2, :40] = np.nan  # asset niêm yết muộn
+
+    correlation = analytics.correlation_matrix(returns)
+
+    expected = np.corrcoef(returns[0, 40:], returns[2, 40:])[0, 1]
+    assert np.isclose(correlation[0, 2], expected)
+    assert np.isclose(correlation[0, 1], np.corrcoef(returns[0], returns[1])[0, 1])
+
+
+def test_rolling_std_matches_window_std():
+    returns = np.array([[0.01, -0.02, 0.03, 0.0, 0.05, -0.01]])
+
+    rolling = analytics.rolling_std(returns, 3)
+
+    assert np.isnan(rolling[0, :2]).all()
+    expected = [np.std(returns[0, i - 2 : i + 1], ddof=1) for i in range(2, 6)]
+    assert np.allclose(rolling[0, 2:], expected)
+
+
+def test_max_drawdown_and_beta():
+    prices = np.array([[100.0, 120.0, 90.0, 130.0]])
+    benchmark = np.array([0.01, -0.02, 0.03, 0.01])
+
+    assert np.isclose(analytics.max_drawdown(prices)[0], 90.0 / 120.0 - 1.0)
+    assert np.allclose(analytics.betas(2.0 * benchmark[None, :], benchmark), [2.0])
@@ -0,0 +1,142 @@
+# tests/test_auth.py
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app import auth, cache, config, hashing, model
+from app.throttle import SlidingWindowLimiter
+
+
+def test_limiter_blocks_after_limit_and_resets():
+    limiter = SlidingWindowLimiter(limit=2, window=60)
+
+    limiter.hit("1.2.3.4")
+    assert limiter.retry_after("1.2.3.4") == 0
+    limiter.hit("1.2.3.4")
+    assert 0 < limiter.retry_after("1.2.3.4") <= 60
+    assert limiter.retry_after("5.6.7.8") == 0
+
+    limiter.reset("1.2.3.4")
+    assert limiter.retry_after("1.2.3.4") == 0
+
+
+def test_verify_password_rehashes_when_rounds_change(monkeypatch):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret1")
+    monkeypatch.setattr(
+        hashing, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5)
+    )
+
+    assert hashing.verify_password("wrong", old_hash) == (False, None)
+    valid, new_hash = hashing.verify_password("secret1", old_hash)
+    assert valid
+    assert new_hash.startswith("$2b$05$")
+    assert hashing.verify_password("secret1", new_hash) == (True, None)
+
+
+class UserSession:
+    """AsyncSession giả cho get_current_user: trả `user` khi truy vấn, đếm số truy vấn."""
+
+    def __init__(self, user):
+        self.user = user
+        self.queries = 0
+
+    async def execute(self, stmt):
+        self.queries += 1
+        user = self.user
+
+        class Result:
+            def scalars(self):
+                return self
+
+            def first(self):
+                return user
+
+        return Result()
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def principals(monkeypatch):
+    monkeypatch.setattr(auth, "_principals", cache.LRUCache(16, 60))
+    monkeypatch.setattr(auth, "_shared_principals", None)
+    return auth._principals
+
+
+def current_user(db, token):
+    return asyncio.run(auth.get_current_user(db=db, token=token))
+
+
+def make_user(version=1, email="alice@example.com"):
+    return model.User(id=1, username="alice", email=email, is_active=1, version=version)
+
+
+def test_current_user_is_served_from_cache_after_first_lookup(principals):
+    token = auth.create_access_token({"sub": "alice", "ver": 1})
+    db = UserSession(make_user())
+
+    first = current_user(db, token)
+    second = current_user(db, token)
+    assert first == second == auth.Principal(1, "alice", "alice@example.com", True, 1)
+    assert db.queries == 1
+
+
+def test_token_with_stale_version_is_rejected(principals):
+    # Mật khẩu đã đổi: users.version tăng, token mang version cũ
+    token = auth.create_access_token({"sub": "alice", "ver": 1})
+    with pytest.raises(HTTPException) as error:
+        current_user(UserSession(make_user(version=2)), token)
+    assert error.value.status_code == 401
+    assert principals.get(("alice", 1)) is None
+
+    with pytest.raises(HTTPException):
+        current_user(UserSession(None), token)  # Tài khoản đã bị xóa
+
+    # Token cũ không mang `ver`: từ chối thay vì bỏ qua kiểm tra version
+    legacy = auth.create_access_token({"sub": "alice"})
+    with pytest.raises(HTTPException):
+        current_user(UserSession(make_user()), legacy)
+
+
+def test_invalidate_principal_forces_reload_after_update_and_delete(principals, monkeypatch):
+    shared = cache.MemoryCache()
+    monkeypatch.setattr(auth, "_shared_principals", shared)
+    token = auth.create_access_token({"sub": "alice", "ver": 1})
+    db = UserSession(make_user())
+    current_user(db, token)
+
+    # Worker khác (cache trong tiến trình trống) dùng lại kết quả qua backend chung
+    principals.clear()
+    assert current_user(db, token).email == "alice@example.com" and db.queries == 1
+
+    # update_user đổi email: invalidate_principal xóa cả hai tầng, lần sau đọc lại từ DB
+    db.user = make_user(email="new@example.com")
+    asyncio.run(auth.invalidate_principal("alice", 1))
+    assert asyncio.run(shared.get(auth._shared_key("alice", 1))) is None
+    assert current_user(db, token).email == "new@example.com" and db.queries == 2
+
+    # delete_user: bản ghi không còn, token cũ nhận 401 thay vì principal trong cache
+    db.user = None
+    asyncio.run(auth.invalidate_principal("alice", 1))
+    with pytest.raises(HTTPException):
+        current_user(db, token)
+
+
+def test_other_worker_sees_invalidation_after_short_local_ttl(principals, monkeypatch):
+    monkeypatch.setattr(config, "PRINCIPAL_LOCAL_CACHE_TTL", 0.05)
+    monkeypatch.setattr(auth, "_shared_principals", cache.MemoryCache())
+    token = auth.create_access_token({"sub": "alice", "ver": 1})
+    db = UserSession(make_user())
+    current_user(db, token)  # Bản sao trong tiến trình của worker B
+
+    # Worker A xóa tài khoản: chỉ xóa được Redis, bản sao của B còn sống tối đa PRINCIPAL_LOCAL_CACHE_TTL
+    db.user = None
+    asyncio.run(auth._shared_principals.delete(auth._shared_key("alice", 1)))
+    assert current_user(db, token).id == 1
+    time.sleep(0.06)
+    with pytest.raises(HTTPException):
+        current_user(db, token)
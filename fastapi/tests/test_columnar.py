@@ -0,0 +1,32 @@
+# tests/test_columnar.py
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app import columnar
+
+pa = pytest.importorskip("pyarrow")
+
+
+def test_negotiate_prefers_highest_quality_and_defaults_to_json():
+    assert columnar.negotiate(None) is None
+    assert columnar.negotiate("text/html,*/*;q=0.8") is None
+    assert columnar.negotiate("application/vnd.apache.arrow.stream") == "arrow"
+    assert columnar.negotiate("application/json;q=0.5, application/vnd.apache.parquet;q=0.9") == "parquet"
+    assert columnar.negotiate("application/vnd.apache.parquet;q=0.1, application/json") is None
+
+
+def test_record_batch_converts_numeric_columns_to_float64():
+    schema = columnar.price_history_schema(("asset_id", "date", "close_price", "volume"))
+    rows = [
+        (1, datetime(2024, 1, 1), Decimal("42000.12345678"), None),
+        (1, datetime(2024, 1, 2), Decimal("43000.5"), Decimal("12")),
+    ]
+
+    batch = columnar.record_batch(rows, schema)
+
+    assert batch.schema == schema
+    assert batch.column(2).to_pylist() == [42000.12345678, 43000.5]
+    assert batch.column(3).to_pylist() == [None, 12.0]
+    assert columnar.record_batch([], schema).num_rows == 0
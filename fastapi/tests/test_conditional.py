@@ -0,0 +1,116 @@
+# tests/test_conditional.py
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+
+from app import conditional, config, crud, model, response_cache, router, timeseries
+
+
+def make_request(headers: dict, method: str = "GET") -> Request:
+    return Request({
+        "type": "http",
+        "method": method,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_etag_is_strong_and_depends_on_every_part():
+    etag = conditional.make_etag("read_asset", 1, datetime(2025, 5, 20, 8, 30))
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == conditional.make_etag("read_asset", 1, datetime(2025, 5, 20, 8, 30))
+    assert etag != conditional.make_etag("read_asset", 1, datetime(2025, 5, 20, 8, 30, 0, 1))
+    assert etag != conditional.make_etag("read_asset", 2, datetime(2025, 5, 20, 8, 30))
+
+
+def test_not_modified_matches_if_none_match_before_if_modified_since():
+    updated = datetime(2025, 5, 20, 8, 30)
+    headers = conditional.validators('"abc"', updated, conditional.IMMUTABLE)
+    assert headers["last-modified"] == "Tue, 20 May 2025 08:30:00 GMT"
+
+    response = conditional.not_modified(make_request({"If-None-Match": 'W/"xyz", W/"abc"'}), headers)
+    assert response.status_code == 304 and response.body == b""
+    assert response.headers["etag"] == '"abc"'
+    assert response.headers["cache-control"] == conditional.IMMUTABLE
+    assert conditional.not_modified(make_request({"If-None-Match": "*"}), headers) is not None
+
+    # If-None-Match không khớp: bỏ qua If-Modified-Since dù thời điểm còn mới
+    stale = make_request({"If-None-Match": '"old"', "If-Modified-Since": "Wed, 21 May 2025 00:00:00 GMT"})
+    assert conditional.not_modified(stale, headers) is None
+
+    assert conditional.not_modified(make_request({"If-Modified-Since": "Tue, 20 May 2025 08:30:00 GMT"}), headers)
+    assert conditional.not_modified(make_request({"If-Modified-Since": "Tue, 20 May 2025 08:29:59 GMT"}), headers) is None
+    assert conditional.not_modified(make_request({"If-Modified-Since": "không hợp lệ"}), headers) is None
+    assert conditional.not_modified(make_request({"If-None-Match": '"abc"'}, method="POST"), headers) is None
+
+
+def test_default_cache_control_only_fills_missing_header():
+    app = FastAPI()
+    app.add_middleware(conditional.DefaultCacheControlMiddleware)
+
+    @app.get("/private")
+    def private():
+        return {"ok": True}
+
+    @app.get("/public")
+    def public():
+        return Response(b"{}", headers={"Cache-Control": conditional.SHARED})
+
+    client = TestClient(app)
+    assert client.get("/private").headers["cache-control"] == conditional.PRIVATE
+    assert client.get("/public").headers["cache-control"] == conditional.SHARED
+
+
+def test_portfolio_data_validators_follow_prices_and_open_ended_window(monkeypatch):
+    portfolio = model.Portfolio(id=7, user_id=1, name="p", updated_at=datetime(2025, 5, 20, 8, 0))
+    prices = {"updated_at": datetime(2025, 5, 20, 9, 0)}
+    calls = []
+
+    async def prices_version(db, portfolio_id, *asset_ids):
+        calls.append((portfolio_id, asset_ids))
+        return prices["updated_at"]
+
+    monkeypatch.setattr(crud, "get_portfolio_prices_version", prices_version)
+
+    def validators(**options):
+        return asyncio.run(router.portfolio_data_validators(None, portfolio, "route", "average", **options))
+
+    first = validators()
+    assert first["cache-control"] == conditional.PRIVATE
+    assert first["last-modified"] == "Tue, 20 May 2025 09:00:00 GMT"
+    assert validators()["etag"] == first["etag"]
+    prices["updated_at"] = datetime(2025, 5, 20, 9, 1)
+    assert validators()["etag"] != first["etag"]
+
+    # Không có `end`: kết quả kéo dài tới khung hiện tại, Last-Modified không cũ hơn đầu khung đó
+    open_ended = validators(interval="1h", asset_ids=(3,))
+    current = timeseries.bucket_floor(datetime.now(timezone.utc).replace(tzinfo=None), "1h")
+    assert open_ended["last-modified"] == conditional.http_date(max(current, prices["updated_at"]))
+    assert calls[-1] == (7, (3,))
+
+
+def test_read_asset_sets_validators_with_and_without_fast_json(monkeypatch):
+    asset = model.Asset(id=3, symbol="BTC", name="Bitcoin", updated_at=datetime(2025, 5, 20, 8, 0))
+
+    async def get_asset(db, asset_id):
+        return asset
+
+    monkeypatch.setattr(crud, "get_asset", get_asset)
+    monkeypatch.setattr(router.response_cache, "responses", response_cache.ResponseCache(16, 60))
+
+    def read(fast):
+        monkeypatch.setattr(config, "FAST_JSON_RESPONSES", fast)
+        response = Response()
+        result = asyncio.run(router.read_asset(3, make_request({}), response, db=None, current_user=None))
+        return result, response
+
+    # Tắt đường JSON nhanh: handler trả ORM object, validators nằm trên Response được inject
+    result, response = read(False)
+    assert result is asset
+    assert response.headers["etag"] == conditional.make_etag("read_asset", 3, asset.updated_at)
+
+    result, _ = read(True)
+    assert isinstance(result, Response) and result.headers["etag"] == response.headers["etag"]
+    assert result.headers["x-cache"] == "MISS"
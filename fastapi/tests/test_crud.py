@@ -0,0 +1,60 @@
+# tests/test_crud.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, model
+
+
+class ConflictSession:
+    """AsyncSession giả: flush vi phạm ràng buộc `constraint`, ghi lại các bước đã gọi."""
+
+    def __init__(self, constraint):
+        self.constraint = constraint
+        self.calls = []
+
+    def add(self, obj):
+        self.calls.append("add")
+
+    async def flush(self):
+        self.calls.append("flush")
+        orig = Exception(f'duplicate key value violates unique constraint "{self.constraint}"')
+        raise IntegrityError("INSERT INTO transaction ...", {}, orig)
+
+    async def rollback(self):
+        self.calls.append("rollback")
+
+    async def run_sync(self, fn, *args):
+        self.calls.append(fn.__name__)
+
+    async def commit(self):
+        self.calls.append("commit")
+
+
+def test_duplicate_external_id_on_insert_is_rolled_back_as_400():
+    db = ConflictSession("uq_transaction_portfolio_external_id")
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(crud.create_transaction(db, 1, 1, 1, 10, "buy", None, external_id="t1"))
+
+    assert error.value.status_code == 400
+    assert error.value.detail == "Transaction with this external_id already exists"
+    assert db.calls == ["add", "flush", "rollback"]
+
+
+def test_duplicate_external_id_on_update_rolls_back_holdings_change():
+    db = ConflictSession("uq_transaction_portfolio_external_id")
+    transaction = model.Transaction(id=5, portfolio_id=1, external_id="t2")
+    with pytest.raises(HTTPException):
+        asyncio.run(crud.update_transaction(db, transaction, external_id="t1"))
+
+    # Phần trừ vị thế cũ đã chạy trong cùng giao dịch: rollback bỏ luôn
+    assert db.calls == ["apply_transaction", "flush", "rollback"]
+
+
+def test_other_integrity_errors_are_not_reported_as_duplicates():
+    db = ConflictSession("transaction_asset_id_fkey")
+    with pytest.raises(IntegrityError):
+        asyncio.run(crud.create_transaction(db, 1, 99, 1, 10, "buy", None))
+    assert db.calls[-1] == "rollback"
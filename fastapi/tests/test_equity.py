@@ -0,0 +1,32 @@
+# tests/test_equity.py
+import numpy as np
+
+from app import equity
+
+
+def test_forward_fill_keeps_leading_gaps():
+    prices = np.array([[np.nan, 1.0, np.nan, 3.0], [2.0, np.nan, np.nan, np.nan]])
+
+    filled = equity.forward_fill(prices)
+
+    assert np.isnan(filled[0, 0])
+    assert np.allclose(filled[0, 1:], [1.0, 1.0, 3.0])
+    assert np.allclose(filled[1], [2.0, 2.0, 2.0, 2.0])
+
+
+def test_equity_series_excludes_cash_flows_from_returns():
+    # Mua 1@100 ở khung 0, mua thêm 1@110 ở khung 1; giá 100, 110, 110, 90
+    prices = np.array([[100.0, 110.0, 110.0, 90.0]])
+    series = equity.equity_series(
+        asset_index=np.array([0, 0]),
+        tx_bucket=np.array([0, 1]),
+        signed_quantity=np.array([1.0, 1.0]),
+        cash_flow=np.array([100.0, 110.0]),
+        prices=prices,
+    )
+
+    assert np.allclose(series["market_value"], [100.0, 220.0, 220.0, 180.0])
+    assert np.allclose(series["net_invested"], [100.0, 210.0, 210.0, 210.0])
+    assert np.allclose(series["period_return"], [0.0, 0.1, 0.0, -40.0 / 220.0])
+    assert np.isclose(series["cumulative_return"][-1], 1.1 * (180.0 / 220.0) - 1.0)
+    assert np.isclose(series["drawdown"][-1], 180.0 / 220.0 - 1.0)
@@ -0,0 +1,158 @@
+# tests/test_feeds.py
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import feeds
+
+
+class ListFeed(feeds.FeedAdapter):
+    """Nguồn giả: fetch trả về nến theo phút trong khoảng được hỏi."""
+
+    kind = "list"
+    can_fetch = True
+
+    def __init__(self, **options):
+        super().__init__("list", symbols=["BTC"], **options)
+        self.calls = []
+
+    async def fetch(self, symbol, start, end):
+        self.calls.append((start, end))
+        candles = []
+        while start < end:
+            candles.append({"symbol": symbol, "asset_id": 1, "date": start, "close_price": 1})
+            start += self.step
+        return candles
+
+
+def test_kline_candle_and_adapter_config():
+    candle = feeds.kline_candle("BTC", 1747729800000, "1", "3", "0.5", "2", "7")
+    assert candle == {
+        "symbol": "BTC",
+        "date": datetime(2025, 5, 20, 8, 30),
+        "open_price": "1",
+        "close_price": "2",
+        "high_price": "3",
+        "low_price": "0.5",
+        "volume": "7",
+    }
+    with pytest.raises(ValueError):
+        feeds.build_adapters([{"adapter": "ftp"}])
+    with pytest.raises(ValueError):
+        feeds.build_adapters([{"adapter": "file", "path": "x.csv", "interval": "7m"}])
+    [adapter] = feeds.build_adapters([{"adapter": "file", "path": "x.csv", "symbols": ["SOL"]}])
+    assert adapter.format == "csv" and adapter.symbols == {"SOL": "SOL"}
+    assert adapter.can_stream and not adapter.can_fetch
+
+
+def test_adapter_capabilities_are_explicit():
+    adapter = feeds.FeedAdapter("bare", symbols=["BTC"])
+    assert not adapter.can_fetch and not adapter.can_stream
+    assert ListFeed().can_fetch and not ListFeed().can_stream
+    live = feeds.build_adapters([{"adapter": "websocket", "url": "wss://x", "symbols": {"BTC": "BTCUSDT"}}])[0]
+    assert live.can_stream and not live.can_fetch
+    live = feeds.build_adapters(
+        [{"adapter": "websocket", "url": "wss://x", "rest_url": "https://x", "symbols": {"BTC": "BTCUSDT"}}]
+    )[0]
+    assert live.can_stream and live.can_fetch
+    asyncio.run(live.close())
+
+
+def test_websocket_feed_writes_only_closed_klines(monkeypatch):
+    def message(open_time, close_price, closed):
+        kline = {"s": "BTCUSDT", "t": open_time, "o": "1", "h": "3", "l": "0.5", "c": close_price, "v": "7", "x": closed}
+        return json.dumps({"data": {"e": "kline", "k": kline}})
+
+    messages = [
+        message(1747729800000, "1.5", False),
+        message(1747729800000, "1.8", False),
+        message(1747729800000, "2", True),
+        message(1747729860000, "2.1", False),
+    ]
+
+    class Connection:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def __aiter__(self):
+            for text in messages:
+                yield text
+
+    monkeypatch.setattr(feeds.websockets, "connect", lambda url, **options: Connection())
+    [adapter] = feeds.build_adapters([{"adapter": "websocket", "url": "wss://x", "symbols": {"BTC": "BTCUSDT"}}])
+
+    async def collect():
+        return [candle async for candle in adapter.stream()]
+
+    [candle] = asyncio.run(collect())
+    assert candle["date"] == datetime(2025, 5, 20, 8, 30) and candle["close_price"] == "2"
+
+
+def test_file_feed_streams_records_and_skips_bad_lines(tmp_path):
+    path = tmp_path / "candles.ndjson"
+    path.write_text(
+        '{"symbol": "SOL", "date": "2025-05-20T08:30:00", "close_price": 1}\n'
+        "not json\n"
+        '{"symbol": "ETH", "date": "2025-05-20T08:30:00", "close_price": 2}\n'
+    )
+    adapter = feeds.FileFeed("file", str(path), symbols=["SOL"])
+
+    async def collect():
+        return [record async for record in adapter.stream()]
+
+    assert asyncio.run(collect()) == [{"symbol": "SOL", "date": "2025-05-20T08:30:00", "close_price": 1}]
+
+
+def test_live_candle_after_gap_triggers_backfill():
+    adapter = ListFeed()
+    start = datetime(2025, 5, 20, 8, 0)
+
+    async def scenario():
+        ingestor = feeds.Ingestor([adapter])
+        ingestor.latest[1] = start
+        await ingestor.submit(adapter, {"symbol": "BTC", "asset_id": 1, "date": start + timedelta(minutes=1)}, live=True)
+        await ingestor.submit(adapter, {"symbol": "BTC", "asset_id": 1, "date": start + timedelta(minutes=5)}, live=True)
+        await asyncio.gather(*ingestor._tasks)
+        return ingestor
+
+    ingestor = asyncio.run(scenario())
+    # Phút 2..4 bị thiếu: chỉ một lần fetch đúng khoảng đó
+    assert adapter.calls == [(start + timedelta(minutes=2), start + timedelta(minutes=5))]
+    assert ingestor.latest[1] == start + timedelta(minutes=5)
+    assert [row["date"].minute for _, _, row in ingestor.queue._queue] == [1, 5, 2, 3, 4]
+
+
+def test_throttle_limits_request_rate():
+    adapter = ListFeed(rate_limit=2, rate_window=0.2)
+
+    async def burst():
+        started = asyncio.get_running_loop().time()
+        for _ in range(5):
+            await adapter.throttle()
+        return asyncio.get_running_loop().time() - started
+
+    # 5 request, 2 request mỗi 0,2 giây: phải chờ ít nhất hai cửa sổ
+    assert asyncio.run(burst()) >= 0.35
+
+
+def test_dropped_batch_rewinds_latest_for_refetch(monkeypatch):
+    monkeypatch.setattr(feeds.config, "FEED_RECONNECT_SECONDS", 0)
+    adapter = ListFeed()
+    start = datetime(2025, 5, 20, 8, 0)
+
+    class FailingIngestor(feeds.Ingestor):
+        def _write_rows(self, records):
+            raise RuntimeError("database is down")
+
+    ingestor = FailingIngestor([adapter], write_attempts=2)
+    ingestor.latest = {1: start + timedelta(minutes=9), 2: start}
+    batch = [("list", 0.0, {"asset_id": 1, "date": start + timedelta(minutes=minute)}) for minute in (7, 5, 8)]
+    asyncio.run(ingestor.write(batch))
+    # Lùi về trước nến sớm nhất bị bỏ (phút 5): lần lấy kế tiếp bắt đầu từ phút 5
+    assert ingestor.latest == {1: start + timedelta(minutes=4), 2: start}
+    assert ingestor.written == 0
@@ -0,0 +1,132 @@
+# tests/test_holdings.py
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import Delete, Insert, Select
+
+from app import holdings
+
+ZERO = (Decimal(0), Decimal(0), Decimal(0))
+
+
+def trades(*rows):
+    """(side, khối lượng, giá) -> (side, khối lượng, thành tiền) như ledger_select trả về."""
+    return [(side, Decimal(str(quantity)), Decimal(str(quantity)) * Decimal(str(price))) for side, quantity, price in rows]
+
+
+def test_rebuy_after_selling_out_starts_a_new_average():
+    # Mua 1@100, bán hết @120, mua lại 1@200: giá vốn là 200, không phải bình quân mọi lệnh mua (150)
+    quantity, cost_basis, realized_pnl = holdings.fold(ZERO, trades((1, 1, 100), (-1, 1, 120), (1, 1, 200)))
+    assert (quantity, cost_basis, realized_pnl) == (1, 200, 20)
+
+
+def test_partial_sell_keeps_average_cost_and_rebuy_moves_it():
+    # Mua 2@100, bán 1@130 (giá vốn 100), mua 1@160: bình quân (100 + 160) / 2 = 130
+    state = holdings.fold(ZERO, trades((1, 2, 100), (-1, 1, 130)))
+    assert state == (1, 100, 30)
+    quantity, cost_basis, realized_pnl = holdings.fold(state, trades((1, 1, 160)))
+    assert (quantity, cost_basis / quantity, realized_pnl) == (2, 130, 30)
+
+
+def test_incremental_fold_matches_full_replay_with_rounding():
+    rows = trades((1, 3, 10), (-1, 1, 11), (1, 0.7, 13.3), (-1, 0.9, 9), (1, 2, 7), (-1, 3.8, 12))
+    replayed = holdings.fold(ZERO, rows)
+    for split in range(len(rows) + 1):
+        assert holdings.fold(holdings.fold(ZERO, rows[:split]), rows[split:]) == replayed
+    # Giá vốn phần bán được làm tròn về 8 chữ số như cột Numeric(38, 8)
+    assert replayed[1] == replayed[1].quantize(Decimal("1e-8"))
+    assert replayed[0] == 0 and replayed[1] == 0
+
+
+LedgerRow = namedtuple("LedgerRow", "portfolio_id asset_id transaction_date id side quantity amount")
+
+
+def ledger(*rows):
+    """(id, ngày, side, khối lượng, giá) -> các dòng ledger_select của cặp (1, 1)."""
+    return [
+        LedgerRow(1, 1, datetime(2025, 5, day), id, side, Decimal(str(quantity)), Decimal(str(quantity)) * Decimal(str(price)))
+        for id, day, side, quantity, price in rows
+    ]
+
+
+def holding(quantity, cost_basis, realized_pnl, day, transaction_id):
+    values = {
+        "portfolio_id": 1,
+        "asset_id": 1,
+        "quantity": Decimal(quantity),
+        "cost_basis": Decimal(cost_basis),
+        "realized_pnl": Decimal(realized_pnl),
+        "last_transaction_date": datetime(2025, 5, day),
+        "last_transaction_id": transaction_id,
+    }
+    return SimpleNamespace(**values, _mapping=values)
+
+
+class ScriptedSession:
+    """Session giả: các SELECT đọc dữ liệu trả về lần lượt `reads`, các lệnh ghi được ghi lại."""
+
+    def __init__(self, *reads):
+        self.reads = list(reads)
+        self.selects, self.written, self.deleted = [], [], []
+
+    def execute(self, stmt, params=None):
+        if isinstance(stmt, Insert):
+            self.written.extend(params)
+        elif isinstance(stmt, Delete):
+            self.deleted.append(stmt)
+        elif isinstance(stmt, Select) and "pg_notify" not in str(stmt):
+            self.selects.append(str(stmt))
+            return self.reads.pop(0)
+
+
+# Mua 2@100 (id 1), bán 1@130 (id 2), mua 1@160 (id 3)
+LOG = ledger((1, 1, 1, 2, 100), (2, 2, -1, 1, 130), (3, 3, 1, 1, 160))
+
+
+def test_newer_transaction_adds_to_stored_snapshot_without_replay():
+    # Vị thế sau LOG: 2 đơn vị, giá vốn 260 (bình quân 130), đã lãi 30
+    db = ScriptedSession(ledger((4, 4, -1, 1, 200)), [holding(2, 260, 30, 3, 3)])
+    holdings.apply_transactions(db, [4])
+
+    [snapshot] = db.written
+    assert (snapshot["quantity"], snapshot["cost_basis"], snapshot["realized_pnl"]) == (1, 130, 100)
+    assert snapshot["last_transaction_id"] == 4
+    assert len(db.selects) == 2 and db.reads == []
+
+
+def test_delete_replays_pair_without_the_removed_transaction():
+    db = ScriptedSession(LOG[1:2], [LOG[0], LOG[2]])
+    holdings.apply_transactions(db, [2], sign=-1)
+
+    [snapshot] = db.written
+    assert (snapshot["quantity"], snapshot["cost_basis"], snapshot["realized_pnl"]) == (3, 360, 0)
+    assert snapshot["last_transaction_id"] == 3
+    assert "NOT IN" in db.selects[-1] and not db.deleted
+
+
+def test_deleting_last_transaction_removes_the_holding():
+    db = ScriptedSession(LOG[:1], [])
+    holdings.apply_transactions(db, [1], sign=-1)
+    assert db.written == [] and len(db.deleted) == 1
+
+
+def test_update_subtracts_old_values_then_replays_with_new_ones():
+    # crud.update_transaction: bỏ giao dịch cũ (sign=-1), ghi giá trị mới, cộng lại (sign=1)
+    updated = ledger((2, 2, -1, 1, 150))
+    db = ScriptedSession(
+        LOG[1:2],
+        [LOG[0], LOG[2]],
+        updated,
+        [holding(3, 360, 0, 3, 3)],
+        [LOG[0], updated[0], LOG[2]],
+    )
+    holdings.apply_transactions(db, [2], sign=-1)
+    holdings.apply_transactions(db, [2])
+
+    removed, restored = db.written
+    assert (removed["quantity"], removed["cost_basis"], removed["realized_pnl"]) == (3, 360, 0)
+    # Giao dịch sửa cũ hơn vị thế đã lưu: phát lại cả cặp thay vì cộng tiếp
+    assert (restored["quantity"], restored["cost_basis"], restored["realized_pnl"]) == (2, 260, 50)
+    assert restored["last_transaction_id"] == 3 and db.reads == []
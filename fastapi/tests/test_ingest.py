@@ -0,0 +1,91 @@
+# tests/test_ingest.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import ingest
+
+
+def test_detect_format_from_content_type():
+    assert ingest.detect_format("text/csv; charset=utf-8") == "csv"
+    assert ingest.detect_format("application/x-ndjson") == "ndjson"
+    assert ingest.detect_format(None) == "json"
+    assert ingest.detect_format("text/plain", fmt="ndjson") == "ndjson"
+    with pytest.raises(HTTPException):
+        ingest.detect_format("text/plain")
+
+
+def test_validate_record_uses_asset_from_url():
+    row = ingest.validate_record(
+        {"date": "2024-01-01T00:00:00Z", "open_price": "1.5", "close_price": 2},
+        asset_id=7,
+    )
+    assert row["asset_id"] == 7
+    assert row["open_price"] == 1.5
+    assert row["date"].tzinfo is None
+
+
+def test_validate_record_rejects_invalid_rows():
+    with pytest.raises(ValueError):
+        ingest.validate_record({"date": "2024-01-01", "asset_id": 2}, asset_id=1)
+    with pytest.raises(ValueError):
+        ingest.validate_record({"date": "2024-01-01"})
+    with pytest.raises(ValueError):
+        ingest.validate_record(
+            {"date": "2024-01-01", "high_price": 1, "low_price": 2}, asset_id=1
+        )
+    with pytest.raises(ValueError):
+        ingest.validate_record({"date": "2024-01-01", "open_price": 1e12}, asset_id=1)
+
+
+def test_validate_transaction_record():
+    row = ingest.validate_transaction_record(
+        {
+            "symbol": "btc",
+            "transaction_type": "SELL",
+            "quantity": "0.5",
+            "price": "120",
+            "transaction_date": "2024-01-03T07:00:00+07:00",
+            "external_id": "t3",
+        }
+    )
+    assert row["quantity"] == 0.5
+    assert row["transaction_date"].isoformat() == "2024-01-03T00:00:00"
+
+    with pytest.raises(ValueError):
+        ingest.validate_transaction_record({"transaction_type": "BUY", "quantity": 1, "price": 1})
+    with pytest.raises(ValueError):
+        ingest.validate_transaction_record(
+            {"asset_id": 1, "transaction_type": "HOLD", "quantity": 1, "price": 1}
+        )
+    with pytest.raises(ValueError):
+        ingest.validate_transaction_record(
+            {"asset_id": 1, "transaction_type": "BUY", "quantity": -1, "price": 1}
+        )
+
+
+def test_csv_records_may_span_lines_inside_quoted_fields():
+    lines = [
+        "trade_id,side,qty,note",
+        't1,BUY,1,"first line',
+        "",
+        'second line, with ""quotes"""',
+        "t2,SELL,2,plain",
+        't3,BUY,3,5" screen',
+        't4,BUY,4,"never closed',
+    ]
+
+    async def source():
+        for line in lines:
+            yield line
+
+    async def collect():
+        return [item async for item in ingest.iter_line_records(source(), "csv", ingest.TRANSACTION_CSV_ALIASES)]
+
+    records = asyncio.run(collect())
+    assert [line for line, _ in records] == [2, 5, 6, 7]
+    assert records[0][1]["note"] == 'first line\n\nsecond line, with "quotes"'
+    assert records[1][1]["note"] == "plain"
+    assert records[2][1]["note"] == '5" screen'
+    assert isinstance(records[3][1], ValueError)
@@ -0,0 +1,109 @@
+# tests/test_live_valuation.py
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import holdings, live_valuation, realtime, valuation
+
+
+def make_loader(positions, calls):
+    """Nạp định giá giả: `positions` = {portfolio_id: [(asset_id, khối lượng, giá vốn, giá cuối)]}."""
+
+    async def load(portfolio_id, method):
+        calls.append((portfolio_id, method))
+        return valuation.summarize(
+            portfolio_id,
+            method,
+            [
+                valuation._holding(asset_id, f"A{asset_id}", quantity, cost, 0, price, datetime(2025, 5, 20, 8, 0))
+                for asset_id, quantity, cost, price in positions[portfolio_id]
+            ],
+        )
+
+    return load
+
+
+def candle(asset_id, minute, price):
+    return {"asset_id": asset_id, "date": f"2025-05-20T08:{minute:02d}:00", "close_price": price}
+
+
+def messages(subscriber):
+    return [json.loads(message) for message in subscriber.queue]
+
+
+def test_tick_burst_revalues_only_affected_portfolios_once():
+    positions = {1: [(10, 2, 100, 60.0)], 2: [(20, 1, 50, 40.0)]}
+    calls = []
+
+    async def scenario():
+        hub = live_valuation.ValuationHub(load=make_loader(positions, calls), debounce=0.01)
+        first, second = hub.open("websocket"), hub.open("sse")
+        hub.subscribe(first, [(1, "average")])
+        hub.subscribe(second, [(2, "average")])
+        await asyncio.sleep(0.05)
+        assert hub._by_asset == {10: {(1, "average")}, 20: {(2, "average")}}
+        first.queue.clear()
+        second.queue.clear()
+
+        for minute, price in ((1, 61.0), (2, 62.0), (3, 65.0)):
+            hub.on_candle(candle(10, minute, price))
+        hub.on_candle(candle(30, 1, 1.0))  # Không danh mục nào giữ asset 30
+        hub.on_candle(candle(10, 0, 1.0))  # Sửa nến cũ hơn giá cuối: bỏ qua
+        await asyncio.sleep(0.05)
+        return hub, first, second
+
+    hub, first, second = asyncio.run(scenario())
+    [event] = messages(first)
+    assert event["type"] == "valuation" and event["portfolio_id"] == 1
+    assert event["total_market_value"] == 130.0 and event["total_unrealized_pnl"] == 30.0
+    assert event["holdings"][0]["last_price_date"] == "2025-05-20T08:03:00"
+    assert not second.queue
+    assert sorted(calls) == [(1, "average"), (2, "average")]  # Nến không truy vấn lại DB
+
+    hub.close(first)
+    assert hub._by_asset == {20: {(2, "average")}} and (1, "average") not in hub._tracked
+
+
+def test_holdings_change_reloads_and_new_subscriber_gets_current_value():
+    positions = {1: [(10, 2, 100, 60.0)]}
+    calls = []
+
+    async def scenario():
+        hub = live_valuation.ValuationHub(load=make_loader(positions, calls), debounce=0.01)
+        first = hub.open("websocket")
+        hub.subscribe(first, [(1, "fifo")])
+        await asyncio.sleep(0.05)
+
+        positions[1] = [(10, 2, 100, 60.0), (11, 4, 40, 20.0)]
+        hub.on_holdings_changed(1)
+        hub.on_holdings_changed(99)  # Không ai theo dõi
+        await asyncio.sleep(0.05)
+
+        late = hub.open("sse")
+        hub.subscribe(late, [(1, "fifo")])
+        return hub, first, late
+
+    hub, first, late = asyncio.run(scenario())
+    assert calls == [(1, "fifo"), (1, "fifo")]
+    assert [event["total_market_value"] for event in messages(first)] == [120.0, 200.0]
+    assert messages(late) == messages(first)[-1:]
+    assert hub._by_asset.keys() == {10, 11}
+
+
+def test_parse_portfolio_ids():
+    feed = live_valuation.portfolios
+    assert feed.parse("3, 1,3") == [3, 1]
+    assert feed.parse([2]) == [2]
+    for raw in ("1,x", [True], [1.5]):
+        with pytest.raises(ValueError):
+            feed.parse(raw)
+
+
+def test_holdings_notify_statement_sends_each_portfolio_once():
+    compiled = holdings.notify_statement([2, 1, 2]).compile(dialect=postgresql.dialect())
+    assert holdings.NOTIFY_CHANNEL in compiled.params.values()
+    assert sorted(value for value in compiled.params.values() if isinstance(value, int)) == [1, 2]
+    assert realtime.parse_values("", "portfolio_ids", 1, int) == []
@@ -0,0 +1,31 @@
+# tests/test_metrics.py
+from app import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram(
+        "test_wait_seconds", "Thời gian chờ", labelnames=("pool",), buckets=(0.1, 1)
+    )
+    histogram.observe(0.05, pool="primary")
+    histogram.observe(0.5, pool="primary")
+    histogram.observe(5, pool="primary")
+
+    lines = metrics.render().splitlines()
+
+    assert '# TYPE test_wait_seconds histogram' in lines
+    assert 'test_wait_seconds_bucket{pool="primary",le="0.1"} 1.0' in lines
+    assert 'test_wait_seconds_bucket{pool="primary",le="1.0"} 2.0' in lines
+    assert 'test_wait_seconds_bucket{pool="primary",le="+Inf"} 3.0' in lines
+    assert 'test_wait_seconds_count{pool="primary"} 3.0' in lines
+    assert 'test_wait_seconds_sum{pool="primary"} 5.55' in lines
+
+
+def test_gauge_collect_is_evaluated_at_render_time():
+    state = {"value": 1}
+    metrics.Gauge(
+        "test_in_use", "Đang dùng", labelnames=("pool",),
+        collect=lambda: [({"pool": "replica-0"}, state["value"])],
+    )
+    state["value"] = 3
+
+    assert 'test_in_use{pool="replica-0"} 3.0' in metrics.render().splitlines()
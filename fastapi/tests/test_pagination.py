@@ -0,0 +1,45 @@
+# tests/test_pagination.py
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app import crud, model, pagination
+
+
+def test_cursor_round_trip_with_datetime_and_id():
+    cursor = pagination.encode_cursor(datetime(2024, 3, 1, 12, 30), 42)
+
+    assert pagination.decode_cursor(cursor, datetime, int) == (datetime(2024, 3, 1, 12, 30), 42)
+
+
+def test_decode_cursor_rejects_wrong_shape():
+    cursor = pagination.encode_cursor(42)
+
+    with pytest.raises(HTTPException) as error:
+        pagination.decode_cursor(cursor, datetime, int)
+    assert error.value.status_code == 400
+
+
+def test_split_page_returns_cursor_of_last_row_only_when_more_rows_exist():
+    rows = [{"id": value} for value in (9, 8, 7)]
+
+    page, next_cursor = pagination.split_page(rows, 2, lambda row: (row["id"],))
+    assert [row["id"] for row in page] == [9, 8]
+    assert pagination.decode_cursor(next_cursor, int) == (8,)
+
+    page, next_cursor = pagination.split_page(rows, 3, lambda row: (row["id"],))
+    assert len(page) == 3 and next_cursor is None
+
+
+def test_keyset_compares_row_values_in_sort_direction():
+    stmt = pagination.keyset(
+        select(model.Transaction), crud.TRANSACTION_SORT, (datetime(2024, 1, 1), 5), descending=True
+    )
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+
+    assert "(transaction.transaction_date, transaction.id) < (" in sql
+    assert "ORDER BY transaction.transaction_date DESC, transaction.id DESC" in sql
+    assert "OFFSET" not in sql
@@ -0,0 +1,60 @@
+# tests/test_partitions.py
+from datetime import datetime
+
+from app import partitions
+
+
+class FakeEngine:
+    """Engine giả: chỉ cần tên dialect và một kết nối dùng làm context manager."""
+
+    def __init__(self, dialect="postgresql"):
+        self.dialect = type("Dialect", (), {"name": dialect})()
+        self.connections = 0
+
+    def connect(self):
+        self.connections += 1
+        return self
+
+    def execution_options(self, **options):
+        assert options == {"isolation_level": "AUTOCOMMIT"}
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_month_windows_and_partition_names():
+    assert partitions.month_start(datetime(2024, 2, 29, 23, 59)) == datetime(2024, 2, 1)
+    assert partitions.next_month(datetime(2024, 1, 1)) == datetime(2024, 2, 1)
+    assert partitions.next_month(datetime(2024, 12, 1)) == datetime(2025, 1, 1)
+    assert partitions.partition_name(datetime(2024, 1, 1)) == "price_history_y2024m01"
+    assert partitions.partition_name(datetime(2024, 11, 1)) == "price_history_y2024m11"
+
+
+def test_creates_each_missing_month_once(monkeypatch):
+    created = []
+    monkeypatch.setattr(partitions, "_known_partitions", set())
+    monkeypatch.setattr(partitions, "_create_partition", lambda connection, month: created.append(month))
+    engine = FakeEngine()
+
+    dates = [datetime(2024, 3, 31, 23), None, datetime(2024, 1, 15), datetime(2024, 3, 1)]
+    partitions.ensure_price_history_partitions(engine, dates)
+    assert created == [datetime(2024, 1, 1), datetime(2024, 3, 1)]
+
+    # Tháng đã biết không chạm tới catalog nữa
+    partitions.ensure_price_history_partitions(engine, [datetime(2024, 1, 2), datetime(2024, 4, 10)])
+    assert created[2:] == [datetime(2024, 4, 1)]
+    partitions.ensure_price_history_partitions(engine, [datetime(2024, 3, 5)])
+    assert engine.connections == 2
+
+
+def test_other_dialects_are_not_partitioned(monkeypatch):
+    created = []
+    monkeypatch.setattr(partitions, "_known_partitions", set())
+    monkeypatch.setattr(partitions, "_create_partition", lambda connection, month: created.append(month))
+    engine = FakeEngine("sqlite")
+    partitions.ensure_price_history_partitions(engine, [datetime(2024, 1, 1)])
+    assert created == [] and engine.connections == 0
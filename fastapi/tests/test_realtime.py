@@ -0,0 +1,216 @@
+# tests/test_realtime.py
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import auth, config, realtime, tokens
+
+
+def test_hub_fans_out_one_encoded_message_and_cleans_up_topics():
+    hub = realtime.PriceHub()
+    first, second, other = hub.open("websocket"), hub.open("sse"), hub.open("websocket")
+    hub.subscribe(first, {1: "BTC"})
+    hub.subscribe(second, {1: "BTC", 2: "ETH"})
+    hub.subscribe(other, {2: "ETH"})
+
+    assert hub.publish({"asset_id": 1, "date": "2025-05-20T08:30:00", "close_price": 2.0}) == 2
+    assert first.queue[0] is second.queue[0]  # Mã hóa một lần cho mọi subscriber
+    assert json.loads(first.queue[0]) == {
+        "type": "candle", "symbol": "BTC", "asset_id": 1, "date": "2025-05-20T08:30:00", "close_price": 2.0
+    }
+    assert not other.queue
+    assert hub.counts() == {"websocket": 2, "sse": 1}
+
+    hub.close(second)
+    hub.unsubscribe(other, [2])
+    assert hub.publish({"asset_id": 2, "date": "2025-05-20T08:30:00"}) == 0
+    assert hub._topics.keys() == {1} and hub._symbols == {1: "BTC"}
+
+
+def test_slow_subscriber_drops_oldest_and_reports_lag():
+    subscriber = realtime.Subscriber("websocket", maxsize=3)
+    for index in range(5):
+        subscriber.push(str(index))
+
+    messages = asyncio.run(subscriber.drain())
+    assert json.loads(messages[0]) == {"type": "lagged", "dropped": 2}
+    assert messages[1:] == ["2", "3", "4"]
+    assert subscriber.dropped == 0 and not subscriber.queue
+    # Hết tin: chờ tối đa timeout rồi trả danh sách rỗng (SSE gửi heartbeat)
+    assert asyncio.run(subscriber.drain(0.01)) == []
+
+
+def test_notify_statement_sends_latest_candle_per_asset():
+    columns = ("asset_id", "date", "close_price")
+    rows = [
+        {"asset_id": 1, "date": datetime(2025, 5, 20, 8, 31), "close_price": 3},
+        {"asset_id": 1, "date": datetime(2025, 5, 20, 8, 30), "close_price": 2},
+        {"asset_id": 2, "date": datetime(2025, 5, 20, 8, 30), "close_price": 5},
+    ]
+    compiled = realtime.notify_statement(rows, columns).compile(dialect=postgresql.dialect())
+    payloads = sorted(
+        (json.loads(value) for value in compiled.params.values() if isinstance(value, str) and value.startswith("{")),
+        key=lambda payload: payload["asset_id"],
+    )
+    assert payloads == [
+        {"asset_id": 1, "date": "2025-05-20T08:31:00", "close_price": 3},
+        {"asset_id": 2, "date": "2025-05-20T08:30:00", "close_price": 5},
+    ]
+    assert "pg_notify" in str(compiled)
+
+
+def test_parse_symbols():
+    assert realtime.parse_symbols(" BTC,ETH,,BTC ") == ["BTC", "ETH"]
+    assert realtime.parse_symbols(["SOL"]) == ["SOL"]
+    with pytest.raises(ValueError):
+        realtime.parse_symbols([1])
+    with pytest.raises(ValueError):
+        realtime.parse_symbols(",".join(f"S{index}" for index in range(config.REALTIME_MAX_SYMBOLS + 1)))
+
+
+class StaticFeed:
+    """Feed giả: một subscriber, đăng ký không làm gì."""
+
+    def __init__(self):
+        self.closed = []
+
+    def open(self, transport):
+        self.subscriber = realtime.Subscriber(transport)
+        return self.subscriber
+
+    def close(self, subscriber):
+        self.closed.append(subscriber)
+
+    async def subscribe(self, principal, subscriber, values, options):
+        return {"type": "subscribed"}
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+
+def credentials(jti="jti-1", expires_in=60.0):
+    principal = auth.Principal(id=1, username="alice", email="a@example.com", is_active=True, version=1)
+    return realtime.Credentials(principal, jti, time.time() + expires_in)
+
+
+def test_credentials_expire_and_follow_revocations():
+    current = credentials()
+    assert current.valid() and 0 < current.next_check(1.0) <= 1.0
+    tokens._revoked["jti-1"] = datetime(2100, 1, 1)
+    try:
+        assert not current.valid()
+    finally:
+        tokens._revoked.pop("jti-1")
+    expired = credentials(expires_in=-1)
+    assert not expired.valid() and expired.next_check() == 0.0
+    # Token không có `exp`: chỉ kiểm tra thu hồi theo chu kỳ
+    assert realtime.Credentials(current.principal).next_check(2.0) == 2.0
+
+
+def test_websocket_closes_with_policy_violation_when_token_expires():
+    websocket, subscriber = FakeWebSocket(), realtime.Subscriber("websocket")
+    subscriber.push("first")
+
+    async def run():
+        return await realtime._write_messages(websocket, subscriber, credentials(expires_in=0.05))
+
+    started = time.monotonic()
+    assert asyncio.run(run()) == 1008
+    assert websocket.sent == ["first"]
+    assert time.monotonic() - started < 1  # Ngắt đúng lúc `exp`, không chờ hết chu kỳ kiểm tra
+
+
+def test_sse_stream_ends_when_token_is_revoked(monkeypatch):
+    monkeypatch.setattr(config, "REALTIME_AUTH_CHECK_SECONDS", 0.01)
+    feed = StaticFeed()
+
+    async def run():
+        events = []
+        stream = realtime._sse_events(feed, credentials("jti-2"), [], {})
+        events.append(await stream.__anext__())
+        feed.subscriber.push("tick")
+        events.append(await stream.__anext__())
+        tokens._revoked["jti-2"] = datetime(2100, 1, 1)
+        events.extend([event async for event in stream])
+        return events
+
+    try:
+        events = asyncio.run(run())
+    finally:
+        tokens._revoked.pop("jti-2", None)
+    assert events[1] == b"data: tick\n\n"
+    assert json.loads(events[-1].decode()[len("data: "):]) == {"type": "error", "detail": "Token expired or revoked"}
+    assert feed.closed == [feed.subscriber]
+
+
+def test_sse_subscribes_with_values_given_by_endpoint(monkeypatch):
+    class RecordingFeed(StaticFeed):
+        param = "symbols"
+
+        def parse(self, raw):
+            return [value for value in raw.split(",") if value]
+
+        async def subscribe(self, principal, subscriber, values, options):
+            self.subscribed = (values, options)
+            return {"type": "subscribed"}
+
+    async def authenticate(connection):
+        return credentials()
+
+    class Request:
+        query_params = {"symbols": "ETH"}
+
+    monkeypatch.setattr(realtime, "authenticate", authenticate)
+    feed = RecordingFeed()
+
+    async def first_event():
+        response = await realtime.sse_response(Request(), feed, "BTC,SOL", {"method": "fifo"})
+        events = response.body_iterator
+        try:
+            return await events.__anext__()
+        finally:
+            await events.aclose()
+
+    asyncio.run(first_event())
+    # Dùng giá trị endpoint đã kiểm tra, không đọc lại query
+    assert feed.subscribed == (["BTC", "SOL"], {"method": "fifo"})
+
+
+def test_websocket_subscribes_with_options_given_by_endpoint(monkeypatch):
+    class RecordingFeed(StaticFeed):
+        param = "portfolio_ids"
+
+        def parse(self, raw):
+            return [int(value) for value in raw.split(",") if value]
+
+        async def subscribe(self, principal, subscriber, values, options):
+            self.subscribed = (values, options)
+            return {"type": "subscribed"}
+
+    class ClosingWebSocket(FakeWebSocket):
+        query_params = {"portfolio_ids": "1,2", "method": "average"}
+
+        async def accept(self):
+            pass
+
+        async def iter_text(self):
+            return
+            yield
+
+    async def authenticate(connection):
+        return credentials()
+
+    monkeypatch.setattr(realtime, "authenticate", authenticate)
+    feed = RecordingFeed()
+    asyncio.run(realtime.serve_websocket(ClosingWebSocket(), feed, {"method": "fifo"}))
+    assert feed.subscribed == ([1, 2], {"method": "fifo"})
+    assert feed.closed == [feed.subscriber]
@@ -0,0 +1,80 @@
+# tests/test_response_cache.py
+import asyncio
+from datetime import datetime
+
+from fastapi.responses import Response, StreamingResponse
+
+from app import cache, response_cache, timeseries
+
+
+def test_shared_backend_invalidation_reaches_other_workers():
+    async def run():
+        shared = cache.MemoryCache()
+        worker_a = response_cache.ResponseCache(16, 60, shared=shared)
+        worker_b = response_cache.ResponseCache(16, 60, shared=shared)
+        params, tags = {"limit": 10}, ["assets"]
+
+        key, cached = await worker_a.lookup("read_assets", params, tags)
+        assert cached is None
+        await worker_a.store(key, Response(b"[1]", media_type="application/json", headers={"X-Next-Cursor": "c"}))
+
+        # Worker khác đọc được từ backend dùng chung, kèm header đã lưu
+        _, cached = await worker_b.lookup("read_assets", params, tags)
+        assert cached.body == b"[1]" and cached.headers["x-next-cursor"] == "c"
+        assert cached.headers["x-cache"] == "HIT"
+
+        # Ghi ở worker A vô hiệu hóa cả bản sao trong LRU của worker B
+        await worker_a.invalidate("assets")
+        _, cached = await worker_b.lookup("read_assets", params, tags)
+        assert cached is None
+
+    asyncio.run(run())
+
+
+def test_without_shared_backend_immutable_entries_expire_after_ttl():
+    async def run():
+        worker_a = response_cache.ResponseCache(16, 0.05)
+        worker_b = response_cache.ResponseCache(16, 0.05)
+        params, tags = {"end": "2024-01-01"}, ["prices", "prices:1"]
+        for worker in (worker_a, worker_b):
+            key, _ = await worker.lookup("read_price_history", params, tags)
+            await worker.store(key, Response(b"[old]", media_type="application/json"), immutable=True)
+
+        # Thế hệ tag chỉ có trong tiến trình: worker B không thấy lần vô hiệu hóa của A,
+        # nhưng nến đã đóng vẫn chỉ được giữ tối đa `ttl` giây
+        await worker_a.invalidate("prices:1")
+        _, cached = await worker_b.lookup("read_price_history", params, tags)
+        assert cached.body == b"[old]"
+        await asyncio.sleep(0.06)
+        _, cached = await worker_b.lookup("read_price_history", params, tags)
+        assert cached is None
+
+    asyncio.run(run())
+
+
+def test_stream_is_cached_only_when_within_max_body():
+    async def body(*chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        responses = response_cache.ResponseCache(16, 60, max_body=4)
+        for name, chunks, expected in (("small", (b"[", b"]"), b"[]"), ("large", (b"[1,", b"2]"), None)):
+            key, _ = await responses.lookup(name, {}, ["prices"])
+            streamed = responses.store_stream(
+                key, StreamingResponse(body(*chunks), media_type="application/json")
+            )
+            assert b"".join([chunk async for chunk in streamed.body_iterator]) == b"".join(chunks)
+            _, cached = await responses.lookup(name, {}, ["prices"])
+            assert (cached.body if cached else None) == expected
+
+    asyncio.run(run())
+
+
+def test_closed_range_depends_on_interval_length():
+    now = datetime(2024, 1, 10, 12, 0)
+
+    assert not timeseries.is_closed_range(None, now=now)
+    assert timeseries.is_closed_range(datetime(2024, 1, 10, 11, 58), now=now)
+    assert not timeseries.is_closed_range(datetime(2024, 1, 10, 0, 0), "1d", now=now)
+    assert timeseries.is_closed_range(datetime(2024, 1, 9, 0, 0), "1d", now=now)
@@ -0,0 +1,80 @@
+# tests/test_rollups.py
+from datetime import datetime
+
+from sqlalchemy import Delete, Insert
+
+from app import rollups, timeseries
+
+
+class RecordingSession:
+    """Session giả: ghi lại các câu lệnh được chạy."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        self.statements.append(stmt)
+
+
+def windows(db):
+    """(resolution, đầu, cuối) của các lệnh xóa rồi tính lại rollup."""
+    result = []
+    for stmt in db.statements:
+        if isinstance(stmt, Delete):
+            params = stmt.compile().params
+            result.append((params["resolution_1"], params["bucket_1"], params["bucket_2"]))
+    return result
+
+
+def test_bucket_floor_aligns_hours_days_and_monday_weeks():
+    value = datetime(2025, 5, 21, 13, 45, 10)
+    assert timeseries.bucket_floor(value, "1h") == datetime(2025, 5, 21, 13)
+    assert timeseries.bucket_floor(value, "1d") == datetime(2025, 5, 21)
+    assert timeseries.bucket_floor(value, "1w") == datetime(2025, 5, 19)  # thứ Hai
+    assert timeseries.bucket_floor(datetime(2025, 5, 19), "1w") == datetime(2025, 5, 19)
+    # Trước mốc 2000-01-03 vẫn làm tròn xuống, không về phía mốc
+    assert timeseries.bucket_floor(datetime(1999, 12, 31, 12), "1w") == datetime(1999, 12, 27)
+
+
+def test_refresh_covers_every_bucket_touching_the_range():
+    db = RecordingSession()
+    rollups.refresh_rollups(db, 7, datetime(2025, 5, 20, 8, 30), datetime(2025, 5, 21, 1, 0))
+
+    assert windows(db) == [
+        ("1h", datetime(2025, 5, 20, 8), datetime(2025, 5, 21, 2)),
+        ("1d", datetime(2025, 5, 20), datetime(2025, 5, 22)),
+        ("1w", datetime(2025, 5, 19), datetime(2025, 5, 26)),
+    ]
+    # Khóa advisory trước, rồi mỗi mức: xóa khung rồi tính lại, mức thô trước mức gộp từ nó
+    kinds = [isinstance(stmt, Delete) for stmt in db.statements[1:]]
+    assert kinds == [True, False] * len(rollups.RESOLUTIONS)
+    assert all(isinstance(stmt, Insert) for stmt in db.statements[2::2])
+    assert "pg_advisory_xact_lock" in str(db.statements[0])
+
+
+def test_single_candle_refreshes_one_bucket_per_resolution():
+    db = RecordingSession()
+    candle = datetime(2025, 5, 25, 23, 59)  # phút cuối của tuần
+    rollups.refresh_rollups(db, 7, candle, candle)
+    assert windows(db) == [
+        ("1h", datetime(2025, 5, 25, 23), datetime(2025, 5, 26)),
+        ("1d", datetime(2025, 5, 25), datetime(2025, 5, 26)),
+        ("1w", datetime(2025, 5, 19), datetime(2025, 5, 26)),
+    ]
+
+
+def test_rows_are_grouped_per_asset_and_locked_in_asset_order(monkeypatch):
+    calls = []
+    monkeypatch.setattr(rollups, "refresh_rollups", lambda db, asset_id, start, end: calls.append((asset_id, start, end)))
+    rows = [
+        {"asset_id": 9, "date": datetime(2025, 5, 21)},
+        {"asset_id": 2, "date": datetime(2025, 5, 20, 10)},
+        {"asset_id": 9, "date": datetime(2025, 5, 18)},
+        {"asset_id": 2, "date": datetime(2025, 5, 20, 9)},
+        {"asset_id": 9, "date": datetime(2025, 5, 19)},
+    ]
+    rollups.refresh_rollups_for_rows(None, rows)
+    assert calls == [
+        (2, datetime(2025, 5, 20, 9), datetime(2025, 5, 20, 10)),
+        (9, datetime(2025, 5, 18), datetime(2025, 5, 21)),
+    ]
@@ -0,0 +1,39 @@
+# tests/test_serializers.py
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi import Response
+
+from app import model, serializers
+from app.schemas import TransactionResponse, UserResponse
+
+
+def test_encoder_matches_response_model_output():
+    transaction = model.Transaction(
+        id=7,
+        portfolio_id=1,
+        asset_id=2,
+        quantity=Decimal("0.12345678"),
+        price=Decimal("42123.45678900"),
+        transaction_type="mua",
+        transaction_date=datetime(2024, 1, 2, 3, 4, 5, 600),
+        external_id=None,
+    )
+    user = model.User(id=1, username="alice", email="alice@x.com", is_active=1)
+
+    response = serializers.list_response([transaction], TransactionResponse)
+    expected = TransactionResponse.model_validate(transaction, from_attributes=True)
+
+    assert json.loads(response.body) == [json.loads(expected.model_dump_json())]
+    assert serializers.encoder(UserResponse)(user)["is_active"] is True
+
+
+def test_list_response_copies_endpoint_headers():
+    endpoint_response = Response()
+    endpoint_response.headers["X-Next-Cursor"] = "abc"
+
+    response = serializers.list_response([], UserResponse, endpoint_response)
+
+    assert response.body == b"[]"
+    assert response.headers["x-next-cursor"] == "abc"
@@ -0,0 +1,49 @@
+# tests/test_streaming.py
+import asyncio
+import gzip
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from app import streaming
+
+COLUMNS = ("asset_id", "date", "close_price", "volume")
+ROWS = [
+    (1, datetime(2024, 1, 1), Decimal("42000.12345678"), None),
+    (1, datetime(2024, 1, 2), Decimal("43000.5"), Decimal("12")),
+    (1, datetime(2024, 1, 3), Decimal("41000"), Decimal("7.25")),
+]
+
+
+def collect(chunks):
+    async def run():
+        return [chunk async for chunk in chunks]
+
+    return asyncio.run(run())
+
+
+def test_ndjson_stream_emits_one_object_per_line_in_batches():
+    chunks = collect(streaming.ndjson_stream(ROWS, COLUMNS, chunk_rows=2))
+
+    assert len(chunks) == 2
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line)["close_price"] for line in lines] == [42000.12345678, 43000.5, 41000.0]
+    assert json.loads(lines[0])["date"] == "2024-01-01T00:00:00"
+
+
+def test_csv_stream_keeps_decimal_text_and_blank_nulls():
+    body = b"".join(collect(streaming.csv_stream(ROWS, COLUMNS, chunk_rows=2))).decode()
+
+    assert body.splitlines() == [
+        "asset_id,date,close_price,volume",
+        "1,2024-01-01T00:00:00,42000.12345678,",
+        "1,2024-01-02T00:00:00,43000.5,12",
+        "1,2024-01-03T00:00:00,41000,7.25",
+    ]
+
+
+def test_gzip_stream_round_trips():
+    plain = b"".join(collect(streaming.csv_stream(ROWS, COLUMNS)))
+    compressed = b"".join(collect(streaming.gzip_stream(streaming.csv_stream(ROWS, COLUMNS))))
+
+    assert gzip.decompress(compressed) == plain
@@ -0,0 +1,50 @@
+# tests/test_timeseries.py
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy.dialects import postgresql
+
+from app import config, rollups, timeseries
+
+
+def test_lttb_keeps_endpoints_and_point_count():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50.0)
+    indices = timeseries.lttb_indices(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_preserves_spikes():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[250] = 100.0
+    assert 250 in timeseries.lttb_indices(x, y, 20)
+
+
+def test_lttb_returns_everything_when_under_threshold():
+    x = np.arange(10, dtype=float)
+    assert list(timeseries.lttb_indices(x, x, 50)) == list(range(10))
+
+
+def compiled_sql(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_downsample_select_bounds_rows_and_reads_coarsest_rollup():
+    start = datetime(2020, 1, 1)
+    # 5 năm nến thô, 1000 điểm: khung gộp ~11 giờ, đọc từ rollup giờ và làm tròn lên bội số giờ
+    sql = compiled_sql(rollups.downsample_select(1, start, start + timedelta(days=5 * 365), 1000))
+    stride = math.ceil(5 * 365 * 86400 / (1000 * config.PRICE_HISTORY_DOWNSAMPLE_FACTOR) / 3600) * 3600
+    assert f"interval '{stride} seconds'" in sql
+    assert "price_rollup" in sql and "resolution = '1h'" in sql and "price_history" not in sql
+
+    # Khoảng ngắn: đọc nến thô, khung không nhỏ hơn một phút
+    sql = compiled_sql(rollups.downsample_select(1, start, start + timedelta(hours=2), 1000))
+    assert "interval '60 seconds'" in sql and "price_rollup" not in sql
+
+    # interval tuần: không đọc nguồn mịn hơn interval yêu cầu
+    sql = compiled_sql(rollups.downsample_select(1, start, start + timedelta(days=30), 1000, "1w"))
+    assert "resolution = '1w'" in sql and "interval '604800 seconds'" in sql
@@ -0,0 +1,123 @@
+# tests/test_tokens.py
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from app import model, tokens
+
+Claimed = namedtuple("Claimed", "user_id family_id expires_at")
+Family = namedtuple("Family", "family_id")
+Revoked = namedtuple("Revoked", "jti expires_at")
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+    def all(self):
+        return self.rows
+
+
+class StubSession:
+    """AsyncSession giả: trả lần lượt các kết quả đã định, ghi lại câu lệnh (dạng SQL) và số lần commit."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.statements = []
+        self.added = []
+        self.commits = 0
+
+    async def execute(self, stmt):
+        self.statements.append(str(stmt.compile(dialect=postgresql.dialect())))
+        return Result(self.results.pop(0) if self.results else [])
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        self.commits += 1
+
+
+def future(**delta):
+    return tokens._utcnow() + timedelta(**delta)
+
+
+def test_rotation_claims_token_once_and_keeps_family():
+    db = StubSession([Claimed(7, "family-1", future(days=1))])
+    user_id, new_token = asyncio.run(tokens.rotate_refresh_token(db, "old-token"))
+
+    assert user_id == 7
+    [claim] = db.statements
+    assert claim.startswith("UPDATE refresh_token") and "revoked_at IS NULL" in claim and "RETURNING" in claim
+    [issued] = db.added
+    assert isinstance(issued, model.RefreshToken)
+    assert (issued.user_id, issued.family_id) == (7, "family-1")
+    assert issued.token_hash == tokens.hash_token(new_token) != tokens.hash_token("old-token")
+
+
+def test_reused_refresh_token_revokes_whole_family():
+    # UPDATE không nhận được dòng (token đã bị thu hồi), token vẫn tồn tại trong họ "family-1"
+    db = StubSession([], [Family("family-1")])
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(tokens.rotate_refresh_token(db, "stolen-token"))
+
+    assert error.value.status_code == 401
+    revoke = db.statements[-1]
+    assert revoke.startswith("UPDATE refresh_token") and "family_id" in revoke and "revoked_at IS NULL" in revoke
+    assert db.commits == 1 and not db.added
+
+
+def test_unknown_or_expired_refresh_token_is_rejected_without_new_token():
+    db = StubSession([], [])
+    with pytest.raises(HTTPException):
+        asyncio.run(tokens.rotate_refresh_token(db, "unknown"))
+    assert len(db.statements) == 2 and db.commits == 0
+
+    db = StubSession([Claimed(7, "family-1", future(seconds=-1))])
+    with pytest.raises(HTTPException):
+        asyncio.run(tokens.rotate_refresh_token(db, "expired"))
+    assert db.commits == 1 and not db.added  # Token hết hạn vẫn bị đánh dấu đã dùng
+
+
+def test_logout_revokes_access_token_immediately(monkeypatch):
+    monkeypatch.setattr(tokens, "_revoked", {})
+    db = StubSession()
+    asyncio.run(tokens.revoke_access_token(db, "jti-1", future(minutes=5)))
+
+    assert tokens.is_revoked("jti-1") and not tokens.is_revoked("jti-2") and not tokens.is_revoked(None)
+    [insert] = db.statements
+    assert insert.startswith("INSERT INTO revoked_token") and "ON CONFLICT (jti) DO NOTHING" in insert
+    assert db.commits == 1
+
+
+def test_sync_reloads_every_unexpired_revocation_and_drops_expired(monkeypatch):
+    monkeypatch.setattr(tokens, "_revoked", {"expired": future(seconds=-1), "local": future(minutes=5)})
+    # jti ghi bởi worker khác; nạp lại toàn bộ nên không phụ thuộc thứ tự commit
+    db = StubSession([Revoked("other-worker", future(minutes=3))])
+    assert asyncio.run(tokens.sync_revocations(db)) == 1
+
+    assert tokens._revoked.keys() == {"local", "other-worker"}
+    [query] = db.statements
+    assert "revoked_token.expires_at >" in query and "revoked_token.id" not in query
+
+
+def test_purge_expired_deletes_revocations_and_refresh_tokens():
+    db = StubSession()
+    asyncio.run(tokens.purge_expired(db))
+
+    assert [statement.split(" WHERE ")[0] for statement in db.statements] == [
+        "DELETE FROM revoked_token",
+        "DELETE FROM refresh_token",
+    ]
+    assert all("expires_at <=" in statement for statement in db.statements)
+    assert db.commits == 1
@@ -0,0 +1,26 @@
+# tests/test_valuation.py
+import numpy as np
+
+from app import valuation
+
+
+def test_fifo_cost_of_sold_matches_lot_matching():
+    # Asset 0: mua 10@100, mua 10@120, bán 15 -> giá vốn FIFO = 10*100 + 5*120
+    # Asset 1: mua 4@10, bán 1, mua 4@20, bán 5 -> giá vốn FIFO = 4*10 + 2*20
+    asset_index = np.array([0, 0, 0, 1, 1, 1, 1])
+    is_buy = np.array([True, True, False, True, False, True, False])
+    quantity = np.array([10.0, 10.0, 15.0, 4.0, 1.0, 4.0, 5.0])
+    price = np.array([100.0, 120.0, 130.0, 10.0, 12.0, 20.0, 25.0])
+
+    cost = valuation.fifo_cost_of_sold(asset_index, is_buy, quantity, price, 2)
+
+    assert np.allclose(cost, [1600.0, 80.0])
+
+
+def test_fifo_cost_of_sold_without_sells_is_zero():
+    asset_index = np.array([0, 1])
+    is_buy = np.array([True, True])
+    quantity = np.array([1.0, 2.0])
+    price = np.array([5.0, 6.0])
+
+    assert np.allclose(valuation.fifo_cost_of_sold(asset_index, is_buy, quantity, price, 2), 0.0)
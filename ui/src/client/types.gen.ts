@@ -52,7 +52,7 @@ export type PriceHistoryResponse = {
     close_price?: number | null;
     high_price?: number | null;
     low_price?: number | null;
-    id: number;
+    volume?: number | null;
 };
 
 export type TransactionCreate = {
@@ -426,7 +426,15 @@ export type ReadPriceHistoryAssetsAssetIdPriceHistoryGetData = {
     path: {
         asset_id: number;
     };
-    query?: never;
+    query?: {
+        start?: string | null;
+        end?: string | null;
+        limit?: number;
+        cursor?: string | null;
+        order?: 'asc' | 'desc';
+        interval?: '1m' | '5m' | '1h' | '1d' | '1w' | null;
+        max_points?: number | null;
+    };
     url: '/assets/{asset_id}/price-history';
 };
 
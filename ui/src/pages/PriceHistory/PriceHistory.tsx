@@ -36,11 +36,19 @@ const PriceHistory: React.FC = () => {
 
   const fetchPriceHistory = async (assetId: number) => {
     try {
-      const response = await readPriceHistoryAssetsAssetIdPriceHistoryGet({
-        path: { asset_id: assetId },
-        headers: { Authorization: `Bearer ${token}` },
-      });
-      setPriceHistory(response.data || []);
+      // API trả theo trang (X-Next-Cursor): đọc hết các trang để hiển thị toàn bộ lịch sử
+      const entries: PriceHistoryResponse[] = [];
+      let cursor: string | null = null;
+      do {
+        const response = await readPriceHistoryAssetsAssetIdPriceHistoryGet({
+          path: { asset_id: assetId },
+          query: cursor ? { cursor } : undefined,
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        entries.push(...(response.data || []));
+        cursor = response.response?.headers.get("X-Next-Cursor") ?? null;
+      } while (cursor);
+      setPriceHistory(entries);
     } catch (err) {
       setError("Không thể tải lịch sử giá");
     }
@@ -72,7 +80,7 @@ const PriceHistory: React.FC = () => {
       </div>
       <ul className="space-y-2">
         {priceHistory.map((entry) => (
-          <li key={entry.id}>
+          <li key={entry.date}>
             {entry.date}: Open: {entry.open_price}, Close: {entry.close_price}
           </li>
         ))}